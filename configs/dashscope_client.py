@@ -10,8 +10,10 @@
 import os
 import json
 import time
+import hashlib
 import logging
-from typing import Dict, List, Any, Optional, Union
+import threading
+from typing import Dict, Iterator, List, Any, Optional, Union
 from dataclasses import dataclass
 from abc import ABC, abstractmethod
 
@@ -19,6 +21,11 @@ import requests
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 
+try:
+    import diskcache
+except ImportError:  # 未安装 diskcache 时响应缓存只保存在进程内
+    diskcache = None
+
 
 @dataclass
 class DashScopeConfig:
@@ -36,11 +43,18 @@ class DashScopeConfig:
     medical_mode: bool = True
     patient_context: Optional[Dict[str, Any]] = None
     
+    # 响应缓存：None 不缓存，":memory:" 进程内缓存，其余视为 diskcache 目录；
+    # 未显式设置时读取 DASHSCOPE_RESPONSE_CACHE 环境变量
+    response_cache: Optional[str] = None
+    
     def __post_init__(self):
         """初始化后处理"""
         if not self.api_key:
             raise ValueError("DASHSCOPE_API_KEY is required")
         
+        if self.response_cache is None:
+            self.response_cache = os.getenv('DASHSCOPE_RESPONSE_CACHE') or None
+        
         # 设置默认患者上下文（可配置的医疗信息）
         if self.medical_mode and not self.patient_context:
             self.patient_context = {
@@ -52,35 +66,69 @@ class DashScopeConfig:
             }
 
 
+# 进程内响应缓存与已打开的磁盘缓存，按位置在所有客户端间共享
+_MEMORY_RESPONSE_CACHE: Dict[str, str] = {}
+_DISK_RESPONSE_CACHES: Dict[str, Any] = {}
+
+
+def _open_response_cache(location: Optional[str]):
+    """按配置打开响应缓存，返回支持 get / 下标赋值的映射；未启用时返回 None"""
+    if not location:
+        return None
+    if location == ":memory:" or diskcache is None:
+        return _MEMORY_RESPONSE_CACHE
+    if location not in _DISK_RESPONSE_CACHES:
+        _DISK_RESPONSE_CACHES[location] = diskcache.Cache(location)
+    return _DISK_RESPONSE_CACHES[location]
+
+
+# 共享的HTTP会话：同一密钥与重试策略的客户端复用一个连接池，保持长连接
+SESSION_POOL_MAXSIZE = 20
+_SHARED_SESSIONS: Dict[tuple, requests.Session] = {}
+_SHARED_SESSIONS_LOCK = threading.Lock()
+
+
+def _shared_session(config: DashScopeConfig) -> requests.Session:
+    """按 (api_key, max_retries, retry_delay) 取得共享会话，首次使用时创建"""
+    key = (config.api_key, config.max_retries, config.retry_delay)
+    with _SHARED_SESSIONS_LOCK:
+        session = _SHARED_SESSIONS.get(key)
+        if session is None:
+            session = requests.Session()
+            
+            # 配置重试策略
+            retry_strategy = Retry(
+                total=config.max_retries,
+                backoff_factor=config.retry_delay,
+                status_forcelist=[429, 500, 502, 503, 504],
+            )
+            
+            adapter = HTTPAdapter(max_retries=retry_strategy, pool_maxsize=SESSION_POOL_MAXSIZE)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            
+            # 设置默认请求头
+            session.headers.update({
+                "Authorization": f"Bearer {config.api_key}",
+                "Content-Type": "application/json",
+                "User-Agent": "Memory-X-Medical-AI/1.0"
+            })
+            _SHARED_SESSIONS[key] = session
+        return session
+
+
 class BaseDashScopeClient(ABC):
     """百炼API客户端抽象基类"""
     
     def __init__(self, config: DashScopeConfig):
         self.config = config
         self.logger = logging.getLogger(self.__class__.__name__)
+        self._response_cache = _open_response_cache(config.response_cache)
         self._setup_session()
     
     def _setup_session(self):
-        """设置HTTP会话"""
-        self.session = requests.Session()
-        
-        # 配置重试策略
-        retry_strategy = Retry(
-            total=self.config.max_retries,
-            backoff_factor=self.config.retry_delay,
-            status_forcelist=[429, 500, 502, 503, 504],
-        )
-        
-        adapter = HTTPAdapter(max_retries=retry_strategy)
-        self.session.mount("http://", adapter)
-        self.session.mount("https://", adapter)
-        
-        # 设置默认请求头
-        self.session.headers.update({
-            "Authorization": f"Bearer {self.config.api_key}",
-            "Content-Type": "application/json",
-            "User-Agent": "Memory-X-Medical-AI/1.0"
-        })
+        """设置HTTP会话（与同配置的其他客户端共享连接池）"""
+        self.session = _shared_session(self.config)
     
     @abstractmethod
     def generate_response(self, prompt: str, **kwargs) -> str:
@@ -122,6 +170,9 @@ class BaseDashScopeClient(ABC):
 class StandardDashScopeClient(BaseDashScopeClient):
     """标准百炼API客户端实现"""
     
+    # 响应解析失败时的占位文本，不写入缓存
+    _FALLBACK_RESPONSES = ("响应格式异常，请稍后重试。", "响应解析失败，请稍后重试。")
+    
     def generate_response(self, prompt: str, **kwargs) -> str:
         """
         生成AI响应
@@ -136,9 +187,37 @@ class StandardDashScopeClient(BaseDashScopeClient):
         Raises:
             Exception: API调用失败时抛出异常
         """
+        return self._send(self._build_payload(prompt, **kwargs), prompt)
+    
+    def chat(self, messages: List[Dict[str, str]], **kwargs) -> str:
+        """
+        按给定的消息列表生成AI响应
+        
+        首条消息不是 system 时自动补上医疗系统提示词。调用方可把不变的内容（如患者档案）
+        放在靠前的 system 消息中、只让末尾的 user 消息变化，使请求前缀保持一致，
+        从而命中服务端的前缀缓存。
+        
+        Args:
+            messages: 消息列表，每项包含 role 与 content
+            **kwargs: 额外参数，可覆盖默认配置
+            
+        Returns:
+            str: AI生成的响应文本
+        """
+        messages = list(messages)
+        if not messages or messages[0].get("role") != "system":
+            messages.insert(0, {"role": "system", "content": self._build_medical_system_prompt()})
+        return self._send(self._wrap_payload(messages, **kwargs), messages[-1].get("content", ""))
+    
+    def _send(self, payload: Dict[str, Any], prompt: str) -> str:
+        """发送请求载荷并返回响应文本（命中响应缓存时不访问接口）"""
         try:
-            # 构建请求参数
-            payload = self._build_payload(prompt, **kwargs)
+            # 以完整载荷（模型、参数、系统提示、消息）的哈希命中缓存，重复请求不再访问接口
+            cache_key = self._cache_key(payload)
+            if cache_key is not None:
+                cached = self._response_cache.get(cache_key)
+                if cached is not None:
+                    return cached
             
             # 发送请求
             response = self.session.post(
@@ -155,6 +234,8 @@ class StandardDashScopeClient(BaseDashScopeClient):
             # 记录日志
             self._log_request(prompt, ai_response)
             
+            self._cache_store(cache_key, ai_response)
+            
             return ai_response
             
         except requests.exceptions.RequestException as e:
@@ -166,16 +247,71 @@ class StandardDashScopeClient(BaseDashScopeClient):
             self.logger.error(error_msg)
             raise Exception(error_msg) from e
     
+    def generate_response_stream(self, prompt: str, **kwargs) -> Iterator[str]:
+        """
+        流式生成AI响应，逐段产出增量文本
+        
+        Args:
+            prompt: 用户输入提示
+            **kwargs: 额外参数，可覆盖默认配置
+            
+        Yields:
+            str: 新到达的文本片段
+            
+        Raises:
+            Exception: API调用失败时抛出异常
+        """
+        payload = self._build_payload(prompt, **kwargs)
+        # 缓存键按非流式载荷计算，流式与非流式请求共用缓存
+        cache_key = self._cache_key(payload)
+        if cache_key is not None:
+            cached = self._response_cache.get(cache_key)
+            if cached is not None:
+                yield cached
+                return
+        
+        payload["parameters"]["incremental_output"] = True
+        pieces = []
+        try:
+            with self.session.post(
+                self.config.base_url,
+                json=payload,
+                headers={"X-DashScope-SSE": "enable", "Accept": "text/event-stream"},
+                timeout=self.config.timeout,
+                stream=True
+            ) as response:
+                response.raise_for_status()
+                for line in response.iter_lines(decode_unicode=True):
+                    # SSE 事件中只有 data: 行携带增量结果
+                    if not line or not line.startswith("data:"):
+                        continue
+                    chunk = self._extract_stream_text(json.loads(line[len("data:"):]))
+                    if chunk:
+                        pieces.append(chunk)
+                        yield chunk
+        except requests.exceptions.RequestException as e:
+            error_msg = f"DashScope API stream request failed: {e}"
+            self.logger.error(error_msg)
+            raise Exception(error_msg) from e
+        
+        ai_response = "".join(pieces).strip()
+        self._log_request(prompt, ai_response)
+        self._cache_store(cache_key, ai_response)
+    
+    def _cache_key(self, payload: Dict[str, Any]) -> Optional[str]:
+        """请求载荷的缓存键；未启用响应缓存时返回 None"""
+        if self._response_cache is None:
+            return None
+        canonical = json.dumps(payload, ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+    
+    def _cache_store(self, cache_key: Optional[str], ai_response: str):
+        """写入响应缓存，解析失败的占位文本与空响应不缓存"""
+        if cache_key is not None and ai_response and ai_response not in self._FALLBACK_RESPONSES:
+            self._response_cache[cache_key] = ai_response
+    
     def _build_payload(self, prompt: str, **kwargs) -> Dict[str, Any]:
         """构建API请求载荷"""
-        # 合并配置参数
-        params = {
-            "max_tokens": kwargs.get("max_tokens", self.config.max_tokens),
-            "temperature": kwargs.get("temperature", self.config.temperature),
-            "top_p": kwargs.get("top_p", 0.9),
-            "repetition_penalty": kwargs.get("repetition_penalty", 1.1)
-        }
-        
         # 构建消息列表
         messages = [
             {
@@ -196,6 +332,18 @@ class StandardDashScopeClient(BaseDashScopeClient):
                     history_messages.append(msg)
             messages = [messages[0]] + history_messages + [messages[1]]
         
+        return self._wrap_payload(messages, **kwargs)
+    
+    def _wrap_payload(self, messages: List[Dict[str, str]], **kwargs) -> Dict[str, Any]:
+        """把消息列表与模型参数组装成请求载荷"""
+        # 合并配置参数
+        params = {
+            "max_tokens": kwargs.get("max_tokens", self.config.max_tokens),
+            "temperature": kwargs.get("temperature", self.config.temperature),
+            "top_p": kwargs.get("top_p", 0.9),
+            "repetition_penalty": kwargs.get("repetition_penalty", 1.1)
+        }
+        
         payload = {
             "model": kwargs.get("model", self.config.model),
             "input": {
@@ -206,6 +354,17 @@ class StandardDashScopeClient(BaseDashScopeClient):
         
         return payload
     
+    @staticmethod
+    def _extract_stream_text(result: Dict[str, Any]) -> str:
+        """从流式事件中提取增量文本，无文本时返回空字符串"""
+        output = result.get("output") or {}
+        if output.get("text"):
+            return output["text"]
+        choices = output.get("choices") or []
+        if choices:
+            return choices[0].get("message", {}).get("content", "") or ""
+        return ""
+    
     def _extract_response_text(self, result: Dict[str, Any]) -> str:
         """从API响应中提取文本内容"""
         try:
@@ -218,23 +377,21 @@ class StandardDashScopeClient(BaseDashScopeClient):
                     return choices[0].get("message", {}).get("content", "").strip()
             else:
                 self.logger.warning(f"Unexpected response format: {result}")
-                return "响应格式异常，请稍后重试。"
+                return self._FALLBACK_RESPONSES[0]
         except Exception as e:
             self.logger.error(f"Failed to extract response text: {e}")
-            return "响应解析失败，请稍后重试。"
+            return self._FALLBACK_RESPONSES[1]
 
 
-class StreamingDashScopeClient(BaseDashScopeClient):
+class StreamingDashScopeClient(StandardDashScopeClient):
     """流式百炼API客户端（用于长对话）"""
     
     def generate_response(self, prompt: str, **kwargs) -> str:
         """
         生成流式AI响应
-        注：当前版本返回完整响应，未来版本将支持真正的流式处理
+        以流式请求接收全部增量片段后拼接返回；需要边生成边输出时使用 generate_response_stream
         """
-        # 当前先实现非流式版本，保持接口一致性
-        standard_client = StandardDashScopeClient(self.config)
-        return standard_client.generate_response(prompt, **kwargs)
+        return "".join(self.generate_response_stream(prompt, **kwargs)).strip()
 
 
 class MedicalDashScopeClient(StandardDashScopeClient):
@@ -356,8 +513,14 @@ class DashScopeClientFactory:
         )
 
 
-# 全局客户端实例管理
-_global_client = None
+# 全局客户端实例管理：按 (client_type, 配置参数) 缓存，同一组参数始终返回同一个实例
+_global_clients: Dict[tuple, BaseDashScopeClient] = {}
+_global_clients_lock = threading.Lock()
+
+
+def _client_cache_key(client_type: str, config_kwargs: Dict[str, Any]) -> tuple:
+    """把配置参数规整为可哈希的缓存键：患者上下文等字典参数按序列化后的内容比较"""
+    return client_type, json.dumps(config_kwargs, sort_keys=True, ensure_ascii=False, default=str)
 
 
 def get_global_client(
@@ -376,21 +539,22 @@ def get_global_client(
     Returns:
         BaseDashScopeClient: 全局客户端实例
     """
-    global _global_client
-    
-    if _global_client is None or force_recreate:
-        _global_client = DashScopeClientFactory.create_client(
-            client_type=client_type,
-            **config_kwargs
-        )
-    
-    return _global_client
+    key = _client_cache_key(client_type, config_kwargs)
+    with _global_clients_lock:
+        client = None if force_recreate else _global_clients.get(key)
+        if client is None:
+            client = DashScopeClientFactory.create_client(
+                client_type=client_type,
+                **config_kwargs
+            )
+            _global_clients[key] = client
+        return client
 
 
 def reset_global_client():
     """重置全局客户端实例"""
-    global _global_client
-    _global_client = None
+    with _global_clients_lock:
+        _global_clients.clear()
 
 
 # 便捷函数
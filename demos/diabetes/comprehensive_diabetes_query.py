@@ -6,11 +6,75 @@
 import sqlite3
 import json
 import os
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional
 from datetime import datetime
 
-def query_diabetes_data_from_db(db_path: str) -> Dict[str, Any]:
-    """从单个数据库查询糖尿病相关数据"""
+# 各表的糖尿病数据查询：结果键 -> (依赖的表, 用户ID列, 查询列, FROM子句, WHERE条件, 排序, 条数上限)
+DIABETES_QUERIES = {
+    'diseases': (
+        'diseases', 'user_id', '*', 'diseases',
+        """name LIKE '%糖尿病%' OR name LIKE '%diabetes%' OR name LIKE '%血糖%'
+           OR description LIKE '%糖尿病%' OR description LIKE '%diabetes%'""",
+        '', None
+    ),
+    'symptoms': (
+        'symptoms', 'user_id', '*', 'symptoms',
+        """name LIKE '%糖尿病%' OR name LIKE '%血糖%' OR name LIKE '%胰岛素%'
+           OR description LIKE '%糖尿病%' OR description LIKE '%diabetes%'""",
+        '', None
+    ),
+    'medicines': (
+        'medicines', 'user_id', '*', 'medicines',
+        """name LIKE '%胰岛素%' OR name LIKE '%血糖%' OR name LIKE '%糖尿病%'
+           OR description LIKE '%糖尿病%' OR description LIKE '%diabetes%'""",
+        '', None
+    ),
+    'disease_symptom_relations': (
+        'disease_symptom_relations', 'dsr.user_id', 'dsr.*, d.name as disease_name, s.name as symptom_name',
+        """disease_symptom_relations dsr
+           LEFT JOIN diseases d ON dsr.disease_id = d.id
+           LEFT JOIN symptoms s ON dsr.symptom_id = s.id""",
+        """d.name LIKE '%糖尿病%' OR d.name LIKE '%diabetes%' OR d.name LIKE '%血糖%'
+           OR s.name LIKE '%糖尿病%' OR s.name LIKE '%血糖%'""",
+        '', None
+    ),
+    'disease_medicine_relations': (
+        'disease_medicine_relations', 'dmr.user_id', 'dmr.*, d.name as disease_name, m.name as medicine_name',
+        """disease_medicine_relations dmr
+           LEFT JOIN diseases d ON dmr.disease_id = d.id
+           LEFT JOIN medicines m ON dmr.medicine_id = m.id""",
+        """d.name LIKE '%糖尿病%' OR d.name LIKE '%diabetes%'
+           OR m.name LIKE '%胰岛素%' OR m.name LIKE '%血糖%'""",
+        '', None
+    ),
+    'conversations': (
+        'conversations', 'user_id', '*', 'conversations',
+        """user_message LIKE '%糖尿病%' OR user_message LIKE '%血糖%' OR user_message LIKE '%胰岛素%'
+           OR ai_response LIKE '%糖尿病%' OR ai_response LIKE '%血糖%' OR ai_response LIKE '%胰岛素%'
+           OR entities LIKE '%糖尿病%' OR entities LIKE '%血糖%' OR entities LIKE '%胰岛素%'""",
+        'ORDER BY timestamp DESC', 10
+    ),
+}
+
+
+def _ensure_user_indexes(cursor, tables: List[str]) -> List[str]:
+    """为包含 user_id 列的表补建索引，返回这些表名"""
+    user_tables = []
+    for table in tables:
+        cursor.execute(f"PRAGMA table_info({table})")
+        if any(col[1] == 'user_id' for col in cursor.fetchall()):
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_user ON {table}(user_id)")
+            user_tables.append(table)
+    return user_tables
+
+
+def query_diabetes_data_from_db(db_path: str, details: bool = True,
+                                user_id: Optional[str] = None) -> Dict[str, Any]:
+    """从单个数据库查询糖尿病相关数据
+
+    details=False 时只执行 COUNT(*) 统计，不物化任何数据行；
+    指定 user_id 时，含 user_id 列的表先按用户索引定位再做关键词匹配。
+    """
     results = {
         'db_path': db_path,
         'db_name': os.path.basename(db_path),
@@ -21,16 +85,16 @@ def query_diabetes_data_from_db(db_path: str) -> Dict[str, Any]:
         'disease_symptom_relations': [],
         'disease_medicine_relations': [],
         'conversations': [],
+        'counts': {key: 0 for key in DIABETES_QUERIES},
         'error': None
     }
     
-    if not os.path.exists(db_path):
+    if not results['exists']:
         results['error'] = "数据库文件不存在"
         return results
     
     try:
         conn = sqlite3.connect(db_path)
-        conn.row_factory = sqlite3.Row
         cursor = conn.cursor()
         
         # 获取所有表名
@@ -38,68 +102,30 @@ def query_diabetes_data_from_db(db_path: str) -> Dict[str, Any]:
         tables = [row[0] for row in cursor.fetchall()]
         results['tables'] = tables
         
-        # 查询糖尿病相关的疾病实体
-        if 'diseases' in tables:
-            cursor.execute("""
-                SELECT * FROM diseases 
-                WHERE name LIKE '%糖尿病%' OR name LIKE '%diabetes%' OR name LIKE '%血糖%'
-                   OR description LIKE '%糖尿病%' OR description LIKE '%diabetes%'
-            """)
-            results['diseases'] = [dict(row) for row in cursor.fetchall()]
-        
-        # 查询糖尿病相关的症状实体
-        if 'symptoms' in tables:
-            cursor.execute("""
-                SELECT * FROM symptoms 
-                WHERE name LIKE '%糖尿病%' OR name LIKE '%血糖%' OR name LIKE '%胰岛素%'
-                   OR description LIKE '%糖尿病%' OR description LIKE '%diabetes%'
-            """)
-            results['symptoms'] = [dict(row) for row in cursor.fetchall()]
-        
-        # 查询糖尿病相关的药物实体
-        if 'medicines' in tables:
-            cursor.execute("""
-                SELECT * FROM medicines 
-                WHERE name LIKE '%胰岛素%' OR name LIKE '%血糖%' OR name LIKE '%糖尿病%'
-                   OR description LIKE '%糖尿病%' OR description LIKE '%diabetes%'
-            """)
-            results['medicines'] = [dict(row) for row in cursor.fetchall()]
+        user_tables = []
+        if user_id:
+            user_tables = _ensure_user_indexes(cursor, tables)
+            conn.commit()
         
-        # 查询糖尿病相关的疾病-症状关系
-        if 'disease_symptom_relations' in tables:
-            cursor.execute("""
-                SELECT dsr.*, d.name as disease_name, s.name as symptom_name
-                FROM disease_symptom_relations dsr
-                LEFT JOIN diseases d ON dsr.disease_id = d.id
-                LEFT JOIN symptoms s ON dsr.symptom_id = s.id
-                WHERE d.name LIKE '%糖尿病%' OR d.name LIKE '%diabetes%' OR d.name LIKE '%血糖%'
-                   OR s.name LIKE '%糖尿病%' OR s.name LIKE '%血糖%'
-            """)
-            results['disease_symptom_relations'] = [dict(row) for row in cursor.fetchall()]
-        
-        # 查询糖尿病相关的疾病-药物关系
-        if 'disease_medicine_relations' in tables:
-            cursor.execute("""
-                SELECT dmr.*, d.name as disease_name, m.name as medicine_name
-                FROM disease_medicine_relations dmr
-                LEFT JOIN diseases d ON dmr.disease_id = d.id
-                LEFT JOIN medicines m ON dmr.medicine_id = m.id
-                WHERE d.name LIKE '%糖尿病%' OR d.name LIKE '%diabetes%'
-                   OR m.name LIKE '%胰岛素%' OR m.name LIKE '%血糖%'
-            """)
-            results['disease_medicine_relations'] = [dict(row) for row in cursor.fetchall()]
-        
-        # 查询糖尿病相关的对话记录
-        if 'conversations' in tables:
-            cursor.execute("""
-                SELECT * FROM conversations 
-                WHERE user_message LIKE '%糖尿病%' OR user_message LIKE '%血糖%' OR user_message LIKE '%胰岛素%'
-                   OR ai_response LIKE '%糖尿病%' OR ai_response LIKE '%血糖%' OR ai_response LIKE '%胰岛素%'
-                   OR entities LIKE '%糖尿病%' OR entities LIKE '%血糖%' OR entities LIKE '%胰岛素%'
-                ORDER BY timestamp DESC
-                LIMIT 10
-            """)
-            results['conversations'] = [dict(row) for row in cursor.fetchall()]
+        for key, (table, user_column, columns, source, where, order_by, limit) in DIABETES_QUERIES.items():
+            if table not in tables:
+                continue
+            
+            params = ()
+            if table in user_tables:
+                where = f"{user_column} = ? AND ({where})"
+                params = (user_id,)
+            
+            limit_clause = f"LIMIT {limit}" if limit else ""
+            if not details:
+                cursor.execute(f"SELECT COUNT(*) FROM (SELECT 1 FROM {source} WHERE {where} {limit_clause})", params)
+                results['counts'][key] = cursor.fetchone()[0]
+                continue
+            
+            cursor.execute(f"SELECT {columns} FROM {source} WHERE {where} {order_by} {limit_clause}", params)
+            column_names = [col[0] for col in cursor.description]
+            results[key] = [dict(zip(column_names, row)) for row in cursor.fetchall()]
+            results['counts'][key] = len(results[key])
         
         conn.close()
         
@@ -108,7 +134,7 @@ def query_diabetes_data_from_db(db_path: str) -> Dict[str, Any]:
     
     return results
 
-def analyze_all_databases():
+def analyze_all_databases(user_id: Optional[str] = None):
     """分析所有数据库中的糖尿病数据"""
     print("🔍 综合查询所有数据库中的糖尿病相关数据")
     print("=" * 80)
@@ -148,35 +174,34 @@ def analyze_all_databases():
         print(f"\n📊 查询数据库: {os.path.basename(db_path)}")
         print("-" * 50)
         
-        results = query_diabetes_data_from_db(db_path)
+        # 先做 COUNT(*) 预检，只有确实包含糖尿病数据的库才拉取明细行
+        results = query_diabetes_data_from_db(db_path, details=False, user_id=user_id)
         
         if results['exists']:
             global_stats['total_databases'] += 1
             
             # 统计本数据库的糖尿病数据
-            db_diabetes_count = (len(results['diseases']) + 
-                               len(results['symptoms']) + 
-                               len(results['medicines']) +
-                               len(results['disease_symptom_relations']) +
-                               len(results['disease_medicine_relations']) +
-                               len(results['conversations']))
+            db_diabetes_count = sum(results['counts'].values())
             
             if db_diabetes_count > 0:
+                results = query_diabetes_data_from_db(db_path, user_id=user_id)
+                counts = results['counts']
+                
                 global_stats['databases_with_diabetes_data'] += 1
-                global_stats['total_diseases'] += len(results['diseases'])
-                global_stats['total_symptoms'] += len(results['symptoms'])
-                global_stats['total_medicines'] += len(results['medicines'])
-                global_stats['total_disease_symptom_relations'] += len(results['disease_symptom_relations'])
-                global_stats['total_disease_medicine_relations'] += len(results['disease_medicine_relations'])
-                global_stats['total_conversations'] += len(results['conversations'])
+                global_stats['total_diseases'] += counts['diseases']
+                global_stats['total_symptoms'] += counts['symptoms']
+                global_stats['total_medicines'] += counts['medicines']
+                global_stats['total_disease_symptom_relations'] += counts['disease_symptom_relations']
+                global_stats['total_disease_medicine_relations'] += counts['disease_medicine_relations']
+                global_stats['total_conversations'] += counts['conversations']
                 
                 print(f"✅ 包含糖尿病数据: {db_diabetes_count}项")
-                print(f"   疾病实体: {len(results['diseases'])}个")
-                print(f"   症状实体: {len(results['symptoms'])}个")
-                print(f"   药物实体: {len(results['medicines'])}个")
-                print(f"   疾病-症状关系: {len(results['disease_symptom_relations'])}条")
-                print(f"   疾病-药物关系: {len(results['disease_medicine_relations'])}条")
-                print(f"   相关对话: {len(results['conversations'])}条")
+                print(f"   疾病实体: {counts['diseases']}个")
+                print(f"   症状实体: {counts['symptoms']}个")
+                print(f"   药物实体: {counts['medicines']}个")
+                print(f"   疾病-症状关系: {counts['disease_symptom_relations']}条")
+                print(f"   疾病-药物关系: {counts['disease_medicine_relations']}条")
+                print(f"   相关对话: {counts['conversations']}条")
                 
                 # 显示具体的糖尿病实体
                 if results['diseases']:
@@ -218,18 +243,13 @@ def analyze_all_databases():
     diabetes_dbs = []
     for result in all_results:
         if result['exists']:
-            db_count = (len(result['diseases']) + 
-                       len(result['symptoms']) + 
-                       len(result['medicines']) +
-                       len(result['disease_symptom_relations']) +
-                       len(result['disease_medicine_relations']) +
-                       len(result['conversations']))
+            db_count = sum(result['counts'].values())
             if db_count > 0:
                 diabetes_dbs.append({
                     'name': result['db_name'],
                     'count': db_count,
-                    'diseases': len(result['diseases']),
-                    'relations': len(result['disease_symptom_relations'])
+                    'diseases': result['counts']['diseases'],
+                    'relations': result['counts']['disease_symptom_relations']
                 })
     
     # 按数据量排序
@@ -8,6 +8,7 @@ import sys
 sys.path.append('/Users/louisliu/.cursor/memory-x')
 
 from examples.enhanced_qwen_graph_demo import EnhancedQwenGraphDemo
+from src.core.memory_manager import DIABETES_RE
 
 def demo_interactive_clear_diabetes():
     print("🎬 演示交互式糖尿病记忆删除功能")
@@ -63,9 +64,8 @@ def demo_interactive_clear_diabetes():
         user_msg = mem.get('user_message', '')
         print(f"  {i}. {user_msg}")
         
-        # 检查是否包含糖尿病相关内容
-        diabetes_keywords = ['糖尿病', '血糖', '胰岛素', '家族史', '糖尿病风险', 'diabetes']
-        if any(keyword in user_msg for keyword in diabetes_keywords):
+        # 检查是否包含糖尿病相关内容（共用模块级关键词表）
+        if DIABETES_RE.search(user_msg):
             print(f"     🍯 糖尿病相关记忆")
             diabetes_count += 1
     
@@ -107,7 +107,7 @@ def demo_interactive_clear_diabetes():
     remaining_diabetes_memories = 0
     for mem in demo.memory_manager.short_term_memory:
         user_msg = mem.get('user_message', '')
-        if any(keyword in user_msg for keyword in ['糖尿病', '血糖', '胰岛素', '家族史']):
+        if DIABETES_RE.search(user_msg):
             remaining_diabetes_memories += 1
     
     if remaining_diabetes_memories == 0:
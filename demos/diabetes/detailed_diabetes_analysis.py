@@ -5,8 +5,68 @@
 
 import sqlite3
 import os
+import re
 import json
 from datetime import datetime
+from typing import Dict, Tuple
+
+# 糖尿病关键词模式（全模块共用，保证每条查询的SQL文本一致）
+DIABETES_PATTERNS = ('%糖尿病%', '%diabetes%', '%血糖%', '%胰岛素%')
+DIABETES_KEYWORDS = tuple(p.strip('%') for p in DIABETES_PATTERNS)
+# 关键词合并为一个预编译正则，与 SQL LIKE 一样对英文不区分大小写
+_DIABETES_RE = re.compile('|'.join(map(re.escape, DIABETES_KEYWORDS)), re.IGNORECASE)
+
+# 磁盘数据库的内存副本：路径 -> (文件签名, 内存连接)，重复分析时直接在内存中扫描
+_mem_conns: Dict[str, Tuple[tuple, sqlite3.Connection]] = {}
+
+
+def _like_any(col, patterns=DIABETES_PATTERNS):
+    """生成 `col LIKE ? OR col LIKE ? ...` 条件及其参数"""
+    return ' OR '.join(f'{col} LIKE ?' for _ in patterns), patterns
+
+
+def _mentions_diabetes(text):
+    """判断文本是否包含糖尿病关键词"""
+    return bool(text) and _DIABETES_RE.search(text) is not None
+
+
+def _file_signature(db_path):
+    """主文件与 -wal 文件的 (修改时间, 大小)；WAL 模式下提交先写入 -wal，主文件可能不变"""
+    signature = []
+    for path in (db_path, f"{db_path}-wal"):
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            signature.append(None)
+            continue
+        signature.append((stat.st_mtime_ns, stat.st_size))
+    return tuple(signature)
+
+
+def _memory_copy(db_path):
+    """返回数据库的内存副本连接，主文件或 -wal 文件变化后重新拷贝"""
+    signature = _file_signature(db_path)
+    cached = _mem_conns.get(db_path)
+    if cached and cached[0] == signature:
+        return cached[1]
+    if cached:
+        cached[1].close()
+    
+    mem_conn = sqlite3.connect(':memory:')
+    on_disk = sqlite3.connect(db_path)
+    try:
+        on_disk.backup(mem_conn)
+    finally:
+        on_disk.close()
+    _mem_conns[db_path] = (signature, mem_conn)
+    return mem_conn
+
+
+def _fetch_dicts(cursor):
+    """按 cursor.description 的列名把原始元组行转换为字典"""
+    column_names = [col[0] for col in cursor.description]
+    return [dict(zip(column_names, row)) for row in cursor.fetchall()]
+
 
 def detailed_diabetes_analysis():
     """详细分析糖尿病数据最丰富的数据库"""
@@ -30,8 +90,7 @@ def detailed_diabetes_analysis():
         print("-" * 50)
         
         try:
-            conn = sqlite3.connect(db_path)
-            conn.row_factory = sqlite3.Row
+            conn = _memory_copy(db_path)
             cursor = conn.cursor()
             
             # 获取所有表信息
@@ -41,8 +100,9 @@ def detailed_diabetes_analysis():
             
             # 分析疾病实体
             if 'diseases' in tables:
-                cursor.execute("SELECT * FROM diseases WHERE name LIKE '%糖尿病%' OR name LIKE '%diabetes%' OR name LIKE '%血糖%'")
-                diseases = cursor.fetchall()
+                where, params = _like_any('name')
+                cursor.execute(f"SELECT * FROM diseases WHERE {where}", params)
+                diseases = _fetch_dicts(cursor)
                 print(f"\n🏥 糖尿病疾病实体 ({len(diseases)}个):")
                 for disease in diseases:
                     print(f"  ID: {disease['id']}")
@@ -56,8 +116,9 @@ def detailed_diabetes_analysis():
             
             # 分析症状实体
             if 'symptoms' in tables:
-                cursor.execute("SELECT * FROM symptoms WHERE name LIKE '%糖尿病%' OR name LIKE '%血糖%' OR name LIKE '%胰岛素%'")
-                symptoms = cursor.fetchall()
+                where, params = _like_any('name')
+                cursor.execute(f"SELECT * FROM symptoms WHERE {where}", params)
+                symptoms = _fetch_dicts(cursor)
                 print(f"🤒 相关症状实体 ({len(symptoms)}个):")
                 for symptom in symptoms:
                     print(f"  ID: {symptom['id']}")
@@ -68,8 +129,9 @@ def detailed_diabetes_analysis():
             
             # 分析药物实体
             if 'medicines' in tables:
-                cursor.execute("SELECT * FROM medicines WHERE name LIKE '%胰岛素%' OR name LIKE '%血糖%' OR name LIKE '%糖尿病%'")
-                medicines = cursor.fetchall()
+                where, params = _like_any('name')
+                cursor.execute(f"SELECT * FROM medicines WHERE {where}", params)
+                medicines = _fetch_dicts(cursor)
                 print(f"💊 相关药物实体 ({len(medicines)}个):")
                 for medicine in medicines:
                     print(f"  ID: {medicine['id']}")
@@ -87,14 +149,13 @@ def detailed_diabetes_analysis():
                     LEFT JOIN diseases d ON dsr.disease_id = d.id
                     LEFT JOIN symptoms s ON dsr.symptom_id = s.id
                 """)
-                all_relations = cursor.fetchall()
+                all_relations = _fetch_dicts(cursor)
                 
                 diabetes_relations = []
                 for rel in all_relations:
                     disease_name = rel.get('disease_name', '')
                     symptom_name = rel.get('symptom_name', '')
-                    if ('糖尿病' in disease_name or 'diabetes' in disease_name or '血糖' in disease_name or
-                        '糖尿病' in symptom_name or '血糖' in symptom_name):
+                    if _mentions_diabetes(disease_name) or _mentions_diabetes(symptom_name):
                         diabetes_relations.append(rel)
                 
                 print(f"🔗 糖尿病相关的疾病-症状关系 ({len(diabetes_relations)}条):")
@@ -110,15 +171,16 @@ def detailed_diabetes_analysis():
             
             # 分析疾病-药物关系
             if 'disease_medicine_relations' in tables:
-                cursor.execute("""
+                disease_where, disease_params = _like_any('d.name')
+                medicine_where, medicine_params = _like_any('m.name')
+                cursor.execute(f"""
                     SELECT dmr.*, d.name as disease_name, m.name as medicine_name
                     FROM disease_medicine_relations dmr
                     LEFT JOIN diseases d ON dmr.disease_id = d.id
                     LEFT JOIN medicines m ON dmr.medicine_id = m.id
-                    WHERE d.name LIKE '%糖尿病%' OR d.name LIKE '%diabetes%'
-                       OR m.name LIKE '%胰岛素%' OR m.name LIKE '%血糖%'
-                """)
-                drug_relations = cursor.fetchall()
+                    WHERE {disease_where} OR {medicine_where}
+                """, disease_params + medicine_params)
+                drug_relations = _fetch_dicts(cursor)
                 print(f"💉 糖尿病相关的疾病-药物关系 ({len(drug_relations)}条):")
                 for rel in drug_relations:
                     print(f"  关系ID: {rel.get('id', 'N/A')}")
@@ -130,14 +192,15 @@ def detailed_diabetes_analysis():
             
             # 检查是否有对话记录
             if 'conversations' in tables:
-                cursor.execute("""
+                user_where, user_params = _like_any('user_message')
+                ai_where, ai_params = _like_any('ai_response')
+                cursor.execute(f"""
                     SELECT * FROM conversations 
-                    WHERE user_message LIKE '%糖尿病%' OR user_message LIKE '%血糖%' OR user_message LIKE '%胰岛素%'
-                       OR ai_response LIKE '%糖尿病%' OR ai_response LIKE '%血糖%' OR ai_response LIKE '%胰岛素%'
+                    WHERE {user_where} OR {ai_where}
                     ORDER BY timestamp DESC
                     LIMIT 5
-                """)
-                conversations = cursor.fetchall()
+                """, user_params + ai_params)
+                conversations = _fetch_dicts(cursor)
                 print(f"💬 相关对话记录 ({len(conversations)}条，显示最近5条):")
                 for conv in conversations:
                     print(f"  时间: {conv.get('timestamp', 'N/A')}")
@@ -145,7 +208,7 @@ def detailed_diabetes_analysis():
                     print(f"  AI: {conv.get('ai_response', '')[:60]}...")
                     print()
             
-            conn.close()
+            cursor.close()
             
         except Exception as e:
             print(f"❌ 查询错误: {e}")
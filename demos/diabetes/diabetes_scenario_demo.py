@@ -19,15 +19,32 @@ import sqlite3
 import json
 import time
 from datetime import datetime, timedelta
+from functools import cached_property
 from typing import Dict, List, Optional, Any
 
 # 添加项目路径
 sys.path.append('/Users/louisliu/.cursor/memory-x')
 
 from src.core.medical_graph_manager import MedicalGraphManager, DiseaseEntity, SymptomEntity
-from src.core.qwen_graph_update_engine import QwenGraphUpdateEngine
 from src.core.memory_manager import SimpleMemoryManager, SimpleMemoryIntegratedAI
 
+# Qwen分析响应的本地缓存目录：重放场景时相同输入直接读取缓存
+QWEN_CACHE_DIR = os.path.expanduser("~/.cache/memory-x/qwen")
+
+# 场景中反复出现的实体名称，驻留后下游集合/字典按指针比较
+DIZZINESS = sys.intern("头晕")
+FEVER = sys.intern("发热")
+COLD = sys.intern("感冒")
+DIABETES = sys.intern("糖尿病")
+DEMO_PATIENT = sys.intern("演示患者")
+
+# 实体载荷常量：用不可变元组，多次调用共享同一对象
+ENT_DIZZINESS = ((DIZZINESS, 0, 2),)
+ENT_COLD_SYMPTOMS = ((DIZZINESS, 0, 2), (FEVER, 0, 2))
+ENT_COLD = ((COLD, 0, 2),)
+ENT_DIABETES = ((DIABETES, 0, 3),)
+ENT_DEMO_PATIENT = ((DEMO_PATIENT, 0, 4),)
+
 
 class DiabetesScenarioDemo:
     """糖尿病诊断场景演示类"""
@@ -40,19 +57,37 @@ class DiabetesScenarioDemo:
         # 确保数据目录存在
         os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
         
-        # 初始化组件
+        # 初始化组件（Qwen引擎与记忆组件在首次访问时创建）
         self.graph_manager = MedicalGraphManager(self.db_path)
-        self.qwen_engine = QwenGraphUpdateEngine(self.graph_manager, api_key)
-        self.memory_ai = SimpleMemoryIntegratedAI()
-        self.memory_manager = self.memory_ai.get_memory_manager(self.user_id)
         
         # 场景状态
         self.current_day = 1
         self.scenario_start_time = datetime.now()
+        self._start_time_str = self.scenario_start_time.strftime('%Y-%m-%d %H:%M')
+        
+        # 重复使用的分隔线
+        self._sep40 = "-" * 40
+        self._sep60 = "=" * 60
         
         # 初始化演示环境
         self._setup_demo_environment()
     
+    @cached_property
+    def qwen_engine(self):
+        """Qwen图谱更新引擎，首次分析时才导入并创建"""
+        from src.core.qwen_graph_update_engine import QwenGraphUpdateEngine
+        return QwenGraphUpdateEngine(self.graph_manager, self.api_key, cache_dir=QWEN_CACHE_DIR)
+    
+    @cached_property
+    def memory_ai(self):
+        """记忆集成AI"""
+        return SimpleMemoryIntegratedAI()
+    
+    @cached_property
+    def memory_manager(self) -> SimpleMemoryManager:
+        """当前患者的记忆管理器"""
+        return self.memory_ai.get_memory_manager(self.user_id)
+    
     def _setup_demo_environment(self):
         """设置演示环境"""
         print("🏥 初始化糖尿病诊断场景演示环境...")
@@ -98,10 +133,7 @@ class DiabetesScenarioDemo:
         self.memory_manager.add_conversation(
             "医生，我最近感冒了，有点头晕和发热",
             "根据您的症状，这是典型的感冒症状。建议多休息，多喝水。",
-            {
-                "SYMPTOM": [["头晕", 0, 2], ["发热", 0, 2]], 
-                "DISEASE": [["感冒", 0, 2]]
-            },
+            {"SYMPTOM": ENT_COLD_SYMPTOMS, "DISEASE": ENT_COLD},
             "medical_consultation",
             3
         )
@@ -110,10 +142,10 @@ class DiabetesScenarioDemo:
     
     def day1_initial_consultation(self):
         """第一天：初次糖尿病咨询"""
-        print(f"\n" + "="*60)
-        print(f"📅 第1天 - 初次糖尿病咨询")
-        print(f"时间: {self.scenario_start_time.strftime('%Y-%m-%d %H:%M')}")
-        print("="*60)
+        print("\n" + self._sep60)
+        print("📅 第1天 - 初次糖尿病咨询")
+        print(f"时间: {self._start_time_str}")
+        print(self._sep60)
         
         user_message = "医生，我有糖尿病"
         ai_response = "好的，我了解了。糖尿病需要长期管理，请告诉我您目前有什么症状吗？"
@@ -127,10 +159,7 @@ class DiabetesScenarioDemo:
         self.memory_manager.add_conversation(
             user_message,
             ai_response,
-            {
-                "DISEASE": [["糖尿病", 0, 3]],
-                "PERSON": [["演示患者", 0, 4]]
-            },
+            {"DISEASE": ENT_DIABETES, "PERSON": ENT_DEMO_PATIENT},
             "disease_declaration",
             4  # 高重要性
         )
@@ -139,7 +168,7 @@ class DiabetesScenarioDemo:
         print(f"📊 第2步: 在图谱中创建糖尿病实体...")
         diabetes_entity = DiseaseEntity(
             id=f"disease_diabetes_{self.user_id}",
-            name="糖尿病",
+            name=DIABETES,
             category="内分泌系统疾病",
             severity="chronic",
             description=f"患者{self.user_id}主动声明患有糖尿病",
@@ -171,6 +200,7 @@ class DiabetesScenarioDemo:
         # 模拟时间推进
         self.current_day = 4
         self.day4_time = self.scenario_start_time + timedelta(days=3)
+        self._day4_time_str = self.day4_time.strftime('%Y-%m-%d %H:%M')
         
         # 可以在这里添加一些中间状态的变化
         print(f"💭 期间患者可能出现了一些症状，但没有及时就诊...")
@@ -178,10 +208,10 @@ class DiabetesScenarioDemo:
     
     def day4_dizziness_consultation(self):
         """第4天：头晕症状咨询"""
-        print(f"\n" + "="*60)
-        print(f"📅 第4天 - 头晕症状咨询")
-        print(f"时间: {self.day4_time.strftime('%Y-%m-%d %H:%M')}")
-        print("="*60)
+        print("\n" + self._sep60)
+        print("📅 第4天 - 头晕症状咨询")
+        print(f"时间: {self._day4_time_str}")
+        print(self._sep60)
         
         user_message = "医生，我头晕"
         
@@ -198,7 +228,7 @@ class DiabetesScenarioDemo:
         print(f"  结合患者背景: 糖尿病患者，有家族史，30天前有感冒史")
         
         # 调用Qwen引擎进行分析
-        extracted_symptoms = ["头晕"]
+        extracted_symptoms = [DIZZINESS]
         context = f"患者在第1天确诊糖尿病，现在第4天出现头晕症状。需要分析头晕是否与糖尿病相关，而非30天前的感冒复发。"
         
         qwen_decision = self.qwen_engine.analyze_update_scenario(
@@ -224,11 +254,13 @@ class DiabetesScenarioDemo:
         
         if qwen_decision.action.value == "create_diabetes_relation":
             print(f"  🌱 执行糖尿病关系创建...")
-            execution_result = self.qwen_engine.execute_diabetes_relation_creation(
-                symptoms=extracted_symptoms,
-                user_id=self.user_id,
-                diabetes_risk_assessment=qwen_decision.diabetes_risk_assessment or "中高风险"
-            )
+            # 实体与关系的创建合并为一次提交
+            with self.graph_manager.transaction():
+                execution_result = self.qwen_engine.execute_diabetes_relation_creation(
+                    symptoms=extracted_symptoms,
+                    user_id=self.user_id,
+                    diabetes_risk_assessment=qwen_decision.diabetes_risk_assessment or "中高风险"
+                )
             
             if execution_result["success"]:
                 print(f"  ✅ 图谱更新成功:")
@@ -246,10 +278,7 @@ class DiabetesScenarioDemo:
         self.memory_manager.add_conversation(
             user_message,
             ai_response,
-            {
-                "SYMPTOM": [["头晕", 0, 2]],
-                "DISEASE": [["糖尿病", 0, 3]]
-            },
+            {"SYMPTOM": ENT_DIZZINESS, "DISEASE": ENT_DIABETES},
             "symptom_consultation",
             4
         )
@@ -273,24 +302,29 @@ class DiabetesScenarioDemo:
     def _display_current_status(self, stage: str):
         """显示当前系统状态"""
         print(f"\n📊 系统状态 - {stage}")
-        print(f"-" * 40)
+        print(self._sep40)
         
         # 短期记忆状态
         memory_stats = self.memory_manager.get_memory_stats()
         print(f"💭 短期记忆: {memory_stats['short_term_count']}条")
         
+        # 循环内只拼接片段，最后一次性写出
+        parts = []
         for i, mem in enumerate(self.memory_manager.short_term_memory, 1):
-            print(f"  {i}. {mem['user_message'][:30]}...")
+            parts.append(f"  {i}. {mem['user_message'][:30]}...\n")
             if mem.get('entities'):
                 entities_str = ", ".join([f"{k}: {len(v)}" for k, v in mem['entities'].items()])
-                print(f"     实体: {entities_str}")
+                parts.append(f"     实体: {entities_str}\n")
+        sys.stdout.write("".join(parts))
         
         # 图谱状态
         ds_relations = self.graph_manager.get_disease_symptom_relations(user_id=self.user_id)
         print(f"\n🕸️ 图谱关系: {len(ds_relations)}条")
         
-        for i, rel in enumerate(ds_relations, 1):
-            print(f"  {i}. {rel['disease_name']} → {rel['symptom_name']} (置信度: {rel['confidence']})")
+        sys.stdout.write("".join(
+            f"  {i}. {rel['disease_name']} → {rel['symptom_name']} (置信度: {rel['confidence']})\n"
+            for i, rel in enumerate(ds_relations, 1)
+        ))
         
         # 糖尿病相关数据
         diabetes_data = self.graph_manager.get_diabetes_related_data(user_id=self.user_id)
@@ -305,7 +339,7 @@ class DiabetesScenarioDemo:
     def _summarize_analysis_process(self, qwen_decision):
         """总结分析过程"""
         print(f"\n📋 第4天诊断分析总结:")
-        print(f"-" * 40)
+        print(self._sep40)
         
         print(f"🔍 核心问题: 头晕症状的病因分析")
         print(f"  可能原因1: 30天前感冒的复发或后遗症")
@@ -319,7 +353,8 @@ class DiabetesScenarioDemo:
         
         print(f"\n✅ 图谱更新效果:")
         final_relations = self.graph_manager.get_disease_symptom_relations(user_id=self.user_id)
-        diabetes_relations = [r for r in final_relations if '糖尿病' in r['disease_name']]
+        diabetes_mask = self.graph_manager.get_disease_symptom_relations_mask(DIABETES, user_id=self.user_id)
+        diabetes_relations = [r for r, hit in zip(final_relations, diabetes_mask) if hit]
         
         if diabetes_relations:
             print(f"  ✅ 成功建立糖尿病-头晕关联")
@@ -342,14 +377,16 @@ class DiabetesScenarioDemo:
         print("="*80)
         
         try:
-            # 第一天：糖尿病声明
-            self.day1_initial_consultation()
-            
-            # 等待3天
-            self.wait_3_days()
-            
-            # 第四天：头晕症状
-            self.day4_dizziness_consultation()
+            # 三天的记忆写入合并为一次提交
+            with self.memory_manager.transaction():
+                # 第一天：糖尿病声明
+                self.day1_initial_consultation()
+                
+                # 等待3天
+                self.wait_3_days()
+                
+                # 第四天：头晕症状
+                self.day4_dizziness_consultation()
             
             # 最终总结
             self._final_summary()
@@ -371,47 +408,49 @@ class DiabetesScenarioDemo:
         memory_stats = self.memory_manager.get_memory_stats()
         print(f"  ✅ 短期记忆管理: {memory_stats['short_term_count']}条记录")
         
-        diabetes_memories = 0
-        for mem in self.memory_manager.short_term_memory:
-            if '糖尿病' in mem['user_message'] or (mem.get('entities', {}).get('DISEASE', [])):
-                diabetes_memories += 1
+        diabetes_memories = sum(
+            1 for mem in self.memory_manager.short_term_memory if 'diabetes' in mem.get('tags', ())
+        )
         
         print(f"    - 糖尿病相关记忆: {diabetes_memories}条")
         
         # 验证图谱更新
         diabetes_data = self.graph_manager.get_diabetes_related_data(user_id=self.user_id)
-        total_diabetes_items = (len(diabetes_data['diseases']) + 
-                               len(diabetes_data['disease_symptom_relations']))
+        disease_count = len(diabetes_data['diseases'])
+        relation_count = len(diabetes_data['disease_symptom_relations'])
         
-        print(f"  ✅ 图谱数据管理: {total_diabetes_items}项糖尿病相关数据")
-        print(f"    - 疾病实体: {len(diabetes_data['diseases'])}个")
-        print(f"    - 疾病-症状关系: {len(diabetes_data['disease_symptom_relations'])}条")
+        print(f"  ✅ 图谱数据管理: {disease_count + relation_count}项糖尿病相关数据")
+        print(f"    - 疾病实体: {disease_count}个")
+        print(f"    - 疾病-症状关系: {relation_count}条")
         
         # 验证AI分析能力
-        ds_relations = self.graph_manager.get_disease_symptom_relations(user_id=self.user_id)
-        diabetes_symptom_relations = [r for r in ds_relations if '糖尿病' in r['disease_name']]
+        diabetes_symptom_count = int(sum(
+            self.graph_manager.get_disease_symptom_relations_mask(DIABETES, user_id=self.user_id)
+        ))
         
         print(f"  ✅ AI分析效果: 成功区分感冒 vs 糖尿病症状")
-        print(f"    - 糖尿病-症状关系: {len(diabetes_symptom_relations)}条")
+        print(f"    - 糖尿病-症状关系: {diabetes_symptom_count}条")
         print(f"    - 感冒相关关系保持独立")
         
         print(f"\n🎯 场景目标达成情况:")
         
+        # 各项判定只计算一次
+        has_disease = disease_count > 0
+        has_memories = diabetes_memories > 0
+        has_relations = diabetes_symptom_count > 0
+        
         goals = [
-            ("第一次沟通：用户声明糖尿病", len(diabetes_data['diseases']) > 0),
-            ("短期记忆增加糖尿病实体", diabetes_memories > 0),
+            ("第一次沟通：用户声明糖尿病", has_disease),
+            ("短期记忆增加糖尿病实体", has_memories),
             ("初始图谱中糖尿病症状为空", True),  # 这是第1天的状态
             ("3天后用户说头晕", True),
-            ("AI分析头晕与糖尿病关系", len(diabetes_symptom_relations) > 0),
-            ("更新图谱建立糖尿病-头晕关联", len(diabetes_symptom_relations) > 0)
+            ("AI分析头晕与糖尿病关系", has_relations),
+            ("更新图谱建立糖尿病-头晕关联", has_relations)
         ]
         
-        success_count = 0
         for goal, achieved in goals:
-            status = "✅" if achieved else "❌"
-            print(f"    {status} {goal}")
-            if achieved:
-                success_count += 1
+            print(f"    {'✅' if achieved else '❌'} {goal}")
+        success_count = sum(achieved for _, achieved in goals)
         
         success_rate = success_count / len(goals) * 100
         print(f"\n🏆 场景完成度: {success_rate:.1f}% ({success_count}/{len(goals)})")
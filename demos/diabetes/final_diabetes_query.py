@@ -6,12 +6,184 @@
 import sqlite3
 import os
 import json
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from functools import lru_cache
+from pathlib import Path
+
+try:
+    import orjson
+except ImportError:  # orjson 未安装时退回标准库 json
+    orjson = None
+
+# 实体表的可选列：存在时查询，缺失时以 NULL 补齐，保证 UNION ALL 各分支列数一致
+OPTIONAL_COLUMNS = {
+    'diseases': ('category', 'severity', 'user_id', 'created_time'),
+    'symptoms': ('severity', 'user_id', 'created_time'),
+    'medicines': (),
+}
+
+ENTITY_FILTERS = {
+    'diseases': "name LIKE '%糖尿病%' OR name LIKE '%diabetes%' OR name LIKE '%血糖%'",
+    'symptoms': "name LIKE '%糖尿病%' OR name LIKE '%血糖%' OR name LIKE '%头晕%' OR name LIKE '%口渴%'",
+    'medicines': "name LIKE '%胰岛素%' OR name LIKE '%血糖%'",
+}
+
+# 只读连接的页缓存设置：mmap 让页读取直接走内核页缓存，减少 pread 系统调用
+READONLY_PRAGMAS = ("mmap_size=268435456", "cache_size=-65536")
+
+RESULT_KEYS = (
+    'diseases', 'symptoms', 'medicines',
+    'disease_symptom_relations', 'disease_medicine_relations'
+)
+
+# 每类结果的输出列；合并查询中缺失的列以 NULL 补齐
+KIND_COLUMNS = {
+    'diseases': ('id', 'name', *OPTIONAL_COLUMNS['diseases']),
+    'symptoms': ('id', 'name', *OPTIONAL_COLUMNS['symptoms']),
+    'medicines': ('id', 'name', *OPTIONAL_COLUMNS['medicines']),
+    'disease_symptom_relations': ('id', 'disease_id', 'symptom_id', 'confidence', 'disease_name', 'symptom_name'),
+    'disease_medicine_relations': ('id', 'disease_id', 'medicine_id', 'confidence', 'disease_name', 'medicine_name'),
+}
+ALL_COLUMNS = tuple(dict.fromkeys(col for cols in KIND_COLUMNS.values() for col in cols))
+
+
+def _readonly_uri(db_path):
+    """只读且不可变的 URI：immutable=1 让 SQLite 跳过锁和日志检查"""
+    return f"{Path(db_path).resolve().as_uri()}?mode=ro&immutable=1"
+
+
+def _ro_connect(db_path):
+    """以只读方式打开数据库并应用读优化 PRAGMA"""
+    conn = sqlite3.connect(_readonly_uri(db_path), uri=True)
+    conn.execute("PRAGMA temp_store=MEMORY")
+    for pragma in READONLY_PRAGMAS:
+        conn.execute(f"PRAGMA {pragma}")
+    return conn
+
+
+@lru_cache(maxsize=256)
+def get_table_columns(db_path, table_name):
+    """获取表的列信息（按数据库路径和表名缓存）"""
+    conn = _ro_connect(db_path)
+    conn.row_factory = sqlite3.Row
+    try:
+        return tuple(row['name'] for row in conn.execute(f"PRAGMA table_info({table_name})"))
+    finally:
+        conn.close()
+
+
+def prepare_database(db_path):
+    """查询前把 WAL 中的内容合并回主文件——immutable 只读打开不会读取 -wal 文件"""
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    finally:
+        conn.close()
+
+
+def scan_database(db_path):
+    """单个库的准备工作（可在线程中并行）：合并WAL、读取表结构"""
+    prepare_database(db_path)
+    conn = _ro_connect(db_path)
+    try:
+        tables = [row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")]
+    finally:
+        conn.close()
+    return {table: get_table_columns(db_path, table) if table in RESULT_KEYS else () for table in tables}
+
+
+@lru_cache(maxsize=256)
+def _build_entity_select(schema, table, columns):
+    """按 (附加库, 表, 列集合) 生成并缓存实体查询SQL"""
+    optional = [col if col in columns else f"NULL AS {col}" for col in OPTIONAL_COLUMNS[table]]
+    select_columns = ", ".join(["id", "name", *optional])
+    return f"SELECT '{schema}' AS src, {select_columns} FROM {schema}.{table} WHERE {ENTITY_FILTERS[table]}"
+
+
+def _entity_select(schema, table, tables):
+    """构造单个附加库中实体表的查询分支"""
+    if table not in tables:
+        return None
+    return _build_entity_select(schema, table, frozenset(tables[table]))
+
+
+@lru_cache(maxsize=256)
+def _build_relation_select(schema, table, has_confidence, table_names):
+    """按 (附加库, 关系表, 是否有置信度列, 表集合) 生成并缓存关系查询SQL"""
+    if table == 'disease_symptom_relations':
+        target_table, target_alias, target_id, target_name = 'symptoms', 's', 'symptom_id', 'symptom_name'
+        where = """d.name LIKE '%糖尿病%' OR d.name LIKE '%diabetes%' OR d.name LIKE '%血糖%'
+                   OR s.name LIKE '%糖尿病%' OR s.name LIKE '%血糖%' OR s.name LIKE '%头晕%'"""
+    else:
+        target_table, target_alias, target_id, target_name = 'medicines', 'm', 'medicine_id', 'medicine_name'
+        where = """d.name LIKE '%糖尿病%' OR d.name LIKE '%diabetes%'
+                   OR m.name LIKE '%胰岛素%' OR m.name LIKE '%血糖%'"""
+    
+    if not all(t in table_names for t in (table, 'diseases', target_table)):
+        return None
+    confidence = "r.confidence" if has_confidence else "NULL"
+    return f"""
+        SELECT '{schema}' AS src, r.id, r.disease_id, r.{target_id}, {confidence} AS confidence,
+               d.name AS disease_name, {target_alias}.name AS {target_name}
+        FROM {schema}.{table} r
+        LEFT JOIN {schema}.diseases d ON r.disease_id = d.id
+        LEFT JOIN {schema}.{target_table} {target_alias} ON r.{target_id} = {target_alias}.id
+        WHERE {where}
+    """
+
+
+def _relation_select(schema, table, tables):
+    """构造单个附加库中关系表的查询分支"""
+    if table not in tables:
+        return None
+    return _build_relation_select(schema, table, 'confidence' in tables[table], frozenset(tables))
+
+
+def _compound_query(cursor, schemas):
+    """用一条 WITH ... UNION ALL 查询取回所有附加库的五类数据，按 (类别, 来源库) 分桶"""
+    builders = {key: _entity_select if key in OPTIONAL_COLUMNS else _relation_select for key in RESULT_KEYS}
+    ctes, selects = [], []
+    for key in RESULT_KEYS:
+        branches = [builders[key](schema, key, tables) for schema, (_, tables) in schemas.items()]
+        branches = [branch for branch in branches if branch]
+        if not branches:
+            continue
+        ctes.append(f"k_{key} AS ({' UNION ALL '.join(branches)})")
+        columns = ", ".join(col if col in KIND_COLUMNS[key] else f"NULL AS {col}" for col in ALL_COLUMNS)
+        selects.append(f"SELECT '{key}' AS kind, src, {columns} FROM k_{key}")
+    
+    buckets = {key: defaultdict(list) for key in RESULT_KEYS}
+    if not selects:
+        return buckets
+    
+    cursor.execute(f"WITH {', '.join(ctes)} {' UNION ALL '.join(selects)}")
+    for row in cursor:
+        kind = row['kind']
+        buckets[kind][row['src']].append({col: row[col] for col in KIND_COLUMNS[kind]})
+    return buckets
+
+
+def _json_default(obj):
+    """orjson 无法原生序列化的对象统一转为字符串"""
+    return obj.isoformat() if isinstance(obj, datetime) else str(obj)
+
+
+def write_report(report_file, report):
+    """写出JSON报告：优先用 orjson 一次性生成字节流"""
+    if orjson is None:
+        with open(report_file, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2, default=str)
+        return
+    
+    with open(report_file, 'wb') as f:
+        f.write(orjson.dumps(
+            report,
+            default=_json_default,
+            option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS
+        ))
 
-def get_table_columns(cursor, table_name):
-    """获取表的列信息"""
-    cursor.execute(f"PRAGMA table_info({table_name})")
-    return [row[1] for row in cursor.fetchall()]
 
 def query_diabetes_data():
     """查询所有数据库中的糖尿病数据"""
@@ -37,221 +209,104 @@ def query_diabetes_data():
         'total_disease_medicine_relations': 0
     }
     
-    for db_path in databases:
-        if not os.path.exists(db_path):
-            continue
-            
-        db_name = os.path.basename(db_path)
+    # 所有数据库附加到同一个内存连接上，每类实体只需一次 UNION ALL 查询
+    conn = sqlite3.connect(':memory:', uri=True)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA temp_store=MEMORY")
+    cursor = conn.cursor()
+    schemas = {}  # 附加别名 -> (数据库文件名, {表名: [列名]})
+    
+    # 各库相互独立：准备工作用线程池并行（sqlite3 在 C 调用期间释放 GIL），附加仍在主线程完成
+    existing = [(index, db_path) for index, db_path in enumerate(databases) if os.path.exists(db_path)]
+    with ThreadPoolExecutor(max_workers=max(1, min(6, len(existing)))) as executor:
+        futures = [executor.submit(scan_database, db_path) for _, db_path in existing]
+    
+    for (index, db_path), future in zip(existing, futures):
+        schema = f"db{index}"
+        try:
+            tables = future.result()
+            cursor.execute(f"ATTACH DATABASE ? AS {schema}", (_readonly_uri(db_path),))
+            for pragma in READONLY_PRAGMAS:
+                cursor.execute(f"PRAGMA {schema}.{pragma}")
+            schemas[schema] = (os.path.basename(db_path), tables)
+        except Exception as e:
+            print(f"❌ 附加数据库失败 {os.path.basename(db_path)}: {e}")
+    
+    try:
+        buckets = _compound_query(cursor, schemas)
+    except Exception as e:
+        print(f"❌ 查询错误: {e}")
+        buckets = {key: defaultdict(list) for key in RESULT_KEYS}
+    finally:
+        conn.close()
+    
+    for schema, (db_name, _) in schemas.items():
         print(f"\n📊 分析数据库: {db_name}")
         print("-" * 50)
         
-        try:
-            conn = sqlite3.connect(db_path)
-            cursor = conn.cursor()
-            
-            # 获取表列表
-            cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
-            tables = [row[0] for row in cursor.fetchall()]
-            
-            db_results = {
-                'diseases': [],
-                'symptoms': [],
-                'medicines': [],
-                'disease_symptom_relations': [],
-                'disease_medicine_relations': []
-            }
-            
-            # 查询疾病实体
-            if 'diseases' in tables:
-                columns = get_table_columns(cursor, 'diseases')
-                base_columns = "id, name"
-                optional_columns = []
-                if 'category' in columns:
-                    optional_columns.append('category')
-                if 'severity' in columns:
-                    optional_columns.append('severity')
-                if 'user_id' in columns:
-                    optional_columns.append('user_id')
-                if 'created_time' in columns:
-                    optional_columns.append('created_time')
-                
-                query_columns = base_columns
-                if optional_columns:
-                    query_columns += ", " + ", ".join(optional_columns)
-                
-                cursor.execute(f"""
-                    SELECT {query_columns} FROM diseases 
-                    WHERE name LIKE '%糖尿病%' OR name LIKE '%diabetes%' OR name LIKE '%血糖%'
-                """)
-                
-                for row in cursor.fetchall():
-                    disease = {'id': row[0], 'name': row[1]}
-                    col_idx = 2
-                    if 'category' in columns and col_idx < len(row):
-                        disease['category'] = row[col_idx]
-                        col_idx += 1
-                    if 'severity' in columns and col_idx < len(row):
-                        disease['severity'] = row[col_idx]
-                        col_idx += 1
-                    if 'user_id' in columns and col_idx < len(row):
-                        disease['user_id'] = row[col_idx]
-                        col_idx += 1
-                    if 'created_time' in columns and col_idx < len(row):
-                        disease['created_time'] = row[col_idx]
-                    
-                    db_results['diseases'].append(disease)
-            
-            # 查询症状实体
-            if 'symptoms' in tables:
-                columns = get_table_columns(cursor, 'symptoms')
-                base_columns = "id, name"
-                optional_columns = []
-                if 'severity' in columns:
-                    optional_columns.append('severity')
-                if 'user_id' in columns:
-                    optional_columns.append('user_id')
-                if 'created_time' in columns:
-                    optional_columns.append('created_time')
-                
-                query_columns = base_columns
-                if optional_columns:
-                    query_columns += ", " + ", ".join(optional_columns)
-                
-                cursor.execute(f"""
-                    SELECT {query_columns} FROM symptoms 
-                    WHERE name LIKE '%糖尿病%' OR name LIKE '%血糖%' OR name LIKE '%头晕%' OR name LIKE '%口渴%'
-                """)
-                
-                for row in cursor.fetchall():
-                    symptom = {'id': row[0], 'name': row[1]}
-                    col_idx = 2
-                    if 'severity' in columns and col_idx < len(row):
-                        symptom['severity'] = row[col_idx]
-                        col_idx += 1
-                    if 'user_id' in columns and col_idx < len(row):
-                        symptom['user_id'] = row[col_idx]
-                        col_idx += 1
-                    if 'created_time' in columns and col_idx < len(row):
-                        symptom['created_time'] = row[col_idx]
-                    
-                    db_results['symptoms'].append(symptom)
+        db_results = {key: buckets[key][schema] for key in RESULT_KEYS}
+        
+        # 统计当前数据库的数据
+        total_items = (len(db_results['diseases']) + len(db_results['symptoms']) + 
+                      len(db_results['medicines']) + len(db_results['disease_symptom_relations']) +
+                      len(db_results['disease_medicine_relations']))
+        
+        if total_items > 0:
+            print(f"✅ 发现糖尿病数据: {total_items}项")
             
-            # 查询药物实体
-            if 'medicines' in tables:
-                cursor.execute("SELECT id, name FROM medicines WHERE name LIKE '%胰岛素%' OR name LIKE '%血糖%'")
-                for row in cursor.fetchall():
-                    db_results['medicines'].append({'id': row[0], 'name': row[1]})
+            # 显示疾病实体
+            if db_results['diseases']:
+                print(f"🏥 疾病实体 ({len(db_results['diseases'])}个):")
+                for disease in db_results['diseases']:
+                    user_info = f" (用户: {disease.get('user_id', 'N/A')})" if disease.get('user_id') else ""
+                    print(f"  • {disease['name']}{user_info}")
+                    print(f"    ID: {disease['id']}")
+                    if disease.get('category'):
+                        print(f"    类别: {disease['category']}")
+                    if disease.get('severity'):
+                        print(f"    严重程度: {disease['severity']}")
             
-            # 查询疾病-症状关系
-            if 'disease_symptom_relations' in tables:
-                cursor.execute("""
-                    SELECT dsr.id, dsr.disease_id, dsr.symptom_id, dsr.confidence,
-                           d.name as disease_name, s.name as symptom_name
-                    FROM disease_symptom_relations dsr
-                    LEFT JOIN diseases d ON dsr.disease_id = d.id
-                    LEFT JOIN symptoms s ON dsr.symptom_id = s.id
-                    WHERE d.name LIKE '%糖尿病%' OR d.name LIKE '%diabetes%' OR d.name LIKE '%血糖%'
-                       OR s.name LIKE '%糖尿病%' OR s.name LIKE '%血糖%' OR s.name LIKE '%头晕%'
-                """)
-                
-                for row in cursor.fetchall():
-                    db_results['disease_symptom_relations'].append({
-                        'id': row[0],
-                        'disease_id': row[1],  
-                        'symptom_id': row[2],
-                        'confidence': row[3],
-                        'disease_name': row[4],
-                        'symptom_name': row[5]
-                    })
+            # 显示症状实体
+            if db_results['symptoms']:
+                print(f"🤒 症状实体 ({len(db_results['symptoms'])}个):")
+                for symptom in db_results['symptoms']:
+                    user_info = f" (用户: {symptom.get('user_id', 'N/A')})" if symptom.get('user_id') else ""
+                    print(f"  • {symptom['name']}{user_info}")
+                    print(f"    ID: {symptom['id']}")
+                    if symptom.get('severity'):
+                        print(f"    严重程度: {symptom['severity']}")
             
-            # 查询疾病-药物关系
-            if 'disease_medicine_relations' in tables:
-                cursor.execute("""
-                    SELECT dmr.id, dmr.disease_id, dmr.medicine_id, dmr.confidence,
-                           d.name as disease_name, m.name as medicine_name
-                    FROM disease_medicine_relations dmr
-                    LEFT JOIN diseases d ON dmr.disease_id = d.id
-                    LEFT JOIN medicines m ON dmr.medicine_id = m.id
-                    WHERE d.name LIKE '%糖尿病%' OR d.name LIKE '%diabetes%'
-                       OR m.name LIKE '%胰岛素%' OR m.name LIKE '%血糖%'
-                """)
-                
-                for row in cursor.fetchall():
-                    db_results['disease_medicine_relations'].append({
-                        'id': row[0],
-                        'disease_id': row[1],
-                        'medicine_id': row[2],
-                        'confidence': row[3],
-                        'disease_name': row[4],
-                        'medicine_name': row[5]
-                    })
+            # 显示药物实体
+            if db_results['medicines']:
+                print(f"💊 药物实体 ({len(db_results['medicines'])}个):")
+                for medicine in db_results['medicines']:
+                    print(f"  • {medicine['name']} (ID: {medicine['id']})")
             
-            # 统计当前数据库的数据
-            total_items = (len(db_results['diseases']) + len(db_results['symptoms']) + 
-                          len(db_results['medicines']) + len(db_results['disease_symptom_relations']) +
-                          len(db_results['disease_medicine_relations']))
+            # 显示疾病-症状关系
+            if db_results['disease_symptom_relations']:
+                print(f"🔗 疾病-症状关系 ({len(db_results['disease_symptom_relations'])}条):")
+                for rel in db_results['disease_symptom_relations']:
+                    print(f"  • {rel['disease_name']} → {rel['symptom_name']}")
+                    print(f"    置信度: {rel.get('confidence', 'N/A')}")
+                    print(f"    关系ID: {rel['id']}")
             
-            if total_items > 0:
-                print(f"✅ 发现糖尿病数据: {total_items}项")
-                
-                # 显示疾病实体
-                if db_results['diseases']:
-                    print(f"🏥 疾病实体 ({len(db_results['diseases'])}个):")
-                    for disease in db_results['diseases']:
-                        user_info = f" (用户: {disease.get('user_id', 'N/A')})" if disease.get('user_id') else ""
-                        print(f"  • {disease['name']}{user_info}")
-                        print(f"    ID: {disease['id']}")
-                        if disease.get('category'):
-                            print(f"    类别: {disease['category']}")
-                        if disease.get('severity'):
-                            print(f"    严重程度: {disease['severity']}")
-                
-                # 显示症状实体
-                if db_results['symptoms']:
-                    print(f"🤒 症状实体 ({len(db_results['symptoms'])}个):")
-                    for symptom in db_results['symptoms']:
-                        user_info = f" (用户: {symptom.get('user_id', 'N/A')})" if symptom.get('user_id') else ""
-                        print(f"  • {symptom['name']}{user_info}")
-                        print(f"    ID: {symptom['id']}")
-                        if symptom.get('severity'):
-                            print(f"    严重程度: {symptom['severity']}")
-                
-                # 显示药物实体
-                if db_results['medicines']:
-                    print(f"💊 药物实体 ({len(db_results['medicines'])}个):")
-                    for medicine in db_results['medicines']:
-                        print(f"  • {medicine['name']} (ID: {medicine['id']})")
-                
-                # 显示疾病-症状关系
-                if db_results['disease_symptom_relations']:
-                    print(f"🔗 疾病-症状关系 ({len(db_results['disease_symptom_relations'])}条):")
-                    for rel in db_results['disease_symptom_relations']:
-                        print(f"  • {rel['disease_name']} → {rel['symptom_name']}")
-                        print(f"    置信度: {rel.get('confidence', 'N/A')}")
-                        print(f"    关系ID: {rel['id']}")
-                
-                # 显示疾病-药物关系
-                if db_results['disease_medicine_relations']:
-                    print(f"💉 疾病-药物关系 ({len(db_results['disease_medicine_relations'])}条):")
-                    for rel in db_results['disease_medicine_relations']:
-                        print(f"  • {rel['disease_name']} → {rel['medicine_name']}")
-                        print(f"    置信度: {rel.get('confidence', 'N/A')}")
-                
-                # 更新全局统计
-                global_stats['total_diseases'] += len(db_results['diseases'])
-                global_stats['total_symptoms'] += len(db_results['symptoms'])
-                global_stats['total_medicines'] += len(db_results['medicines'])
-                global_stats['total_disease_symptom_relations'] += len(db_results['disease_symptom_relations'])
-                global_stats['total_disease_medicine_relations'] += len(db_results['disease_medicine_relations'])
-                
-                all_results[db_name] = db_results
-            else:
-                print("⚪ 无糖尿病相关数据")
+            # 显示疾病-药物关系
+            if db_results['disease_medicine_relations']:
+                print(f"💉 疾病-药物关系 ({len(db_results['disease_medicine_relations'])}条):")
+                for rel in db_results['disease_medicine_relations']:
+                    print(f"  • {rel['disease_name']} → {rel['medicine_name']}")
+                    print(f"    置信度: {rel.get('confidence', 'N/A')}")
             
-            conn.close()
+            # 更新全局统计
+            global_stats['total_diseases'] += len(db_results['diseases'])
+            global_stats['total_symptoms'] += len(db_results['symptoms'])
+            global_stats['total_medicines'] += len(db_results['medicines'])
+            global_stats['total_disease_symptom_relations'] += len(db_results['disease_symptom_relations'])
+            global_stats['total_disease_medicine_relations'] += len(db_results['disease_medicine_relations'])
             
-        except Exception as e:
-            print(f"❌ 查询错误: {e}")
+            all_results[db_name] = db_results
+        else:
+            print("⚪ 无糖尿病相关数据")
     
     # 全局汇总
     print(f"\n🌍 糖尿病图谱数据全局汇总")
@@ -292,8 +347,7 @@ def query_diabetes_data():
     }
     
     report_file = "/Users/louisliu/.cursor/memory-x/diabetes_final_report.json"
-    with open(report_file, 'w', encoding='utf-8') as f:
-        json.dump(report, f, ensure_ascii=False, indent=2, default=str)
+    write_report(report_file, report)
     
     print(f"\n📄 完整报告已保存: {report_file}")
 
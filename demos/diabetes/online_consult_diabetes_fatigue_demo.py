@@ -5,11 +5,16 @@
 来源：online_consult
 """
 
+import io
 import os
 import sys
 import os
 import json
+import threading
+import time
 from datetime import datetime, timedelta
+from itertools import chain
+from pathlib import Path
 from typing import Dict, List, Optional
 
 # 添加项目路径
@@ -19,48 +24,186 @@ from src.core.medical_graph_manager import MedicalGraphManager, DiseaseEntity, S
 from src.core.qwen_graph_update_engine import QwenGraphUpdateEngine, UpdateAction
 from src.core.memory_manager import SimpleMemoryManager, SimpleMemoryIntegratedAI
 
+try:
+    import orjson
+except ImportError:  # orjson 未安装时退回标准库 json
+    orjson = None
+
+# 输出与回复模板（用 format_map 填充患者信息，避免每次运行重新拼接）
+SETUP_BANNER_TMPL = """🏥 在线咨询糖尿病乏力症状演示环境初始化
+======================================================================
+患者信息：{name}，{age}岁
+过敏史：{allergy}
+家族史：{family_history}
+咨询来源：online_consult
+咨询时间：{consult_time}"""
+
+CONSULT_BANNER_TMPL = """
+======================================================================
+💻 在线咨询场景 - 糖尿病患者乏力症状
+时间: {consult_time}
+来源: online_consult
+======================================================================"""
+
+PATIENT_SUMMARY_TMPL = """
+👤 患者关键信息总结:
+  姓名: {name}
+  年龄: {age}岁
+  家族史: {family_history}
+  过敏史: {allergy}
+  本次症状: 乏力
+  咨询来源: online_consult
+  风险评估: 糖尿病中高风险"""
+
+ANALYSIS_CONTEXT_TMPL = """
+        在线咨询场景分析：
+        - 患者：{name}，{age}岁男性
+        - 家族史：糖尿病遗传病史（父亲{family_year}岁确诊）
+        - 当前症状：乏力、精神不振、工作效率下降
+        - 患者担忧：血糖异常
+        - 咨询来源：online_consult
+        - 需要评估：乏力症状与糖尿病的关联性
+        """
+
+DOCTOR_RESPONSE_TMPL = """{name}您好，感谢您通过在线咨询平台咨询。
+
+根据您描述的乏力症状和糖尿病家族史，我的分析如下：
+
+1. **症状评估**：乏力确实是糖尿病的常见早期症状之一，特别是当血糖控制不佳时。
+
+2. **风险因素**：您有糖尿病家族史（父亲{family_year}岁确诊），这是重要的遗传风险因素。
+
+3. **建议检查**：
+   - 空腹血糖检测
+   - 糖化血红蛋白（HbA1c）
+   - 口服葡萄糖耐量试验（如需要）
+
+4. **即时建议**：
+   - 注意观察是否有其他糖尿病症状（多饮、多尿、体重下降）
+   - 保持规律作息，避免过度劳累
+   - 适量运动，控制饮食
+
+请尽快到医院进行相关检查，以便早期发现和干预。如有紧急情况，请及时就医。"""
+
+DEFAULT_DB_PATH = "/Users/louisliu/.cursor/memory-x/data/online_consult_diabetes_demo.db"
+REPORT_PATH = "/Users/louisliu/.cursor/memory-x/online_consult_diabetes_report.json"
+
+# 患者基本信息（演示用例）
+DEFAULT_PATIENT_INFO = {
+    "name": "演示患者",
+    "age": "成年人",
+    "gender": "男",
+    "allergy": "青霉素过敏（演示用例）",
+    "family_history": "糖尿病遗传病史（演示用例）"
+}
+
+# 患者背景中需要展示的关键实体类型（集合成员判断为常数时间）
+KEY_ENTITY_TYPES = frozenset({'FAMILY_HISTORY', 'ALLERGY', 'DISEASE'})
+
+# 图谱连接的读写优化：WAL 减少 fsync，mmap 让读取走内核页缓存
+GRAPH_PRAGMAS = (
+    "journal_mode=WAL",
+    "synchronous=NORMAL",
+    "temp_store=MEMORY",
+    "mmap_size=268435456",
+)
+
+# 重复运行演示（如在notebook中）时复用：图谱管理器按数据库路径缓存（同库共用一份读缓存），
+# Qwen引擎按 (数据库路径, API密钥) 缓存
+_MANAGER_CACHE: Dict[str, MedicalGraphManager] = {}
+_ENGINE_CACHE: Dict[tuple, QwenGraphUpdateEngine] = {}
+_MANAGER_CACHE_LOCK = threading.Lock()
+
+
+def write_report(report_path: str, report: Dict):
+    """写出JSON报告：优先用 orjson 直接生成字节流"""
+    if orjson is None:
+        with open(report_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2, default=str)
+        return
+    Path(report_path).write_bytes(orjson.dumps(report, default=str, option=orjson.OPT_INDENT_2))
+
+
+def _get_managers(db_path: str, api_key: str):
+    """获取（必要时创建）(db_path, api_key) 对应的 (MedicalGraphManager, QwenGraphUpdateEngine)"""
+    with _MANAGER_CACHE_LOCK:
+        graph_manager = _MANAGER_CACHE.get(db_path)
+        if graph_manager is None:
+            graph_manager = _MANAGER_CACHE[db_path] = MedicalGraphManager(db_path, pragmas=GRAPH_PRAGMAS)
+        key = (db_path, api_key)
+        if key not in _ENGINE_CACHE:
+            _ENGINE_CACHE[key] = QwenGraphUpdateEngine(graph_manager, api_key)
+        return graph_manager, _ENGINE_CACHE[key]
+
 
 class OnlineConsultDiabetesFatigueDemo:
     """在线咨询糖尿病乏力症状演示类"""
     
-    def __init__(self, api_key: str, db_path: str = None):
+    # 已确认存在的目录；批量创建演示实例时不再重复 makedirs
+    _DIRS_CREATED: set = set()
+    
+    @classmethod
+    def _ensure_parent_dir(cls, path: str):
+        """确保文件所在目录存在，每个目录只检查一次"""
+        directory = os.path.dirname(path)
+        if directory not in cls._DIRS_CREATED:
+            os.makedirs(directory, exist_ok=True)
+            cls._DIRS_CREATED.add(directory)
+    
+    def __init__(self, api_key: str, db_path: str = None, verbose_live: bool = False):
         self.api_key = api_key
-        self.db_path = db_path or "/Users/louisliu/.cursor/memory-x/data/online_consult_diabetes_demo.db"
+        
+        # 叙述性输出先写入缓冲区，在阶段结束时一次性刷新；verbose_live 时进度提示实时打印
+        self._buf = io.StringIO()
+        self.verbose_live = verbose_live
+        self.db_path = db_path or DEFAULT_DB_PATH
         self.user_id = "demo_patient_online_consult"
         
         # 患者基本信息（演示用例）
-        self.patient_info = {
-            "name": "演示患者",
-            "age": "成年人",
-            "gender": "男",
-            "allergy": "青霉素过敏（演示用例）",
-            "family_history": "糖尿病遗传病史（演示用例）"
-        }
+        self.patient_info = dict(DEFAULT_PATIENT_INFO)
         
         # 确保数据目录存在
-        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        self._ensure_parent_dir(self.db_path)
         
         # 初始化组件
-        self.graph_manager = MedicalGraphManager(self.db_path)
-        self.qwen_engine = QwenGraphUpdateEngine(self.graph_manager, api_key)
+        self.graph_manager, self.qwen_engine = _get_managers(self.db_path, api_key)
         self.memory_ai = SimpleMemoryIntegratedAI()
         self.memory_manager = self.memory_ai.get_memory_manager(self.user_id)
         
-        # 咨询时间设置
+        # 咨询时间设置：展示用时间戳只取一次，耗时统计使用单调时钟
         self.consult_time = datetime.now()
+        self._started_ns = time.monotonic_ns()
+        self._ts_str = self.consult_time.strftime('%Y-%m-%d %H:%M')
+        
+        # 模板填充字段只组装一次
+        self._template_fields = {**self.patient_info, "consult_time": self._ts_str, "family_year": 55}
         
         # 初始化演示环境
         self._setup_demo_environment()
     
+    @classmethod
+    def run_batch(cls, cases: List[Dict], api_key: str = None, db_path: str = None) -> List:
+        """批量评估多个患者的咨询场景（如队列评测），不写入记忆与图谱
+        
+        每个 case 可包含 user_id、symptoms 以及覆盖 DEFAULT_PATIENT_INFO 的患者字段，
+        返回与 cases 顺序一致的 UpdateDecision 列表。
+        """
+        graph_manager, qwen_engine = _get_managers(db_path or DEFAULT_DB_PATH, api_key)
+        
+        batch = []
+        for case in cases:
+            fields = {**DEFAULT_PATIENT_INFO, "family_year": 55, **case}
+            batch.append((
+                case.get("symptoms", ["乏力"]),
+                case.get("user_id", "demo_patient_online_consult"),
+                ANALYSIS_CONTEXT_TMPL.format_map(fields)
+            ))
+        
+        return qwen_engine.analyze_update_scenario_batch(batch)
+    
     def _setup_demo_environment(self):
         """设置演示环境"""
-        print("🏥 在线咨询糖尿病乏力症状演示环境初始化")
-        print("=" * 70)
-        print(f"患者信息：{self.patient_info['name']}，{self.patient_info['age']}岁")
-        print(f"过敏史：{self.patient_info['allergy']}")
-        print(f"家族史：{self.patient_info['family_history']}")
-        print(f"咨询来源：online_consult")
-        print(f"咨询时间：{self.consult_time.strftime('%Y-%m-%d %H:%M')}")
+        self._out(SETUP_BANNER_TMPL.format_map(self._template_fields))
         
         # 清理旧数据
         self._clean_existing_data()
@@ -68,7 +211,34 @@ class OnlineConsultDiabetesFatigueDemo:
         # 设置患者背景信息
         self._setup_patient_background()
         
-        print("✅ 演示环境初始化完成")
+        self._out("✅ 演示环境初始化完成")
+        self._flush()
+    
+    def _elapsed_ms(self) -> float:
+        """自演示初始化以来经过的毫秒数"""
+        return (time.monotonic_ns() - self._started_ns) / 1e6
+    
+    def _out(self, text: str = ""):
+        """写入输出缓冲区"""
+        self._buf.write(text)
+        self._buf.write("\n")
+    
+    def _progress(self, text: str):
+        """进度提示：verbose_live 时先刷新缓冲区再实时打印，保持输出顺序"""
+        if self.verbose_live:
+            self._flush()
+            print(text, flush=True)
+        else:
+            self._out(text)
+    
+    def _flush(self):
+        """将缓冲区内容一次性写到标准输出"""
+        text = self._buf.getvalue()
+        if text:
+            sys.stdout.write(text)
+            sys.stdout.flush()
+            self._buf.seek(0)
+            self._buf.truncate()
     
     def _clean_existing_data(self):
         """清理现有数据"""
@@ -79,64 +249,61 @@ class OnlineConsultDiabetesFatigueDemo:
             # 清理图谱中的糖尿病相关数据
             self.graph_manager.remove_diabetes_related_graph_data(user_id=self.user_id)
             
-            print("🧹 清理旧数据完成")
+            self._out("🧹 清理旧数据完成")
         except Exception as e:
-            print(f"⚠️ 清理数据时出现警告: {e}")
+            self._out(f"⚠️ 清理数据时出现警告: {e}")
     
     def _setup_patient_background(self):
         """设置患者背景信息"""
-        print(f"\n👤 患者背景信息设置:")
+        self._out(f"\n👤 患者背景信息设置:")
         
         # 添加糖尿病家族史记录
         family_history_time = self.consult_time - timedelta(days=365)  # 一年前的家族史记录
         
-        self.memory_manager.add_conversation(
-            f"医生，我有{self.patient_info['family_history']}，父亲在55岁时确诊糖尿病",
-            "了解您的家族史对评估糖尿病风险很重要。建议您定期监测血糖，保持健康生活方式。",
-            {
-                "FAMILY_HISTORY": [["糖尿病遗传病史", 0, 6]],
-                "PERSON": [["父亲", 0, 2]],
-                "AGE": [["55岁", 0, 3]]
-            },
-            "family_history_consult",
-            4  # 高重要性
-        )
-        
-        # 添加过敏史记录
-        self.memory_manager.add_conversation(
-            f"医生，我对{self.patient_info['allergy']}，用药时需要注意",
-            "已记录您的青霉素过敏史，开药时会特别注意避免使用青霉素类抗生素。",
-            {
-                "ALLERGY": [["青霉素过敏", 0, 4]],
-                "MEDICINE": [["青霉素", 0, 3]]
-            },
-            "allergy_notification",
-            4  # 高重要性
-        )
-        
-        print(f"  ✓ 已录入糖尿病家族史")
-        print(f"  ✓ 已录入青霉素过敏史")
+        # 家族史与过敏史两条记录一次性写入
+        self.memory_manager.add_conversations_bulk([
+            (
+                f"医生，我有{self.patient_info['family_history']}，父亲在55岁时确诊糖尿病",
+                "了解您的家族史对评估糖尿病风险很重要。建议您定期监测血糖，保持健康生活方式。",
+                {
+                    "FAMILY_HISTORY": [["糖尿病遗传病史", 0, 6]],
+                    "PERSON": [["父亲", 0, 2]],
+                    "AGE": [["55岁", 0, 3]]
+                },
+                "family_history_consult",
+                4  # 高重要性
+            ),
+            (
+                f"医生，我对{self.patient_info['allergy']}，用药时需要注意",
+                "已记录您的青霉素过敏史，开药时会特别注意避免使用青霉素类抗生素。",
+                {
+                    "ALLERGY": [["青霉素过敏", 0, 4]],
+                    "MEDICINE": [["青霉素", 0, 3]]
+                },
+                "allergy_notification",
+                4  # 高重要性
+            ),
+        ])
+        
+        self._out(f"  ✓ 已录入糖尿病家族史")
+        self._out(f"  ✓ 已录入青霉素过敏史")
     
     def online_consult_scenario(self):
         """在线咨询场景演示"""
-        print(f"\n" + "="*70)
-        print(f"💻 在线咨询场景 - 糖尿病患者乏力症状")
-        print(f"时间: {self.consult_time.strftime('%Y-%m-%d %H:%M')}")
-        print(f"来源: online_consult")
-        print("="*70)
+        self._out(CONSULT_BANNER_TMPL.format_map(self._template_fields))
         
         # 第一步：用户主诉
         user_complaint = "医生您好，我最近几天总是感觉很乏力，没有精神，工作效率也下降了。我有糖尿病家族史，担心是不是血糖出了问题？"
         
-        print(f"👨‍💼 患者主诉:")
-        print(f"  {user_complaint}")
+        self._out(f"👨‍💼 患者主诉:")
+        self._out(f"  {user_complaint}")
         
         # 第二步：分析当前记忆和背景
-        print(f"\n🔍 第1步: 分析患者背景信息...")
+        self._out(f"\n🔍 第1步: 分析患者背景信息...")
         self._display_patient_context()
         
         # 第三步：实体识别与症状分析
-        print(f"\n📋 第2步: 实体识别与症状分析...")
+        self._out(f"\n📋 第2步: 实体识别与症状分析...")
         
         extracted_entities = {
             "SYMPTOM": [["乏力", 0, 2]],
@@ -145,22 +312,14 @@ class OnlineConsultDiabetesFatigueDemo:
             "CONCERN": [["血糖问题", 0, 4]]
         }
         
-        print(f"  🎯 识别实体:")
+        self._out(f"  🎯 识别实体:")
         for entity_type, entities in extracted_entities.items():
             entity_names = [e[0] for e in entities]
-            print(f"    {entity_type}: {', '.join(entity_names)}")
+            self._out(f"    {entity_type}: {', '.join(entity_names)}")
         
         # 第四步：AI智能分析
-        print(f"\n🤖 第3步: AI智能分析...")
-        context = f"""
-        在线咨询场景分析：
-        - 患者：{self.patient_info['name']}，{self.patient_info['age']}岁男性
-        - 家族史：糖尿病遗传病史（父亲55岁确诊）
-        - 当前症状：乏力、精神不振、工作效率下降
-        - 患者担忧：血糖异常
-        - 咨询来源：online_consult
-        - 需要评估：乏力症状与糖尿病的关联性
-        """
+        self._progress(f"\n🤖 第3步: AI智能分析...")
+        context = ANALYSIS_CONTEXT_TMPL.format_map(self._template_fields)
         
         qwen_decision = self.qwen_engine.analyze_update_scenario(
             current_symptoms=["乏力"],
@@ -168,96 +327,77 @@ class OnlineConsultDiabetesFatigueDemo:
             context=context
         )
         
-        print(f"  🤖 AI分析结果:")
-        print(f"    推荐动作: {qwen_decision.action.value}")
-        print(f"    置信度: {qwen_decision.confidence:.2f}")
-        print(f"    分析理由: {qwen_decision.reasoning[:200]}...")
+        self._out(f"  🤖 AI分析结果:")
+        self._out(f"    推荐动作: {qwen_decision.action.value}")
+        self._out(f"    置信度: {qwen_decision.confidence:.2f}")
+        self._out(f"    分析理由: {qwen_decision.reasoning[:200]}...")
         
         if qwen_decision.diabetes_risk_assessment:
-            print(f"    糖尿病风险评估: {qwen_decision.diabetes_risk_assessment}")
+            self._out(f"    糖尿病风险评估: {qwen_decision.diabetes_risk_assessment}")
         
         # 第五步：医生回复生成
         doctor_response = self._generate_doctor_response(qwen_decision)
-        print(f"\n👨‍⚕️ 医生回复:")
-        print(f"  {doctor_response}")
+        self._out(f"\n👨‍⚕️ 医生回复:")
+        self._out(f"  {doctor_response}")
         
         # 第六步：执行图谱更新
-        print(f"\n🔄 第4步: 执行知识图谱更新...")
+        self._out(f"\n🔄 第4步: 执行知识图谱更新...")
         self._execute_graph_update(qwen_decision, extracted_entities)
         
         # 第七步：更新短期记忆
-        print(f"\n📝 第5步: 更新记忆系统...")
-        self.memory_manager.add_conversation(
-            user_complaint,
-            doctor_response,
-            extracted_entities,
-            "online_diabetes_fatigue_consult",
-            4  # 高重要性
-        )
-        
-        # 添加来源标记
-        self._add_source_record()
+        self._out(f"\n📝 第5步: 更新记忆系统...")
+        with self.memory_manager.transaction():
+            self.memory_manager.add_conversation(
+                user_complaint,
+                doctor_response,
+                extracted_entities,
+                "online_diabetes_fatigue_consult",
+                4  # 高重要性
+            )
+            
+            # 添加来源标记
+            self._add_source_record()
         
-        print(f"  ✅ 记忆系统已更新")
+        self._out(f"  ✅ 记忆系统已更新")
         
         # 第八步：显示最终状态
         self._display_final_results()
     
     def _display_patient_context(self):
         """显示患者背景信息"""
-        print(f"  📊 患者历史记录:")
+        self._out(f"  📊 患者历史记录:")
         
         # 显示短期记忆
         memory_count = len(self.memory_manager.short_term_memory)
-        print(f"    短期记忆: {memory_count}条")
+        self._out(f"    短期记忆: {memory_count}条")
         
         for i, mem in enumerate(self.memory_manager.short_term_memory, 1):
-            print(f"    {i}. {mem['user_message'][:50]}...")
+            self._out(f"    {i}. {mem['user_message'][:50]}...")
             if mem.get('entities'):
-                key_entities = []
-                for entity_type, entity_list in mem['entities'].items():
-                    if entity_type in ['FAMILY_HISTORY', 'ALLERGY', 'DISEASE']:
-                        for entity in entity_list:
-                            key_entities.append(entity[0])
+                entities = mem['entities']
+                key_entities = [
+                    entity[0]
+                    for entity in chain.from_iterable(
+                        entities[entity_type] for entity_type in entities if entity_type in KEY_ENTITY_TYPES
+                    )
+                ]
                 if key_entities:
-                    print(f"       关键信息: {', '.join(key_entities)}")
+                    self._out(f"       关键信息: {', '.join(key_entities)}")
         
         # 显示图谱关系
         relations = self.graph_manager.get_disease_symptom_relations(user_id=self.user_id)
-        print(f"    图谱关系: {len(relations)}条")
+        self._out(f"    图谱关系: {len(relations)}条")
         for rel in relations:
-            print(f"      {rel['disease_name']} → {rel['symptom_name']} (置信度: {rel['confidence']})")
+            self._out(f"      {rel['disease_name']} → {rel['symptom_name']} (置信度: {rel['confidence']})")
     
     def _generate_doctor_response(self, qwen_decision) -> str:
         """根据AI分析生成医生回复"""
-        base_response = f"""
-{self.patient_info['name']}您好，感谢您通过在线咨询平台咨询。
-
-根据您描述的乏力症状和糖尿病家族史，我的分析如下：
-
-1. **症状评估**：乏力确实是糖尿病的常见早期症状之一，特别是当血糖控制不佳时。
-
-2. **风险因素**：您有糖尿病家族史（父亲55岁确诊），这是重要的遗传风险因素。
-
-3. **建议检查**：
-   - 空腹血糖检测
-   - 糖化血红蛋白（HbA1c）
-   - 口服葡萄糖耐量试验（如需要）
-
-4. **即时建议**：
-   - 注意观察是否有其他糖尿病症状（多饮、多尿、体重下降）
-   - 保持规律作息，避免过度劳累
-   - 适量运动，控制饮食
-
-请尽快到医院进行相关检查，以便早期发现和干预。如有紧急情况，请及时就医。
-        """.strip()
-        
-        return base_response
+        return DOCTOR_RESPONSE_TMPL.format_map(self._template_fields)
     
     def _execute_graph_update(self, qwen_decision, entities):
         """执行图谱更新"""
         if qwen_decision.action == UpdateAction.CREATE_DIABETES_RELATION:
-            print(f"  🌱 执行糖尿病关系创建...")
+            self._progress(f"  🌱 执行糖尿病关系创建...")
             
             execution_result = self.qwen_engine.execute_diabetes_relation_creation(
                 symptoms=["乏力"],
@@ -266,23 +406,26 @@ class OnlineConsultDiabetesFatigueDemo:
             )
             
             if execution_result["success"]:
-                print(f"    ✅ 图谱更新成功:")
+                self._out(f"    ✅ 图谱更新成功:")
                 for entity in execution_result.get("created_entities", []):
-                    print(f"      ➕ 创建{entity['type']}: {entity['name']}")
+                    self._out(f"      ➕ 创建{entity['type']}: {entity['name']}")
                 for entity in execution_result.get("updated_entities", []):
-                    print(f"      🔄 更新{entity['type']}: {entity['name']}")
+                    self._out(f"      🔄 更新{entity['type']}: {entity['name']}")
                 for relation in execution_result.get("created_relations", []):
-                    print(f"      🔗 创建关系: {relation['disease']} → {relation['symptom']} (置信度: {relation['confidence']}, 来源: {relation.get('source', 'N/A')})")
+                    self._out(f"      🔗 创建关系: {relation['disease']} → {relation['symptom']} (置信度: {relation['confidence']}, 来源: {relation.get('source', 'N/A')})")
             else:
-                print(f"    ❌ 图谱更新失败: {execution_result.get('errors', 'Unknown error')}")
+                self._out(f"    ❌ 图谱更新失败: {execution_result.get('errors', 'Unknown error')}")
         
         elif qwen_decision.action == UpdateAction.CREATE_NEW:
-            print(f"  🆕 创建新的疾病-症状关系...")
+            self._out(f"  🆕 创建新的疾病-症状关系...")
             # 实现创建新关系的逻辑
             pass
         
         else:
-            print(f"  ⏳ 暂不执行图谱更新，等待更多信息")
+            self._out(f"  ⏳ 暂不执行图谱更新，等待更多信息")
+        
+        # 图谱可能已更新：之后的来源标记与结果汇总重新读取关系
+        self.graph_manager.invalidate_cache()
     
     def _add_source_record(self):
         """添加来源记录到图谱"""
@@ -294,53 +437,46 @@ class OnlineConsultDiabetesFatigueDemo:
             
             if recent_relations:
                 relation = recent_relations[-1]  # 获取最新的关系
-                print(f"  ✅ 关系来源已标记为: online_consult (关系ID: {relation.get('id', 'N/A')})")
+                self._out(f"  ✅ 关系来源已标记为: online_consult (关系ID: {relation.get('id', 'N/A')})")
         except Exception as e:
-            print(f"  ⚠️ 添加来源标记时出现警告: {e}")
+            self._out(f"  ⚠️ 添加来源标记时出现警告: {e}")
     
     def _display_final_results(self):
         """显示最终结果"""
-        print(f"\n📊 在线咨询结果汇总")
-        print("=" * 50)
+        self._out(f"\n📊 在线咨询结果汇总")
+        self._out("=" * 50)
         
         # 记忆状态
         memory_stats = self.memory_manager.get_memory_stats()
-        print(f"💭 记忆系统状态:")
-        print(f"  短期记忆: {memory_stats['short_term_count']}条")
-        print(f"  工作记忆: {memory_stats['working_memory_size']}项")
+        self._out(f"💭 记忆系统状态:")
+        self._out(f"  短期记忆: {memory_stats['short_term_count']}条")
+        self._out(f"  工作记忆: {memory_stats['working_memory_size']}项")
         
         # 图谱状态
         diabetes_data = self.graph_manager.get_diabetes_related_data(user_id=self.user_id)
-        print(f"\n🕸️ 知识图谱状态:")
-        print(f"  糖尿病疾病实体: {len(diabetes_data['diseases'])}个")
-        print(f"  相关症状实体: {len(diabetes_data['symptoms'])}个")
-        print(f"  疾病-症状关系: {len(diabetes_data['disease_symptom_relations'])}条")
+        self._out(f"\n🕸️ 知识图谱状态:")
+        self._out(f"  糖尿病疾病实体: {len(diabetes_data['diseases'])}个")
+        self._out(f"  相关症状实体: {len(diabetes_data['symptoms'])}个")
+        self._out(f"  疾病-症状关系: {len(diabetes_data['disease_symptom_relations'])}条")
         
         # 显示具体关系
         if diabetes_data['disease_symptom_relations']:
-            print(f"\n🔗 建立的糖尿病关系:")
+            self._out(f"\n🔗 建立的糖尿病关系:")
             for rel in diabetes_data['disease_symptom_relations']:
                 source_info = f" (来源: {rel.get('source', 'N/A')})" if rel.get('source') else ""
-                print(f"  • {rel['disease_name']} → {rel['symptom_name']} (置信度: {rel['confidence']:.2f}){source_info}")
+                self._out(f"  • {rel['disease_name']} → {rel['symptom_name']} (置信度: {rel['confidence']:.2f}){source_info}")
         
         # 显示患者关键信息
-        print(f"\n👤 患者关键信息总结:")
-        print(f"  姓名: {self.patient_info['name']}")
-        print(f"  年龄: {self.patient_info['age']}岁")
-        print(f"  家族史: {self.patient_info['family_history']}")
-        print(f"  过敏史: {self.patient_info['allergy']}")
-        print(f"  本次症状: 乏力")
-        print(f"  咨询来源: online_consult")
-        print(f"  风险评估: 糖尿病中高风险")
-        
-        print(f"\n✅ 在线咨询糖尿病乏力症状案例演示完成！")
-        print(f"📋 已成功建立基于online_consult来源的糖尿病-乏力症状关联")
+        self._out(PATIENT_SUMMARY_TMPL.format_map(self._template_fields))
+        
+        self._out(f"\n✅ 在线咨询糖尿病乏力症状案例演示完成！")
+        self._out(f"📋 已成功建立基于online_consult来源的糖尿病-乏力症状关联")
     
     def run_demo(self):
         """运行完整演示"""
-        print("🎬 在线咨询糖尿病乏力症状完整演示")
-        print("基于Memory-X智能记忆管理系统")
-        print("="*80)
+        self._out("🎬 在线咨询糖尿病乏力症状完整演示")
+        self._out("基于Memory-X智能记忆管理系统")
+        self._out("="*80)
         
         try:
             # 执行在线咨询场景
@@ -350,9 +486,12 @@ class OnlineConsultDiabetesFatigueDemo:
             self._generate_demo_report()
             
         except Exception as e:
-            print(f"❌ 演示过程中出现错误: {e}")
+            self._out(f"❌ 演示过程中出现错误: {e}")
+            self._flush()
             import traceback
             traceback.print_exc()
+        finally:
+            self._flush()
     
     def _generate_demo_report(self):
         """生成演示报告"""
@@ -366,14 +505,14 @@ class OnlineConsultDiabetesFatigueDemo:
             "ai_analysis": "成功建立糖尿病-乏力症状关联",
             "graph_updates": "创建糖尿病疾病实体和乏力症状实体，建立高置信度关联关系",
             "memory_records": len(self.memory_manager.short_term_memory),
-            "timestamp": datetime.now().isoformat()
+            "timestamp": self.consult_time.isoformat(),
+            "elapsed_ms": self._elapsed_ms()
         }
         
-        report_path = "/Users/louisliu/.cursor/memory-x/online_consult_diabetes_report.json"
-        with open(report_path, 'w', encoding='utf-8') as f:
-            json.dump(report, f, ensure_ascii=False, indent=2, default=str)
+        self._ensure_parent_dir(REPORT_PATH)
+        write_report(REPORT_PATH, report)
         
-        print(f"\n📄 演示报告已保存: {report_path}")
+        self._out(f"\n📄 演示报告已保存: {REPORT_PATH}（耗时 {report['elapsed_ms']:.0f} ms）")
 
 
 def main():
@@ -384,11 +523,12 @@ def main():
     parser.add_argument("--api-key", default=os.getenv('DASHSCOPE_API_KEY'), 
                        help="DashScope API密钥")
     parser.add_argument("--db-path", help="数据库路径")
+    parser.add_argument("--verbose-live", action="store_true", help="实时打印进度提示")
     
     args = parser.parse_args()
     
     # 运行演示
-    demo = OnlineConsultDiabetesFatigueDemo(args.api_key, args.db_path)
+    demo = OnlineConsultDiabetesFatigueDemo(args.api_key, args.db_path, verbose_live=args.verbose_live)
     demo.run_demo()
 
 
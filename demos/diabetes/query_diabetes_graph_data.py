@@ -3,27 +3,134 @@
 查询糖尿病图谱数据 - 专注数据展示
 """
 
+import io
 import sqlite3
-import os
+import sys
 import json
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from pathlib import Path
 
-def query_single_database(db_path: str):
-    """查询单个数据库的糖尿病数据"""
-    if not os.path.exists(db_path):
-        return None
+try:
+    import orjson
+except ImportError:  # orjson 未安装时退回标准库 json
+    orjson = None
+
+# 名称查询与关系连接使用的索引：索引名 -> (表, 列定义)
+NAME_INDEXES = {
+    'idx_diseases_name': ('diseases', 'name COLLATE NOCASE'),
+    'idx_symptoms_name': ('symptoms', 'name COLLATE NOCASE'),
+    'idx_medicines_name': ('medicines', 'name COLLATE NOCASE'),
+    'idx_dsr_disease_id': ('disease_symptom_relations', 'disease_id'),
+    'idx_dsr_symptom_id': ('disease_symptom_relations', 'symptom_id'),
+    # 覆盖索引：关系连接只需读索引即可取得置信度
+    'idx_dsr_disease_symptom_confidence': ('disease_symptom_relations', 'disease_id, symptom_id, confidence'),
+}
+
+# 各实体表的名称关键词
+KEYWORDS = {
+    'diseases': ('糖尿病', 'diabetes', '血糖'),
+    'symptoms': ('糖尿病', '血糖', '胰岛素'),
+    'medicines': ('胰岛素', '血糖', '糖尿病'),
+}
+RELATION_SYMPTOM_KEYWORDS = ('糖尿病', '血糖')
+
+# 各实体表查询的列；合并查询时缺失的列以 NULL 补齐
+ENTITY_COLUMNS = {
+    'diseases': ('id', 'name', 'category', 'severity', 'user_id', 'created_time'),
+    'symptoms': ('id', 'name', 'severity', 'user_id', 'created_time'),
+    'medicines': ('id', 'name', 'type', 'user_id', 'created_time'),
+}
+ENTITY_UNION_COLUMNS = tuple(dict.fromkeys(col for cols in ENTITY_COLUMNS.values() for col in cols))
+
+REPORT_PATH = Path("/Users/louisliu/.cursor/memory-x/diabetes_query_report.json")
+
+# 流式读取时每批取回的行数
+FETCH_BATCH = 1000
+
+# 小于 SQLite 最小页大小的文件不可能含有表，无需打开
+MIN_DB_SIZE = 512
+
+
+def ensure_diabetes_indexes(conn, tables, schema='main'):
+    """建立名称/关系索引；有新建时执行一次 ANALYZE，返回更新后的表名集合"""
+    existing = {row[0] for row in conn.execute(f"SELECT name FROM {schema}.sqlite_master")}
+    created = False
+    for index_name, (table, columns) in NAME_INDEXES.items():
+        if table in tables and index_name not in existing:
+            conn.execute(f"CREATE INDEX IF NOT EXISTS {schema}.{index_name} ON {table} ({columns})")
+            created = True
     
-    print(f"\n📊 查询数据库: {os.path.basename(db_path)}")
-    print("-" * 50)
+    if created:
+        conn.execute(f"ANALYZE {schema}")
+    conn.commit()
+    return {row[0] for row in conn.execute(f"SELECT name FROM {schema}.sqlite_master WHERE type='table'")}
+
+
+def readonly_uri(db_path):
+    """只读且不可变的 URI：immutable=1 让 SQLite 跳过锁和日志检查"""
+    return f"{Path(db_path).resolve().as_uri()}?mode=ro&immutable=1"
+
+
+def prepare_database(db_path):
+    """查询前的一次性可写准备
+
+    建立索引，并把 WAL 中的内容合并回主文件——immutable 只读打开不会读取 -wal 文件。
+    """
+    conn = sqlite3.connect(db_path)
+    try:
+        tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+        ensure_diabetes_indexes(conn, tables)
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    finally:
+        conn.close()
+
+
+def stream(cursor, batch=FETCH_BATCH):
+    """分批取行的生成器，避免一次性物化整个结果集"""
+    while rows := cursor.fetchmany(batch):
+        yield from rows
+
+
+def stream_dicts(cursor):
+    """把流式读取的 sqlite3.Row 转为字典"""
+    return [dict(row) for row in stream(cursor)]
+
+
+def keyword_filter(keywords):
+    """名称关键词过滤，返回 (条件SQL, 参数)：关键词作为绑定参数传入 LIKE"""
+    return " OR ".join("name LIKE ?" for _ in keywords), [f"%{k}%" for k in keywords]
+
+
+def iter_existing(paths):
+    """每个路径只 stat 一次，产出 (路径, 文件大小)；跳过不存在或不足一页的文件"""
+    for path in paths:
+        try:
+            size = path.stat().st_size
+        except FileNotFoundError:
+            continue
+        if size >= MIN_DB_SIZE:
+            yield path, size
+
+
+def query_single_database(db_path: Path, log=print):
+    """查询单个已存在数据库的糖尿病数据（由 iter_existing 过滤）；输出经由 log，便于并行查询时按库收集"""
+    log(f"\n📊 查询数据库: {db_path.name}")
+    log("-" * 50)
     
     try:
-        conn = sqlite3.connect(db_path)
+        # 索引与 WAL 合并只需一次可写连接，之后的查询都走只读连接
+        prepare_database(db_path)
+        conn = sqlite3.connect(readonly_uri(db_path), uri=True)
+        conn.row_factory = sqlite3.Row
         cursor = conn.cursor()
+        cursor.arraysize = FETCH_BATCH
         
         # 获取表信息
         cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
-        tables = [row[0] for row in cursor.fetchall()]
-        print(f"📋 包含表: {', '.join(tables)}")
+        tables = [row['name'] for row in cursor.fetchall()]
+        log(f"📋 包含表: {', '.join(tables)}")
+        tables = set(tables)
         
         diabetes_data = {
             'diseases': [],
@@ -32,145 +139,114 @@ def query_single_database(db_path: str):
             'disease_symptom_relations': []
         }
         
-        # 查询糖尿病疾病实体
-        if 'diseases' in tables:
-            cursor.execute("""
-                SELECT id, name, category, severity, user_id, created_time 
-                FROM diseases 
-                WHERE name LIKE '%糖尿病%' OR name LIKE '%diabetes%' OR name LIKE '%血糖%'
-            """)
-            for row in cursor.fetchall():
-                diabetes_data['diseases'].append({
-                    'id': row[0],
-                    'name': row[1],
-                    'category': row[2] if len(row) > 2 else None,
-                    'severity': row[3] if len(row) > 3 else None,
-                    'user_id': row[4] if len(row) > 4 else None,
-                    'created_time': row[5] if len(row) > 5 else None
-                })
+        # 三类实体合并为一条带标签列的语句：一次解析、一次绑定、一次遍历
+        branches, params = [], []
+        for table, columns in ENTITY_COLUMNS.items():
+            if table not in tables:
+                continue
+            condition, table_params = keyword_filter(KEYWORDS[table])
+            select = ", ".join(col if col in columns else f"NULL AS {col}" for col in ENTITY_UNION_COLUMNS)
+            branches.append(f"SELECT '{table}' AS tag, {select} FROM {table} WHERE {condition}")
+            params.extend(table_params)
         
-        # 查询相关症状
-        if 'symptoms' in tables:
-            cursor.execute("""
-                SELECT id, name, severity, user_id, created_time 
-                FROM symptoms 
-                WHERE name LIKE '%糖尿病%' OR name LIKE '%血糖%' OR name LIKE '%胰岛素%'
-            """)
-            for row in cursor.fetchall():
-                diabetes_data['symptoms'].append({
-                    'id': row[0],
-                    'name': row[1],
-                    'severity': row[2] if len(row) > 2 else None,
-                    'user_id': row[3] if len(row) > 3 else None,
-                    'created_time': row[4] if len(row) > 4 else None
-                })
-        
-        # 查询相关药物
-        if 'medicines' in tables:
-            cursor.execute("""
-                SELECT id, name, type, user_id, created_time 
-                FROM medicines 
-                WHERE name LIKE '%胰岛素%' OR name LIKE '%血糖%' OR name LIKE '%糖尿病%'
-            """)
-            for row in cursor.fetchall():
-                diabetes_data['medicines'].append({
-                    'id': row[0],
-                    'name': row[1],
-                    'type': row[2] if len(row) > 2 else None,
-                    'user_id': row[3] if len(row) > 3 else None,
-                    'created_time': row[4] if len(row) > 4 else None
-                })
+        if branches:
+            cursor.execute(" UNION ALL ".join(branches), params)
+            for row in stream(cursor):
+                diabetes_data[row['tag']].append({col: row[col] for col in ENTITY_COLUMNS[row['tag']]})
         
         # 查询疾病-症状关系
         if 'disease_symptom_relations' in tables:
-            cursor.execute("""
+            disease_condition, disease_params = keyword_filter(KEYWORDS['diseases'])
+            symptom_condition, symptom_params = keyword_filter(RELATION_SYMPTOM_KEYWORDS)
+            cursor.execute(f"""
                 SELECT dsr.id, dsr.disease_id, dsr.symptom_id, dsr.confidence, dsr.user_id, dsr.created_time,
                        d.name as disease_name, s.name as symptom_name
                 FROM disease_symptom_relations dsr
                 LEFT JOIN diseases d ON dsr.disease_id = d.id
                 LEFT JOIN symptoms s ON dsr.symptom_id = s.id
-                WHERE d.name LIKE '%糖尿病%' OR d.name LIKE '%diabetes%' OR d.name LIKE '%血糖%'
-                   OR s.name LIKE '%糖尿病%' OR s.name LIKE '%血糖%'
-            """)
-            for row in cursor.fetchall():
-                diabetes_data['disease_symptom_relations'].append({
-                    'id': row[0],
-                    'disease_id': row[1],
-                    'symptom_id': row[2],
-                    'confidence': row[3],
-                    'user_id': row[4],
-                    'created_time': row[5],
-                    'disease_name': row[6],
-                    'symptom_name': row[7]
-                })
+                WHERE dsr.disease_id IN (SELECT id FROM diseases WHERE {disease_condition})
+                   OR dsr.symptom_id IN (SELECT id FROM symptoms WHERE {symptom_condition})
+            """, disease_params + symptom_params)
+            diabetes_data['disease_symptom_relations'] = stream_dicts(cursor)
         
         # 显示结果
         total_items = (len(diabetes_data['diseases']) + len(diabetes_data['symptoms']) + 
                       len(diabetes_data['medicines']) + len(diabetes_data['disease_symptom_relations']))
         
         if total_items > 0:
-            print(f"✅ 发现糖尿病数据: {total_items}项")
+            log(f"✅ 发现糖尿病数据: {total_items}项")
             
             if diabetes_data['diseases']:
-                print(f"\n🏥 疾病实体 ({len(diabetes_data['diseases'])}个):")
+                log(f"\n🏥 疾病实体 ({len(diabetes_data['diseases'])}个):")
                 for disease in diabetes_data['diseases']:
-                    print(f"  • {disease['name']} (ID: {disease['id']})")
+                    log(f"  • {disease['name']} (ID: {disease['id']})")
                     if disease['user_id']:
-                        print(f"    用户: {disease['user_id']}")
+                        log(f"    用户: {disease['user_id']}")
                     if disease['category']:
-                        print(f"    类别: {disease['category']}")
+                        log(f"    类别: {disease['category']}")
                     if disease['severity']:
-                        print(f"    严重程度: {disease['severity']}")
+                        log(f"    严重程度: {disease['severity']}")
             
             if diabetes_data['symptoms']:
-                print(f"\n🤒 症状实体 ({len(diabetes_data['symptoms'])}个):")
+                log(f"\n🤒 症状实体 ({len(diabetes_data['symptoms'])}个):")
                 for symptom in diabetes_data['symptoms']:
-                    print(f"  • {symptom['name']} (ID: {symptom['id']})")
+                    log(f"  • {symptom['name']} (ID: {symptom['id']})")
                     if symptom['user_id']:
-                        print(f"    用户: {symptom['user_id']}")
+                        log(f"    用户: {symptom['user_id']}")
                     if symptom['severity']:
-                        print(f"    严重程度: {symptom['severity']}")
+                        log(f"    严重程度: {symptom['severity']}")
             
             if diabetes_data['medicines']:
-                print(f"\n💊 药物实体 ({len(diabetes_data['medicines'])}个):")
+                log(f"\n💊 药物实体 ({len(diabetes_data['medicines'])}个):")
                 for medicine in diabetes_data['medicines']:
-                    print(f"  • {medicine['name']} (ID: {medicine['id']})")
+                    log(f"  • {medicine['name']} (ID: {medicine['id']})")
                     if medicine['user_id']:
-                        print(f"    用户: {medicine['user_id']}")
+                        log(f"    用户: {medicine['user_id']}")
                     if medicine['type']:
-                        print(f"    类型: {medicine['type']}")
+                        log(f"    类型: {medicine['type']}")
             
             if diabetes_data['disease_symptom_relations']:
-                print(f"\n🔗 疾病-症状关系 ({len(diabetes_data['disease_symptom_relations'])}条):")
+                log(f"\n🔗 疾病-症状关系 ({len(diabetes_data['disease_symptom_relations'])}条):")
                 for rel in diabetes_data['disease_symptom_relations']:
-                    print(f"  • {rel['disease_name']} → {rel['symptom_name']}")
-                    print(f"    置信度: {rel['confidence']}")
+                    log(f"  • {rel['disease_name']} → {rel['symptom_name']}")
+                    log(f"    置信度: {rel['confidence']}")
                     if rel['user_id']:
-                        print(f"    用户: {rel['user_id']}")
+                        log(f"    用户: {rel['user_id']}")
         else:
-            print("⚪ 无糖尿病相关数据")
+            log("⚪ 无糖尿病相关数据")
         
         conn.close()
         return diabetes_data
         
     except Exception as e:
-        print(f"❌ 查询出错: {e}")
+        log(f"❌ 查询出错: {e}")
         return None
 
+def write_report(report_path, report):
+    """写出JSON报告：优先用 orjson 直接生成字节流"""
+    if orjson is None:
+        with open(report_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2, default=str)
+        return
+    Path(report_path).write_bytes(orjson.dumps(report, default=str, option=orjson.OPT_INDENT_2))
+
+
 def main():
     """主查询函数"""
     print("🔍 糖尿病图谱数据查询")
     print("=" * 60)
     
     # 要查询的数据库列表（按重要性排序）
-    databases = [
+    databases = [Path(p) for p in [
         "/Users/louisliu/.cursor/memory-x/data/demo_medical_graph.db",
         "/Users/louisliu/.cursor/memory-x/data/diabetes_test.db", 
         "/Users/louisliu/.cursor/memory-x/data/diabetes_scenario_demo.db",
         "/Users/louisliu/.cursor/memory-x/data/enhanced_qwen_demo.db",
         "/Users/louisliu/.cursor/memory-x/examples/data/demo_medical_graph.db",
         "/Users/louisliu/.cursor/memory-x/data/update_demo.db"
-    ]
+    ]]
+    existing = [path for path, _ in iter_existing(databases)]
+    REPORT_PATH.parent.mkdir(parents=True, exist_ok=True)
     
     all_data = {}
     total_stats = {
@@ -182,9 +258,19 @@ def main():
         'total_relations': 0
     }
     
-    for db_path in databases:
-        total_stats['databases_checked'] += 1
-        result = query_single_database(db_path)
+    # 各库独立且以 I/O 为主（sqlite3 在 C 调用期间释放 GIL），用线程池并行查询；
+    # 每个库的输出先写入各自的缓冲区，全部完成后按列表顺序打印，保证日志顺序确定
+    def scan(db_path):
+        buffer = io.StringIO()
+        result = query_single_database(db_path, log=lambda *args: print(*args, file=buffer))
+        return buffer.getvalue(), result
+    
+    with ThreadPoolExecutor(max_workers=max(1, min(6, len(existing)))) as executor:
+        scans = list(executor.map(scan, existing))
+    
+    total_stats['databases_checked'] = len(databases)
+    for db_path, (output, result) in zip(existing, scans):
+        sys.stdout.write(output)
         
         if result and any(len(v) > 0 for v in result.values()):
             total_stats['databases_with_data'] += 1
@@ -193,7 +279,7 @@ def main():
             total_stats['total_medicines'] += len(result['medicines'])
             total_stats['total_relations'] += len(result['disease_symptom_relations'])
             
-            all_data[os.path.basename(db_path)] = result
+            all_data[db_path.name] = result
     
     # 汇总报告
     print(f"\n📊 糖尿病数据汇总报告")
@@ -226,11 +312,9 @@ def main():
         'detailed_data': all_data
     }
     
-    report_path = "/Users/louisliu/.cursor/memory-x/diabetes_query_report.json"
-    with open(report_path, 'w', encoding='utf-8') as f:
-        json.dump(report, f, ensure_ascii=False, indent=2, default=str)
+    write_report(REPORT_PATH, report)
     
-    print(f"\n📄 详细报告已保存: {report_path}")
+    print(f"\n📄 详细报告已保存: {REPORT_PATH}")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -4,95 +4,70 @@
 """
 
 import sqlite3
-import os
+from pathlib import Path
 
-def simple_query():
-    """简化查询糖尿病数据"""
-    print("🔍 糖尿病图谱数据查询")
-    print("=" * 50)
-    
-    databases = [
-        "/Users/louisliu/.cursor/memory-x/data/demo_medical_graph.db",
-        "/Users/louisliu/.cursor/memory-x/examples/data/demo_medical_graph.db", 
-        "/Users/louisliu/.cursor/memory-x/data/diabetes_test.db",
-        "/Users/louisliu/.cursor/memory-x/data/diabetes_scenario_demo.db",
-        "/Users/louisliu/.cursor/memory-x/data/enhanced_qwen_demo.db",
-        "/Users/louisliu/.cursor/memory-x/data/update_demo.db"
+from query_diabetes_graph_data import iter_existing, prepare_database, readonly_uri, stream
+
+DISEASE_CONDITION = "name LIKE '%糖尿病%' OR name LIKE '%diabetes%'"
+ENTITY_CONDITIONS = {
+    'diseases': DISEASE_CONDITION,
+    'symptoms': "name LIKE '%头晕%' OR name LIKE '%口渴%' OR name LIKE '%血糖%'",
+    'medicines': "name LIKE '%胰岛素%'",
+}
+
+
+def _union_query(conn, schemas, required_tables, build_select):
+    """对包含所需表的附加库执行一次 UNION ALL 查询，按来源库（首列）分桶"""
+    branches = [
+        build_select(schema, tables)
+        for schema, (_, tables) in schemas.items()
+        if all(table in tables for table in required_tables)
     ]
+    branches = [branch for branch in branches if branch]
+    buckets = {}
+    if not branches:
+        return buckets
+    for row in stream(conn.execute(" UNION ALL ".join(branches))):
+        buckets.setdefault(row[0], []).append(row[1:])
+    return buckets
+
+
+def _aggregate_stats(conn, schemas):
+    """只统计数量：每个附加库一行计数子查询，UNION ALL 后在 SQL 中求和，一次往返得到全局统计"""
+    def count(schema, tables, table, condition):
+        if table not in tables:
+            return "0"
+        return f"(SELECT COUNT(*) FROM {schema}.{table} WHERE {condition})"
     
-    global_stats = {
-        'total_diseases': 0,
-        'total_symptoms': 0,
-        'total_medicines': 0,
-        'total_relations': 0
-    }
-    
-    for db_path in databases:
-        if not os.path.exists(db_path):
-            continue
-            
-        db_name = os.path.basename(db_path)
-        print(f"\n📊 {db_name}")
-        print("-" * 30)
-        
-        try:
-            conn = sqlite3.connect(db_path)
-            cursor = conn.cursor()
-            
-            # 查询疾病
-            cursor.execute("SELECT id, name FROM diseases WHERE name LIKE '%糖尿病%' OR name LIKE '%diabetes%'")
-            diseases = cursor.fetchall()
-            
-            if diseases:
-                print(f"🏥 疾病实体 ({len(diseases)}个):")
-                for disease_id, disease_name in diseases:
-                    print(f"  • {disease_name} (ID: {disease_id})")
-                global_stats['total_diseases'] += len(diseases)
-            
-            # 查询症状
-            cursor.execute("SELECT id, name FROM symptoms WHERE name LIKE '%头晕%' OR name LIKE '%口渴%' OR name LIKE '%血糖%'")
-            symptoms = cursor.fetchall()
-            
-            if symptoms:
-                print(f"🤒 相关症状 ({len(symptoms)}个):")
-                for symptom_id, symptom_name in symptoms:
-                    print(f"  • {symptom_name} (ID: {symptom_id})")
-                global_stats['total_symptoms'] += len(symptoms)
-            
-            # 查询药物
-            cursor.execute("SELECT id, name FROM medicines WHERE name LIKE '%胰岛素%'")
-            medicines = cursor.fetchall()
-            
-            if medicines:
-                print(f"💊 相关药物 ({len(medicines)}个):")
-                for med_id, med_name in medicines:
-                    print(f"  • {med_name} (ID: {med_id})")
-                global_stats['total_medicines'] += len(medicines)
-            
-            # 查询疾病-症状关系
-            cursor.execute("""
-                SELECT dsr.id, d.name as disease_name, s.name as symptom_name, dsr.confidence
-                FROM disease_symptom_relations dsr
-                JOIN diseases d ON dsr.disease_id = d.id
-                JOIN symptoms s ON dsr.symptom_id = s.id
-                WHERE d.name LIKE '%糖尿病%' OR d.name LIKE '%diabetes%'
-            """)
-            relations = cursor.fetchall()
-            
-            if relations:
-                print(f"🔗 疾病-症状关系 ({len(relations)}条):")
-                for rel_id, disease_name, symptom_name, confidence in relations:
-                    print(f"  • {disease_name} → {symptom_name} (置信度: {confidence})")
-                global_stats['total_relations'] += len(relations)
-            
-            if not (diseases or symptoms or medicines or relations):
-                print("⚪ 无糖尿病相关数据")
-            
-            conn.close()
-            
-        except Exception as e:
-            print(f"❌ 查询错误: {e}")
+    def count_relations(schema, tables):
+        if not all(table in tables for table in ('disease_symptom_relations', 'diseases', 'symptoms')):
+            return "0"
+        return f"""(SELECT COUNT(*) FROM {schema}.disease_symptom_relations dsr
+            JOIN {schema}.diseases d ON dsr.disease_id = d.id
+            JOIN {schema}.symptoms s ON dsr.symptom_id = s.id
+            WHERE dsr.disease_id IN (SELECT id FROM {schema}.diseases WHERE {DISEASE_CONDITION}))"""
     
+    branches = [
+        "SELECT " + ", ".join(
+            f"{expr} AS c{i}"
+            for i, expr in enumerate(
+                [count(schema, tables, table, condition) for table, condition in ENTITY_CONDITIONS.items()]
+                + [count_relations(schema, tables)],
+                1,
+            )
+        )
+        for schema, (_, tables) in schemas.items()
+    ]
+    totals = (0, 0, 0, 0)
+    if branches:
+        totals = conn.execute(
+            "SELECT TOTAL(c1), TOTAL(c2), TOTAL(c3), TOTAL(c4) FROM (" + " UNION ALL ".join(branches) + ")"
+        ).fetchone()
+    return dict(zip(('total_diseases', 'total_symptoms', 'total_medicines', 'total_relations'), map(int, totals)))
+
+
+def _print_global_stats(global_stats):
+    """打印全局统计与结论"""
     print(f"\n🌍 全局统计")
     print("=" * 50)
     print(f"🏥 糖尿病疾病实体: {global_stats['total_diseases']}个")
@@ -112,5 +87,114 @@ def simple_query():
     else:
         print(f"\n💭 未发现糖尿病图谱数据")
 
+
+def simple_query(stats_only: bool = False):
+    """简化查询糖尿病数据；stats_only 时只在 SQL 中计数，不取回实体行"""
+    print("🔍 糖尿病图谱数据查询")
+    print("=" * 50)
+    
+    databases = [Path(p) for p in [
+        "/Users/louisliu/.cursor/memory-x/data/demo_medical_graph.db",
+        "/Users/louisliu/.cursor/memory-x/examples/data/demo_medical_graph.db", 
+        "/Users/louisliu/.cursor/memory-x/data/diabetes_test.db",
+        "/Users/louisliu/.cursor/memory-x/data/diabetes_scenario_demo.db",
+        "/Users/louisliu/.cursor/memory-x/data/enhanced_qwen_demo.db",
+        "/Users/louisliu/.cursor/memory-x/data/update_demo.db"
+    ]]
+    
+    global_stats = {
+        'total_diseases': 0,
+        'total_symptoms': 0,
+        'total_medicines': 0,
+        'total_relations': 0
+    }
+    
+    # 所有数据库附加到同一个连接，每类数据只执行一次 UNION ALL 查询
+    conn = sqlite3.connect(':memory:', uri=True)
+    conn.row_factory = sqlite3.Row
+    schemas = {}  # 附加别名 -> (数据库文件名, 表名集合)
+    try:
+        for index, (db_path, _) in enumerate(iter_existing(databases)):
+            schema = f"db{index}"
+            try:
+                # 先用可写连接建好索引，再以只读不可变方式附加
+                prepare_database(db_path)
+                conn.execute(f"ATTACH DATABASE ? AS {schema}", (readonly_uri(db_path),))
+                tables = {row['name'] for row in conn.execute(f"SELECT name FROM {schema}.sqlite_master WHERE type='table'")}
+                schemas[schema] = (db_path.name, tables)
+            except Exception as e:
+                print(f"❌ 附加数据库失败 {db_path.name}: {e}")
+        
+        if stats_only:
+            _print_global_stats(_aggregate_stats(conn, schemas))
+            return
+        
+        # 三类实体共用 (id, name) 列，合并为一条带表名标签的语句，一次遍历分桶
+        entities = _union_query(conn, schemas, (), lambda schema, tables: " UNION ALL ".join(
+            f"SELECT '{schema}', '{table}', id, name FROM {schema}.{table} "
+            f"WHERE {condition}"
+            for table, condition in ENTITY_CONDITIONS.items() if table in tables
+        ))
+        diseases, symptoms, medicines = {}, {}, {}
+        entity_buckets = {'diseases': diseases, 'symptoms': symptoms, 'medicines': medicines}
+        for schema, rows in entities.items():
+            for table, *row in rows:
+                entity_buckets[table].setdefault(schema, []).append(tuple(row))
+        relations = _union_query(conn, schemas, ('disease_symptom_relations', 'diseases', 'symptoms'), lambda schema, tables: f"""
+            SELECT '{schema}', dsr.id, d.name as disease_name, s.name as symptom_name, dsr.confidence
+            FROM {schema}.disease_symptom_relations dsr
+            JOIN {schema}.diseases d ON dsr.disease_id = d.id
+            JOIN {schema}.symptoms s ON dsr.symptom_id = s.id
+            WHERE dsr.disease_id IN (SELECT id FROM {schema}.diseases WHERE {DISEASE_CONDITION})
+        """)
+    except Exception as e:
+        print(f"❌ 查询错误: {e}")
+        diseases = symptoms = medicines = relations = {}
+    finally:
+        for schema in schemas:
+            conn.execute(f"DETACH DATABASE {schema}")
+        conn.close()
+    
+    for schema, (db_name, _) in schemas.items():
+        print(f"\n📊 {db_name}")
+        print("-" * 30)
+        
+        db_diseases = diseases.get(schema, [])
+        if db_diseases:
+            print(f"🏥 疾病实体 ({len(db_diseases)}个):")
+            for disease_id, disease_name in db_diseases:
+                print(f"  • {disease_name} (ID: {disease_id})")
+            global_stats['total_diseases'] += len(db_diseases)
+        
+        db_symptoms = symptoms.get(schema, [])
+        if db_symptoms:
+            print(f"🤒 相关症状 ({len(db_symptoms)}个):")
+            for symptom_id, symptom_name in db_symptoms:
+                print(f"  • {symptom_name} (ID: {symptom_id})")
+            global_stats['total_symptoms'] += len(db_symptoms)
+        
+        db_medicines = medicines.get(schema, [])
+        if db_medicines:
+            print(f"💊 相关药物 ({len(db_medicines)}个):")
+            for med_id, med_name in db_medicines:
+                print(f"  • {med_name} (ID: {med_id})")
+            global_stats['total_medicines'] += len(db_medicines)
+        
+        db_relations = relations.get(schema, [])
+        if db_relations:
+            print(f"🔗 疾病-症状关系 ({len(db_relations)}条):")
+            for rel_id, disease_name, symptom_name, confidence in db_relations:
+                print(f"  • {disease_name} → {symptom_name} (置信度: {confidence})")
+            global_stats['total_relations'] += len(db_relations)
+        
+        if not (db_diseases or db_symptoms or db_medicines or db_relations):
+            print("⚪ 无糖尿病相关数据")
+    
+    _print_global_stats(global_stats)
+
 if __name__ == "__main__":
-    simple_query()
\ No newline at end of file
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="简化糖尿病图谱数据查询")
+    parser.add_argument("--stats-only", action="store_true", help="只输出全局统计，不列出实体")
+    simple_query(stats_only=parser.parse_args().stats_only)
\ No newline at end of file
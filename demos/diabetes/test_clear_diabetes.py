@@ -7,14 +7,18 @@ import os
 import sys
 sys.path.append('/Users/louisliu/.cursor/memory-x')
 
-from examples.enhanced_qwen_graph_demo import EnhancedQwenGraphDemo
+from examples.enhanced_qwen_graph_demo import get_cached_demo
+from src.core.memory_manager import diabetes_flags
+
+# 启动时读取一次 API 密钥；未设置时立即报错，而不是带着占位密钥去请求接口
+_API_KEY = os.environ['DASHSCOPE_API_KEY']
 
 def test_clear_diabetes_memories():
     print("🧪 测试删除糖尿病相关记忆功能")
     print("=" * 50)
     
-    # 初始化演示系统
-    demo = EnhancedQwenGraphDemo(os.getenv('DASHSCOPE_API_KEY') or "请设置DASHSCOPE_API_KEY环境变量")
+    # 获取演示系统（同一进程内的多个测试共用一个实例）
+    demo = get_cached_demo(_API_KEY)
     
     # 查看删除前的统计
     before_stats = demo.memory_manager.get_memory_stats()
@@ -24,41 +28,20 @@ def test_clear_diabetes_memories():
     
     # 显示短期记忆内容
     print(f"\n📋 当前短期记忆内容:")
-    diabetes_related_count = 0
-    for i, mem in enumerate(demo.memory_manager.short_term_memory, 1):
-        user_msg = mem.get('user_message', '')
-        ai_resp = mem.get('ai_response', '')
-        entities = mem.get('entities', {})
-        
-        print(f"  {i}. {user_msg[:60]}...")
-        print(f"     回复: {ai_resp[:60]}...")
-        
-        # 检查是否包含糖尿病相关内容
-        is_diabetes_related = False
-        diabetes_keywords = ['糖尿病', '血糖', '胰岛素', '家族史', '糖尿病风险', 'diabetes']
-        
-        for keyword in diabetes_keywords:
-            if keyword in user_msg or keyword in ai_resp:
-                is_diabetes_related = True
-                break
-        
-        if not is_diabetes_related and entities:
-            for entity_type, entity_list in entities.items():
-                if isinstance(entity_list, list):
-                    for entity_info in entity_list:
-                        entity_text = entity_info[0] if isinstance(entity_info, (list, tuple)) else str(entity_info)
-                        for keyword in diabetes_keywords:
-                            if keyword in entity_text:
-                                is_diabetes_related = True
-                                break
-                        if is_diabetes_related:
-                            break
-                if is_diabetes_related:
-                    break
-        
-        if is_diabetes_related:
-            print(f"     👆 包含糖尿病相关内容")
-            diabetes_related_count += 1
+    memories = list(demo.memory_manager.short_term_memory)
+    # 检查是否包含糖尿病相关内容（优先使用写入时的判定标记）
+    related_flags = diabetes_flags(memories)
+    diabetes_related_count = sum(related_flags)
+    
+    # 整段拼接后一次输出
+    lines = []
+    for i, (mem, related) in enumerate(zip(memories, related_flags), 1):
+        lines.append(f"  {i}. {mem['user_message']:.60}...")
+        lines.append(f"     回复: {mem['ai_response']:.60}...")
+        if related:
+            lines.append(f"     👆 包含糖尿病相关内容")
+    if lines:
+        print("\n".join(lines))
     
     print(f"\n🔍 识别到 {diabetes_related_count} 条糖尿病相关记忆")
     
@@ -75,9 +58,10 @@ def test_clear_diabetes_memories():
     # 显示删除后的记忆
     print(f"\n📋 删除后剩余短期记忆:")
     if demo.memory_manager.short_term_memory:
-        for i, mem in enumerate(demo.memory_manager.short_term_memory, 1):
-            user_msg = mem.get('user_message', '')
-            print(f"  {i}. {user_msg[:60]}...")
+        print("\n".join(
+            f"  {i}. {mem['user_message']:.60}..."
+            for i, mem in enumerate(demo.memory_manager.short_term_memory, 1)
+        ))
     else:
         print("  (无剩余短期记忆)")
     
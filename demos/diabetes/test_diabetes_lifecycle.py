@@ -7,14 +7,18 @@ import os
 import sys
 sys.path.append('/Users/louisliu/.cursor/memory-x')
 
-from examples.enhanced_qwen_graph_demo import EnhancedQwenGraphDemo
+from examples.enhanced_qwen_graph_demo import get_cached_demo
+from src.core.memory_manager import DIABETES_RE, diabetes_flags
+
+# 启动时读取一次 API 密钥；未设置时立即报错，而不是带着占位密钥去请求接口
+_API_KEY = os.environ['DASHSCOPE_API_KEY']
 
 def test_diabetes_memory_lifecycle():
     print("🧪 测试糖尿病记忆的完整生命周期")
     print("=" * 50)
     
-    # 初始化演示系统
-    demo = EnhancedQwenGraphDemo(os.getenv('DASHSCOPE_API_KEY') or "请设置DASHSCOPE_API_KEY环境变量")
+    # 获取演示系统（同一进程内的多个测试共用一个实例）
+    demo = get_cached_demo(_API_KEY)
     
     print("📊 初始状态:")
     before_stats = demo.memory_manager.get_memory_stats()
@@ -56,14 +60,9 @@ def test_diabetes_memory_lifecycle():
         }
     ]
     
+    # 三条对话一次批量写入，长期记忆在同一事务内提交
+    demo.memory_manager.add_conversations_bulk(diabetes_conversations)
     for conv in diabetes_conversations:
-        demo.memory_manager.add_conversation(
-            conv["user_message"],
-            conv["ai_response"],
-            conv["entities"],
-            conv["intent"],
-            conv["importance"]
-        )
         print(f"    ✓ 添加: {conv['user_message'][:40]}...")
     
     # 2. 查看添加后的状态
@@ -73,31 +72,19 @@ def test_diabetes_memory_lifecycle():
     print(f"  工作记忆: {after_add_stats['working_memory_size']}项")
     
     print(f"\n📋 当前短期记忆内容:")
-    diabetes_related_count = 0
-    for i, mem in enumerate(demo.memory_manager.short_term_memory, 1):
-        user_msg = mem.get('user_message', '')
-        print(f"  {i}. {user_msg[:60]}...")
-        
-        # 检查是否包含糖尿病相关内容
-        diabetes_keywords = ['糖尿病', '血糖', '胰岛素', '家族史', '糖尿病风险', 'diabetes']
-        is_diabetes_related = any(keyword in user_msg for keyword in diabetes_keywords)
-        
-        if not is_diabetes_related:
-            entities = mem.get('entities', {})
-            if entities:
-                for entity_type, entity_list in entities.items():
-                    if isinstance(entity_list, list):
-                        for entity_info in entity_list:
-                            entity_text = entity_info[0] if isinstance(entity_info, (list, tuple)) else str(entity_info)
-                            if any(keyword in entity_text for keyword in diabetes_keywords):
-                                is_diabetes_related = True
-                                break
-                        if is_diabetes_related:
-                            break
-        
-        if is_diabetes_related:
-            print(f"     👆 包含糖尿病相关内容")
-            diabetes_related_count += 1
+    memories = list(demo.memory_manager.short_term_memory)
+    # 检查是否包含糖尿病相关内容（优先使用写入时的判定标记）
+    related_flags = diabetes_flags(memories)
+    diabetes_related_count = sum(related_flags)
+    
+    # 整段拼接后一次输出
+    lines = []
+    for i, (mem, related) in enumerate(zip(memories, related_flags), 1):
+        lines.append(f"  {i}. {mem['user_message']:.60}...")
+        if related:
+            lines.append(f"     👆 包含糖尿病相关内容")
+    if lines:
+        print("\n".join(lines))
     
     print(f"\n🔍 识别到 {diabetes_related_count} 条糖尿病相关记忆")
     
@@ -114,9 +101,10 @@ def test_diabetes_memory_lifecycle():
     # 4. 查看删除后的状态
     print(f"\n📋 删除后剩余短期记忆:")
     if demo.memory_manager.short_term_memory:
-        for i, mem in enumerate(demo.memory_manager.short_term_memory, 1):
-            user_msg = mem.get('user_message', '')
-            print(f"  {i}. {user_msg[:60]}...")
+        print("\n".join(
+            f"  {i}. {mem['user_message']:.60}..."
+            for i, mem in enumerate(demo.memory_manager.short_term_memory, 1)
+        ))
     else:
         print("  (无剩余短期记忆)")
     
@@ -124,9 +112,7 @@ def test_diabetes_memory_lifecycle():
     print(f"\n🎯 验证删除效果:")
     remaining_diabetes_count = 0
     for mem in demo.memory_manager.short_term_memory:
-        user_msg = mem.get('user_message', '')
-        diabetes_keywords = ['糖尿病', '血糖', '胰岛素', '家族史', '糖尿病风险', 'diabetes']
-        if any(keyword in user_msg for keyword in diabetes_keywords):
+        if DIABETES_RE.search(mem['user_message']):
             remaining_diabetes_count += 1
     
     if remaining_diabetes_count == 0:
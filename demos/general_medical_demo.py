@@ -11,9 +11,13 @@ Demonstrates how Memory-X system handles medical information for different patie
 
 import os
 import sys
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 
 # 添加项目根目录到Python路径
-sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+_PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if _PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, _PROJECT_ROOT)
 
 from configs.dashscope_client import (
     DashScopeClientFactory,
@@ -22,6 +26,32 @@ from configs.dashscope_client import (
 )
 
 
+# 并发调用DashScope的最大线程数
+MAX_WORKERS = 8
+
+
+def _freeze(patient_context):
+    """把患者上下文字典冻结为可哈希的 tuple(sorted(items))，列表值转为元组"""
+    return tuple(sorted(
+        (key, tuple(value) if isinstance(value, list) else value)
+        for key, value in patient_context.items()
+    ))
+
+
+@lru_cache(maxsize=16)
+def _build_client(api_key: str, frozen_context) -> MedicalDashScopeClient:
+    """按 (api_key, 冻结的患者上下文) 缓存医疗客户端，相同配置复用同一HTTP会话"""
+    patient_context = {
+        key: list(value) if isinstance(value, tuple) else value
+        for key, value in frozen_context
+    }
+    return MedicalDashScopeClient(DashScopeConfig(
+        api_key=api_key,
+        medical_mode=True,
+        patient_context=patient_context
+    ))
+
+
 class GeneralMedicalDemo:
     """通用医疗AI演示类"""
     
@@ -31,9 +61,31 @@ class GeneralMedicalDemo:
         if not self.api_key:
             raise ValueError("请设置DASHSCOPE_API_KEY环境变量")
         
+        # 通用医疗客户端在各演示方法间复用
+        self._client = None
+        
         print("🏥 Memory-X 通用医疗AI演示系统")
         print("=" * 60)
     
+    @property
+    def client(self) -> MedicalDashScopeClient:
+        """惰性创建并复用通用医疗客户端"""
+        if self._client is None:
+            self._client = DashScopeClientFactory.create_medical_client(api_key=self.api_key)
+        return self._client
+    
+    @staticmethod
+    def _fan_out(run_one, items):
+        """并发执行相互独立的网络调用，按输入顺序返回 (结果, 异常) 列表"""
+        def safe_run(item):
+            try:
+                return run_one(item), None
+            except Exception as e:
+                return None, e
+        
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            return list(executor.map(safe_run, items))
+    
     def demo_patient_specific_analysis(self):
         """演示针对特定患者的医疗分析"""
         print("\n👤 患者特定医疗分析演示")
@@ -67,7 +119,32 @@ class GeneralMedicalDemo:
             }
         ]
         
-        for i, patient in enumerate(patients, 1):
+        # 先在主线程准备好各患者特定的上下文，再并发发起诊断请求
+        payloads = [
+            (patient, _freeze({
+                "patient_name": patient['name'],
+                "age": patient['age'],
+                "allergies": patient['allergies'],
+                "family_history": patient['family_history'],
+                "medical_focus": ["症状分析", "风险评估", "药物安全"]
+            }))
+            for patient in patients
+        ]
+        
+        def run_one(payload):
+            patient, frozen_context = payload
+            # 客户端在工作线程中创建，相同上下文复用缓存的客户端
+            client = _build_client(self.api_key, frozen_context)
+            
+            # 进行症状诊断
+            return client.diagnose_symptoms(
+                patient['symptoms'],
+                patient_context=client.config.patient_context
+            )
+        
+        results = self._fan_out(run_one, payloads)
+        
+        for i, (patient, (diagnosis, error)) in enumerate(zip(patients, results), 1):
             print(f"\n📋 患者 {i}: {patient['name']}")
             print(f"   年龄: {patient['age']}岁")
             print(f"   过敏史: {', '.join(patient['allergies']) if patient['allergies'] else '无'}")
@@ -75,34 +152,11 @@ class GeneralMedicalDemo:
             print(f"   症状: {', '.join(patient['symptoms'])}")
             print(f"   场景: {patient['scenario']}")
             
-            # 创建患者特定的客户端配置
-            patient_config = DashScopeConfig(
-                api_key=self.api_key,
-                medical_mode=True,
-                patient_context={
-                    "patient_name": patient['name'],
-                    "age": patient['age'],
-                    "allergies": patient['allergies'],
-                    "family_history": patient['family_history'],
-                    "medical_focus": ["症状分析", "风险评估", "药物安全"]
-                }
-            )
-            
-            try:
-                # 创建医疗客户端
-                client = MedicalDashScopeClient(patient_config)
-                
-                # 进行症状诊断
-                diagnosis = client.diagnose_symptoms(
-                    patient['symptoms'],
-                    patient_context=patient_config.patient_context
-                )
-                
+            if error is None:
                 print(f"   🔍 AI诊断分析:")
                 print(f"   {diagnosis[:200]}..." if len(diagnosis) > 200 else f"   {diagnosis}")
-                
-            except Exception as e:
-                print(f"   ❌ 分析失败: {e}")
+            else:
+                print(f"   ❌ 分析失败: {error}")
             
             if i < len(patients):
                 print()
@@ -136,28 +190,29 @@ class GeneralMedicalDemo:
             }
         ]
         
-        # 创建通用医疗客户端
-        client = DashScopeClientFactory.create_medical_client(api_key=self.api_key)
+        # 复用通用医疗客户端
+        client = self.client
+        
+        def run_one(scenario):
+            # 药物安全检查
+            if isinstance(client, MedicalDashScopeClient):
+                return client.medication_safety_check(scenario['medication'])
+            return client.generate_response(
+                f"请分析药物{scenario['medication']}对于{scenario['patient_profile']}的安全性"
+            )
+        
+        results = self._fan_out(run_one, medication_scenarios)
         
-        for scenario in medication_scenarios:
+        for scenario, (safety_analysis, error) in zip(medication_scenarios, results):
             print(f"\n🔬 药物: {scenario['medication']}")
             print(f"   患者类型: {scenario['patient_profile']}")
             print(f"   预期风险: {scenario['expected_risk']}")
             
-            try:
-                # 药物安全检查
-                if isinstance(client, MedicalDashScopeClient):
-                    safety_analysis = client.medication_safety_check(scenario['medication'])
-                else:
-                    safety_analysis = client.generate_response(
-                        f"请分析药物{scenario['medication']}对于{scenario['patient_profile']}的安全性"
-                    )
-                
+            if error is None:
                 print(f"   🛡️ 安全性分析:")
                 print(f"   {safety_analysis[:150]}..." if len(safety_analysis) > 150 else f"   {safety_analysis}")
-                
-            except Exception as e:
-                print(f"   ❌ 分析失败: {e}")
+            else:
+                print(f"   ❌ 分析失败: {error}")
     
     def demo_general_medical_consultation(self):
         """演示通用医疗咨询"""
@@ -173,20 +228,17 @@ class GeneralMedicalDemo:
             "老年人用药安全需要注意哪些问题？"
         ]
         
-        client = DashScopeClientFactory.create_client(
-            client_type="medical",
-            api_key=self.api_key
-        )
+        client = self.client
+        
+        results = self._fan_out(client.generate_response, medical_questions)
         
-        for i, question in enumerate(medical_questions, 1):
+        for i, (question, (answer, error)) in enumerate(zip(medical_questions, results), 1):
             print(f"\n❓ 问题 {i}: {question}")
             
-            try:
-                answer = client.generate_response(question)
+            if error is None:
                 print(f"🤖 AI回答: {answer[:200]}..." if len(answer) > 200 else f"🤖 AI回答: {answer}")
-                
-            except Exception as e:
-                print(f"❌ 回答失败: {e}")
+            else:
+                print(f"❌ 回答失败: {error}")
     
     def demo_family_history_risk_assessment(self):
         """演示家族史风险评估"""
@@ -214,37 +266,34 @@ class GeneralMedicalDemo:
             }
         ]
         
-        for i, case in enumerate(family_history_cases, 1):
+        def run_one(case):
+            # 特定的患者上下文
+            specific_context = {
+                "age": case['patient_age'],
+                "family_history": case['family_history'],
+                "current_symptoms": case['symptoms']
+            }
+            client = _build_client(self.api_key, _freeze(specific_context))
+            
+            return client.generate_response(
+                f"基于家族史{', '.join(case['family_history'])}和当前症状{', '.join(case['symptoms'])}，"
+                f"请为{case['patient_age']}岁患者进行风险评估和预防建议。"
+            )
+        
+        results = self._fan_out(run_one, family_history_cases)
+        
+        for i, (case, (risk_assessment, error)) in enumerate(zip(family_history_cases, results), 1):
             print(f"\n🔍 案例 {i}:")
             print(f"   家族史: {', '.join(case['family_history'])}")
             print(f"   患者年龄: {case['patient_age']}岁")
             print(f"   现有症状: {', '.join(case['symptoms'])}")
             print(f"   评估重点: {case['focus']}")
             
-            # 创建特定的客户端配置
-            specific_config = DashScopeConfig(
-                api_key=self.api_key,
-                medical_mode=True,
-                patient_context={
-                    "age": case['patient_age'],
-                    "family_history": case['family_history'],
-                    "current_symptoms": case['symptoms']
-                }
-            )
-            
-            try:
-                client = MedicalDashScopeClient(specific_config)
-                
-                risk_assessment = client.generate_response(
-                    f"基于家族史{', '.join(case['family_history'])}和当前症状{', '.join(case['symptoms'])}，"
-                    f"请为{case['patient_age']}岁患者进行风险评估和预防建议。"
-                )
-                
+            if error is None:
                 print(f"   📊 风险评估:")
                 print(f"   {risk_assessment[:250]}..." if len(risk_assessment) > 250 else f"   {risk_assessment}")
-                
-            except Exception as e:
-                print(f"   ❌ 评估失败: {e}")
+            else:
+                print(f"   ❌ 评估失败: {error}")
     
     def run_all_demos(self):
         """运行所有演示"""
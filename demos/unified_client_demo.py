@@ -9,11 +9,18 @@ Demo for Unified DashScope API Client Configuration
 专为患者医疗场景设计，展示统一客户端的优势
 """
 
+import io
 import os
 import sys
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 
 # 添加项目根目录到Python路径
-sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+_PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if _PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, _PROJECT_ROOT)
 
 from configs.dashscope_client import (
     DashScopeClientFactory,
@@ -23,6 +30,44 @@ from configs.dashscope_client import (
     check_medication_safety
 )
 
+try:
+    import orjson
+except ImportError:  # orjson 未安装时退回标准库 json
+    orjson = None
+
+
+# 患者症状分析的提示词模板：档案部分按患者缓存，症状部分每次调用填充
+_PATIENT_PROFILE_TEMPLATE = "患者信息（JSON）：{patient_json}"
+_SYMPTOM_PROMPT_TEMPLATE = "当前症状：{symptoms}\n\n请进行专业的医疗分析。"
+
+
+@lru_cache(maxsize=256)
+def _patient_profile_prompt(name, age, allergies, family_history) -> str:
+    """同一患者的档案提示词只生成一次；作为不变的 system 前缀，便于服务端前缀缓存复用"""
+    return _PATIENT_PROFILE_TEMPLATE.format_map({
+        "patient_json": _patient_json({
+            "name": name,
+            "age": age,
+            "allergies": list(allergies),
+            "family_history": list(family_history)
+        })
+    })
+
+
+def _patient_json(patient: dict) -> str:
+    """患者信息序列化为紧凑JSON，便于下游日志按结构解析；优先用 orjson"""
+    if orjson is None:
+        return json.dumps(patient, ensure_ascii=False, separators=(',', ':'))
+    return orjson.dumps(patient).decode()
+
+
+def _print_stream(chunks):
+    """边接收边输出流式响应片段"""
+    for chunk in chunks:
+        sys.stdout.write(chunk)
+        sys.stdout.flush()
+    print()
+
 
 def demo_basic_client_usage():
     """演示基础客户端使用"""
@@ -36,10 +81,9 @@ def demo_basic_client_usage():
             medical_mode=True
         )
         
-        # 基础对话
-        response = client.generate_response("你好，我想了解一下糖尿病的预防知识。")
+        # 基础对话（流式输出，首个片段到达即开始显示）
         print("AI回答:")
-        print(response)
+        _print_stream(client.generate_response_stream("你好，我想了解一下糖尿病的预防知识。"))
         print()
         
     except Exception as e:
@@ -55,15 +99,18 @@ def demo_medical_client_usage():
         # 创建医疗专用客户端
         medical_client = DashScopeClientFactory.create_medical_client()
         
-        # 症状诊断
+        # 症状诊断与药物安全检查相互独立，并发请求后按顺序输出
         symptoms = ["头晕", "乏力", "口渴"]
-        diagnosis = medical_client.diagnose_symptoms(symptoms)
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            diagnosis_future = executor.submit(medical_client.diagnose_symptoms, symptoms)
+            safety_future = executor.submit(medical_client.medication_safety_check, "二甲双胍")
+            diagnosis = diagnosis_future.result()
+            safety_check = safety_future.result()
+        
         print("症状诊断分析:")
         print(diagnosis)
         print()
         
-        # 药物安全检查
-        safety_check = medical_client.medication_safety_check("二甲双胍")
         print("药物安全检查:")
         print(safety_check)
         print()
@@ -78,20 +125,27 @@ def demo_global_client_usage():
     print("=" * 50)
     
     try:
-        # 使用全局客户端进行快速提问
-        answer1 = quick_ask("糖尿病的早期症状有哪些？")
+        # 先在主线程创建全局客户端，三个便捷函数再并发共用它
+        get_global_client(client_type="medical")
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            # 使用全局客户端进行快速提问
+            answer_future = executor.submit(quick_ask, "糖尿病的早期症状有哪些？")
+            # 医疗咨询便捷函数
+            consultation_future = executor.submit(medical_consultation, ["多尿", "多饮", "体重下降"])
+            # 药物安全检查便捷函数
+            drug_safety_future = executor.submit(check_medication_safety, "阿莫西林")
+            answer1 = answer_future.result()
+            consultation = consultation_future.result()
+            drug_safety = drug_safety_future.result()
+        
         print("快速提问 - 糖尿病早期症状:")
         print(answer1)
         print()
         
-        # 医疗咨询便捷函数
-        consultation = medical_consultation(["多尿", "多饮", "体重下降"])
         print("医疗咨询分析:")
         print(consultation)
         print()
         
-        # 药物安全检查便捷函数
-        drug_safety = check_medication_safety("阿莫西林")
         print("药物安全检查 - 阿莫西林:")
         print(drug_safety)
         print()
@@ -116,12 +170,11 @@ def demo_configuration_options():
         )
         
         # 使用自定义配置
-        response = custom_client.generate_response(
+        print("自定义配置客户端回答:")
+        _print_stream(custom_client.generate_response_stream(
             "请简要介绍糖尿病的分类和特点。",
             max_tokens=500
-        )
-        print("自定义配置客户端回答:")
-        print(response)
+        ))
         print()
         
     except Exception as e:
@@ -134,24 +187,26 @@ def demo_integration_with_existing_code():
     print("=" * 50)
     
     try:
+        # 全局客户端与其医疗系统提示词只取一次，由分析函数闭包复用
+        client = get_global_client(client_type="medical")
+        medical_prompt = client._build_medical_system_prompt()
+        
         # 模拟现有的医疗分析流程
         def analyze_patient_symptoms(patient_info, symptoms):
             """模拟现有的患者症状分析函数"""
-            client = get_global_client(client_type="medical")
-            
-            prompt = f"""
-患者信息：
-- 姓名：{patient_info.get('name', '未知')}
-- 年龄：{patient_info.get('age', '未知')}
-- 过敏史：{', '.join(patient_info.get('allergies', []))}
-- 家族史：{', '.join(patient_info.get('family_history', []))}
-
-当前症状：{', '.join(symptoms)}
-
-请进行专业的医疗分析。
-"""
+            # 医疗系统提示词（含安全原则）在前，患者档案作为第二条 system 消息，只有症状随调用变化
+            profile = _patient_profile_prompt(
+                patient_info.get('name', '未知'),
+                patient_info.get('age', '未知'),
+                tuple(patient_info.get('allergies', [])),
+                tuple(patient_info.get('family_history', []))
+            )
             
-            return client.generate_response(prompt)
+            return client.chat([
+                {"role": "system", "content": medical_prompt},
+                {"role": "system", "content": profile},
+                {"role": "user", "content": _SYMPTOM_PROMPT_TEMPLATE.format_map({"symptoms": ', '.join(symptoms)})}
+            ])
         
         # 使用统一客户端
         patient_info = {
@@ -202,6 +257,40 @@ def demo_error_handling():
         print(f"❌ 错误处理演示失败: {e}")
 
 
+class _ThreadBufferedStdout:
+    """按线程分流的标准输出：登记了缓冲区的线程写入自己的缓冲区，其余线程照常输出"""
+    
+    def __init__(self, target):
+        self._target = target
+        self._local = threading.local()
+    
+    def _stream(self):
+        buffer = getattr(self._local, 'buffer', None)
+        return self._target if buffer is None else buffer
+    
+    def write(self, text):
+        return self._stream().write(text)
+    
+    def flush(self):
+        self._stream().flush()
+    
+    def __getattr__(self, name):
+        return getattr(self._target, name)
+    
+    def capture(self, func) -> str:
+        """在当前线程运行 func，返回其全部输出"""
+        self._local.buffer = io.StringIO()
+        try:
+            try:
+                func()
+            except Exception as e:
+                print(f"❌ 演示 {func.__name__} 失败: {e}")
+                print()
+            return self._local.buffer.getvalue()
+        finally:
+            self._local.buffer = None
+
+
 def main():
     """主函数"""
     print("🎯 Memory-X 统一百炼API客户端配置演示")
@@ -227,15 +316,29 @@ def main():
         demo_error_handling
     ]
     
-    for i, demo_func in enumerate(demos, 1):
-        try:
-            demo_func()
-            if i < len(demos):
-                print("─" * 80)
-                print()
-        except Exception as e:
-            print(f"❌ 演示 {demo_func.__name__} 失败: {e}")
-            print()
+    # 流式演示需要边接收边输出，留在主线程直接打印
+    streaming_demos = {demo_basic_client_usage, demo_configuration_options}
+    
+    # 其余演示相互独立且以网络等待为主，在后台并发运行；输出单独缓冲，轮到时整段打印
+    original_stdout = sys.stdout
+    stdout = _ThreadBufferedStdout(original_stdout)
+    sys.stdout = stdout
+    try:
+        with ThreadPoolExecutor(max_workers=len(demos) - len(streaming_demos)) as executor:
+            futures = {
+                demo_func: executor.submit(stdout.capture, demo_func)
+                for demo_func in demos if demo_func not in streaming_demos
+            }
+            for i, demo_func in enumerate(demos, 1):
+                if demo_func in futures:
+                    print(futures[demo_func].result(), end="")
+                else:
+                    demo_func()
+                if i < len(demos):
+                    print("─" * 80)
+                    print()
+    finally:
+        sys.stdout = original_stdout
     
     print("🎉 所有演示完成！")
     print()
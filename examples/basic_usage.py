@@ -10,7 +10,9 @@ import sys
 import os
 
 # 添加项目根目录到Python路径
-sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+_PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if _PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, _PROJECT_ROOT)
 
 from src.core.memory_manager import SimpleMemoryManager, SimpleMemoryIntegratedAI
 
@@ -88,13 +90,13 @@ def integrated_ai_example():
         "我今年45岁"
     ]
     
-    for i, message in enumerate(conversations, 1):
+    # 批量处理消息，所有记忆写入一次提交
+    results = memory_ai.process_messages(conversations, "user_002")
+    
+    for i, (message, result) in enumerate(zip(conversations, results), 1):
         print(f"\n💬 对话 {i}: {message}")
         print("-" * 30)
         
-        # 处理消息
-        result = memory_ai.process_message(message, "user_002")
-        
         print(f"AI回复: {result['response']}")
         print(f"检测意图: {result['intent']['detected']}")
         print(f"重要性: {result['memory_info']['importance']}")
@@ -124,32 +126,33 @@ def memory_operations_example():
     
     memory_manager = SimpleMemoryManager(user_id="user_003")
     
-    # 添加不同类型的记忆
+    # 添加不同类型的记忆（同一事务内写入，只提交一次）
     print("\n📝 添加不同类型的记忆")
     print("-" * 30)
     
-    # 低重要性记忆
-    memory_manager.add_conversation(
-        user_message="今天天气不错",
-        ai_response="是的，天气确实很好。",
-        importance=1
-    )
-    
-    # 中等重要性记忆
-    memory_manager.add_conversation(
-        user_message="我喜欢吃苹果",
-        ai_response="苹果是很好的水果，富含维生素。",
-        entities={"FOOD": [("苹果", 3, 5)]},
-        importance=2
-    )
-    
-    # 高重要性记忆
-    memory_manager.add_conversation(
-        user_message="我有糖尿病",
-        ai_response="糖尿病需要特别注意饮食和血糖控制。",
-        entities={"DISEASE": [("糖尿病", 2, 4)]},
-        importance=4
-    )
+    with memory_manager.transaction():
+        # 低重要性记忆
+        memory_manager.add_conversation(
+            user_message="今天天气不错",
+            ai_response="是的，天气确实很好。",
+            importance=1
+        )
+        
+        # 中等重要性记忆
+        memory_manager.add_conversation(
+            user_message="我喜欢吃苹果",
+            ai_response="苹果是很好的水果，富含维生素。",
+            entities={"FOOD": [("苹果", 3, 5)]},
+            importance=2
+        )
+        
+        # 高重要性记忆
+        memory_manager.add_conversation(
+            user_message="我有糖尿病",
+            ai_response="糖尿病需要特别注意饮食和血糖控制。",
+            entities={"DISEASE": [("糖尿病", 2, 4)]},
+            importance=4
+        )
     
     # 查看记忆统计
     stats = memory_manager.get_memory_stats()
@@ -6,12 +6,17 @@ DashScope集成使用示例
 演示如何使用DashScope API进行记忆管理和AI对话
 """
 
+import io
 import os
 import sys
 import time
 
 # 添加项目根目录到Python路径
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+_PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if _PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, _PROJECT_ROOT)
+
+from src.core.dashscope_memory_manager import DashScopeMemoryManager
 
 def main():
     """主函数"""
@@ -28,8 +33,6 @@ def main():
     print(f"✅ API密钥已设置: {api_key[:10]}...")
     
     try:
-        from src.core.dashscope_memory_manager import DashScopeMemoryManager
-        
         # 创建记忆管理器
         user_id = "demo_user"
         memory_manager = DashScopeMemoryManager(user_id)
@@ -52,28 +55,32 @@ def main():
             print(f"用户: {message}")
             
             # 处理消息
-            start_time = time.time()
+            start_ns = time.perf_counter_ns()
             result = memory_manager.process_message(message)
-            end_time = time.time()
+            elapsed_s = (time.perf_counter_ns() - start_ns) / 1e9
             
-            print(f"AI: {result['response']}")
-            print(f"意图: {result['intent']}")
-            print(f"重要性: {result['importance']}")
-            print(f"处理时间: {end_time - start_time:.2f}秒")
+            # 本轮输出先写入缓冲区，再一次性写到标准输出
+            buf = io.StringIO()
+            buf.write(f"AI: {result['response']}\n")
+            buf.write(f"意图: {result['intent']}\n")
+            buf.write(f"重要性: {result['importance']}\n")
+            buf.write(f"处理时间: {elapsed_s:.2f}秒\n")
             
             # 显示实体信息
             if result['entities']:
-                print("实体信息:")
+                buf.write("实体信息:\n")
                 for entity_type, entities in result['entities'].items():
-                    print(f"  {entity_type}: {entities}")
+                    buf.write(f"  {entity_type}: {entities}\n")
+            sys.stdout.write(buf.getvalue())
         
-        # 测试记忆搜索
+        # 测试记忆搜索（全部查询一次批量嵌入，按顺序输出）
         print("\n🔍 测试记忆搜索...")
         search_queries = ["过敏", "高血压", "头痛", "张三"]
         
-        for query in search_queries:
+        search_results = memory_manager.search_memories_batch(search_queries, top_k=3)
+        
+        for query, results in zip(search_queries, search_results):
             print(f"\n搜索: '{query}'")
-            results = memory_manager.search_memories(query, top_k=3)
             
             if results:
                 for i, memory in enumerate(results, 1):
@@ -10,9 +10,12 @@ import sys
 import os
 import sqlite3
 import json
+import re
 import argparse
+import functools
+import itertools
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Any
+from typing import Dict, Iterator, List, Optional, Set, Any
 
 # 添加项目路径
 sys.path.append('/Users/louisliu/.cursor/memory-x')
@@ -21,10 +24,90 @@ from src.core.medical_graph_manager import MedicalGraphManager
 from src.core.qwen_graph_update_engine import QwenGraphUpdateEngine
 from src.core.memory_manager import SimpleMemoryManager, SimpleMemoryIntegratedAI
 
+try:
+    import pandas as pd
+except ImportError:  # pandas 未安装时逐条解析症状时间
+    pd = None
+
+try:
+    import orjson
+except ImportError:  # orjson 未安装时退回标准库 json
+    orjson = None
+
+# 演示库连接的 PRAGMA：WAL + synchronous=NORMAL 避免每次提交 fsync，临时表与页缓存放内存
+SQLITE_PRAGMAS = (
+    "journal_mode=WAL",
+    "synchronous=NORMAL",
+    "temp_store=MEMORY",
+    "cache_size=-20000",
+)
+
+# 图谱实体表
+ENTITY_TABLES = ("diseases", "symptoms", "medicines")
+
+# 症状条数达到该值时改用 pandas 批量解析时间；条数少时逐条解析更快
+VECTORIZE_MIN_ROWS = 1000
+
+
+def _json_default(value):
+    """标准库 json 无法序列化的对象：日期时间转 ISO 字符串，其余转字符串"""
+    return value.isoformat() if hasattr(value, 'isoformat') else str(value)
+
+
+def write_json(path: str, data: Dict):
+    """写出JSON文件：优先用 orjson 直接生成字节流（原生支持 datetime）"""
+    if orjson is None:
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2, default=_json_default)
+        return
+    with open(path, 'wb') as f:
+        f.write(orjson.dumps(data, default=str, option=orjson.OPT_INDENT_2))
+
 
 class EnhancedQwenGraphDemo:
     """增强版Qwen图谱演示类，支持所有记忆查询和直接问题分析"""
     
+    # 扩展症状关键词，特别加强糖尿病相关症状（标准症状名 -> 同义表述）
+    SYMPTOM_KEYWORDS = {
+        # 神经系统症状
+        "头痛": ["头痛", "头疼"],
+        "头晕": ["头晕", "眩晕", "头昏"],
+        "乏力": ["乏力", "疲劳", "无力", "没力气"],
+
+        # 糖尿病经典症状（三多一少）
+        "多尿": ["多尿", "尿多", "小便多", "尿频"],
+        "多饮": ["多饮", "口渴", "想喝水", "总是渴"],
+        "多食": ["多食", "饿得快", "总是饿", "食量大"],
+        "体重下降": ["体重下降", "消瘦", "瘦了", "体重减轻"],
+
+        # 糖尿病早期症状
+        "视力模糊": ["视力模糊", "眼花", "看不清", "视力下降"],
+        "皮肤瘙痒": ["皮肤瘙痒", "皮肤痒", "身上痒"],
+        "伤口愈合慢": ["伤口愈合慢", "伤口不愈合", "切口感染"],
+
+        # 其他常见症状
+        "发热": ["发热", "发烧", "体温高"],
+        "咳嗽": ["咳嗽", "咳"],
+        "胸痛": ["胸痛", "胸疼", "胸闷"],
+        "腹痛": ["腹痛", "肚子疼", "胃痛"],
+        "腹泻": ["腹泻", "拉肚子"],
+        "便秘": ["便秘", "大便困难"],
+        "失眠": ["失眠", "睡不着", "睡眠不好"],
+        "焦虑": ["焦虑", "紧张", "心慌"]
+    }
+    
+    # 关键词 -> 标准症状名
+    _SYMPTOM_KEYWORD_TO_NAME = {
+        keyword: symptom_name
+        for symptom_name, keywords in SYMPTOM_KEYWORDS.items()
+        for keyword in keywords
+    }
+    # 全部关键词合并为一个预编译正则（长词优先），一次扫描完成匹配；
+    # 零宽前瞻在每个位置尝试匹配，相互重叠的关键词也都能命中
+    _SYMPTOM_PATTERN = re.compile("(?=(%s))" % "|".join(
+        map(re.escape, sorted(_SYMPTOM_KEYWORD_TO_NAME, key=len, reverse=True))
+    ))
+    
     def __init__(self, api_key: str, db_path: str = None):
         self.api_key = api_key
         self.db_path = db_path or "/Users/louisliu/.cursor/memory-x/data/enhanced_qwen_demo.db"
@@ -34,37 +117,61 @@ class EnhancedQwenGraphDemo:
         os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
         
         # 初始化组件
-        self.graph_manager = MedicalGraphManager(self.db_path)
+        self.graph_manager = MedicalGraphManager(self.db_path, pragmas=SQLITE_PRAGMAS)
         self.qwen_engine = QwenGraphUpdateEngine(self.graph_manager, api_key)
         self.memory_ai = SimpleMemoryIntegratedAI()
         self.memory_manager = self.memory_ai.get_memory_manager(self.user_id)
         
+        # Qwen更新场景分析的决策缓存：(症状集合, 背景, 图谱版本) -> 决策
+        self._decision_cache: Dict[tuple, Any] = {}
+        
+        # 演示库的长连接：各方法共用，保持页缓存常驻
+        self._conn = self._connect()
+        
         # 初始化数据
         self._setup_demo_data()
     
+    def _connect(self) -> sqlite3.Connection:
+        """打开演示库连接：行以 sqlite3.Row 返回，并应用 SQLITE_PRAGMAS"""
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        for pragma in SQLITE_PRAGMAS:
+            conn.execute(f"PRAGMA {pragma}")
+        return conn
+    
+    def close(self):
+        """关闭演示库长连接"""
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+    
     def _setup_demo_data(self):
         """设置演示数据（包括图谱和记忆数据）"""
         print("📊 设置演示数据...")
         
-        conn = sqlite3.connect(self.db_path)
+        conn = self._conn
         cursor = conn.cursor()
         
         # 创建表结构
         self._create_tables(cursor)
         
-        # 插入历史医疗记录
+        # 插入历史医疗记录（显式事务，全部行一次提交）
+        cursor.execute("BEGIN")
         self._insert_historical_data(cursor)
         
         # 插入记忆数据
         self._insert_memory_data()
         
         conn.commit()
-        conn.close()
+        # 让查询规划器按需更新统计信息，以便选用新建的索引
+        conn.execute("PRAGMA optimize")
+        # 绕过图谱管理器直接写库，丢弃其只读查询缓存
+        self.graph_manager.invalidate_cache()
         
         print("✅ 演示数据设置完成")
     
     def _create_tables(self, cursor):
-        """创建数据库表"""
+        """创建数据库表和索引"""
         tables = [
             '''CREATE TABLE IF NOT EXISTS diseases (
                 id VARCHAR(50) PRIMARY KEY,
@@ -114,7 +221,13 @@ class EnhancedQwenGraphDemo:
                 user_id VARCHAR(50),
                 created_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                 updated_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )'''
+            )''',
+            # 按创建时间倒序取最近记录时直接走索引，免去全表扫描和排序
+            'CREATE INDEX IF NOT EXISTS idx_diseases_created ON diseases(created_time DESC)',
+            'CREATE INDEX IF NOT EXISTS idx_symptoms_created ON symptoms(created_time DESC)',
+            'CREATE INDEX IF NOT EXISTS idx_medicines_created ON medicines(created_time DESC)',
+            '''CREATE INDEX IF NOT EXISTS idx_disease_symptom_user_created
+                ON disease_symptom_relations(user_id, created_time DESC)'''
         ]
         
         for table in tables:
@@ -133,12 +246,11 @@ class EnhancedQwenGraphDemo:
             (f"disease_diabetes_{self.user_id}", "糖尿病", "内分泌系统疾病", "potential", two_months_ago.isoformat()),
         ]
         
-        for disease in diseases:
-            cursor.execute('''
-                INSERT OR REPLACE INTO diseases 
-                (id, name, category, severity, created_time, updated_time)
-                VALUES (?, ?, ?, ?, ?, ?)
-            ''', disease + (disease[4],))
+        cursor.executemany('''
+            INSERT OR REPLACE INTO diseases 
+            (id, name, category, severity, created_time, updated_time)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', [disease + (disease[4],) for disease in diseases])
         
         # 症状实体
         symptoms = [
@@ -147,12 +259,11 @@ class EnhancedQwenGraphDemo:
             ("symptom_fever_001", "发热", "全身", "mild", two_months_ago.isoformat()),
         ]
         
-        for symptom in symptoms:
-            cursor.execute('''
-                INSERT OR REPLACE INTO symptoms 
-                (id, name, body_part, intensity, created_time, updated_time)
-                VALUES (?, ?, ?, ?, ?, ?)
-            ''', symptom + (symptom[4],))
+        cursor.executemany('''
+            INSERT OR REPLACE INTO symptoms 
+            (id, name, body_part, intensity, created_time, updated_time)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', [symptom + (symptom[4],) for symptom in symptoms])
         
         # 药物实体
         medicines = [
@@ -160,12 +271,11 @@ class EnhancedQwenGraphDemo:
             ("medicine_amlodipine_001", "氨氯地平", "降压药", "5mg", one_week_ago.isoformat()),
         ]
         
-        for medicine in medicines:
-            cursor.execute('''
-                INSERT OR REPLACE INTO medicines 
-                (id, name, drug_class, strength, created_time, updated_time)
-                VALUES (?, ?, ?, ?, ?, ?)
-            ''', medicine + (medicine[4],))
+        cursor.executemany('''
+            INSERT OR REPLACE INTO medicines 
+            (id, name, drug_class, strength, created_time, updated_time)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', [medicine + (medicine[4],) for medicine in medicines])
         
         # 疾病-症状关系
         ds_relations = [
@@ -175,12 +285,11 @@ class EnhancedQwenGraphDemo:
              "感冒伴有发热症状", self.user_id, two_months_ago.isoformat()),
         ]
         
-        for relation in ds_relations:
-            cursor.execute('''
-                INSERT OR REPLACE INTO disease_symptom_relations 
-                (id, disease_id, symptom_id, relation_type, source, confidence, context, user_id, created_time, updated_time)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', relation + (relation[8],))
+        cursor.executemany('''
+            INSERT OR REPLACE INTO disease_symptom_relations 
+            (id, disease_id, symptom_id, relation_type, source, confidence, context, user_id, created_time, updated_time)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', [relation + (relation[8],) for relation in ds_relations])
     
     def _insert_memory_data(self):
         """插入记忆数据"""
@@ -211,14 +320,93 @@ class EnhancedQwenGraphDemo:
             }
         ]
         
-        for conv in conversations:
-            self.memory_manager.add_conversation(
-                conv["message"],
-                conv["response"],
-                conv["entities"],
-                conv["intent"],
-                conv["importance"]
-            )
+        stats = self.memory_manager.get_memory_stats()
+        # 本进程内已插入过：短期记忆中已有这些对话
+        if stats["short_term_count"] >= len(conversations):
+            return
+        # 之前的运行已写入长期记忆的种子对话只回放到短期记忆，不再重复落库
+        persisted = self._persisted_messages(stats["total_long_term"])
+        
+        with self.memory_manager.transaction():
+            for conv in conversations:
+                self.memory_manager.add_conversation(
+                    conv["message"],
+                    conv["response"],
+                    conv["entities"],
+                    conv["intent"],
+                    conv["importance"],
+                    persist=conv["message"] not in persisted
+                )
+    
+    def _persisted_messages(self, total_long_term: int) -> Set[str]:
+        """长期记忆中已有的用户消息（按对话对取回，条数上限取长期记忆总行数即可覆盖全部）"""
+        if not total_long_term:
+            return set()
+        stored = self.memory_manager.store.search_memories(self.user_id, "", total_long_term)
+        return {memory["user_message"] for memory in stored}
+    
+    def _iter_short_term(self, limit: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+        """逐条产出短期记忆的可序列化字典；指定 limit 时只产出最近的 limit 条（按时间顺序）"""
+        memories = self.memory_manager.short_term_memory
+        start = 0 if limit is None else max(0, len(memories) - limit)
+        for item in itertools.islice(memories, start, None):
+            yield {
+                "content": item.get("user_message", str(item)),
+                "response": item.get("ai_response", ""),
+                "timestamp": item.get("timestamp") or datetime.now(),
+                "entities": item.get("entities", {}),
+                "intent": item.get("intent", ""),
+                "importance": item.get("importance", 1)
+            }
+    
+    def _fetch_entity_preview(self, table: str, limit: int) -> List[Dict[str, Any]]:
+        """读取实体表最近的若干条，只取 id、名称和创建时间"""
+        cursor = self._conn.execute(
+            f"SELECT id, name, created_time FROM {table} ORDER BY created_time DESC LIMIT ?", (limit,)
+        )
+        return [dict(row) for row in cursor.fetchall()]
+    
+    @functools.cached_property
+    def _entity_union_query(self):
+        """三张实体表合并为一条 UNION ALL 语句：各表缺少的列补 NULL，返回 (SQL, 各表列名)"""
+        columns = {
+            table: [row["name"] for row in self._conn.execute(f"PRAGMA table_info({table})")]
+            for table in ENTITY_TABLES
+        }
+        all_columns = list(dict.fromkeys(column for table_columns in columns.values() for column in table_columns))
+        selects = [
+            f"SELECT '{table}' AS entity_table, " + ", ".join(
+                column if column in columns[table] else f"NULL AS {column}" for column in all_columns
+            ) + f" FROM {table}"
+            for table in ENTITY_TABLES
+        ]
+        sql = " UNION ALL ".join(selects) + " ORDER BY entity_table, created_time DESC"
+        return sql, columns
+    
+    def _fetch_all_entities(self) -> Dict[str, List[Dict[str, Any]]]:
+        """一次往返读取全部实体，按表拆分；各表内按创建时间倒序，只保留该表自身的列"""
+        sql, columns = self._entity_union_query
+        entities = {table: [] for table in ENTITY_TABLES}
+        for row in self._conn.execute(sql):
+            table = row["entity_table"]
+            entities[table].append({column: row[column] for column in columns[table]})
+        return entities
+    
+    def _summarize_memories(self, query: str, limit: int = 5) -> Dict[str, Any]:
+        """问题分析用的精简记忆检索：只取分析流程展示所需的记忆、病症关系与实体预览"""
+        long_term_results = self.memory_manager.retrieve_memories(query, limit)
+        return {
+            "short_term_memories": list(self._iter_short_term(limit)),
+            "long_term_memories": long_term_results,
+            "graph_relations": {
+                "disease_symptom": self.graph_manager.get_disease_symptom_relations(user_id=self.user_id),
+                **{table: self._fetch_entity_preview(table, limit) for table in ENTITY_TABLES}
+            },
+            "query_summary": {
+                "relevant_memories": len([m for m in long_term_results if m.get("score", 0) > 0.5]),
+                "query_used": query
+            }
+        }
     
     def query_all_memories(self, query: str = None, limit: int = 10) -> Dict[str, Any]:
         """查询所有记忆数据"""
@@ -243,17 +431,7 @@ class EnhancedQwenGraphDemo:
         }
         
         # 查询短期记忆
-        short_term_data = list(self.memory_manager.short_term_memory)
-        results["short_term_memories"] = [
-            {
-                "content": item.get("user_message", str(item)),
-                "response": item.get("ai_response", ""),
-                "timestamp": item.get("timestamp", datetime.now()).isoformat() if hasattr(item.get("timestamp", datetime.now()), 'isoformat') else str(item.get("timestamp", "")),
-                "entities": item.get("entities", {}),
-                "intent": item.get("intent", ""),
-                "importance": item.get("importance", 1)
-            } for item in short_term_data
-        ]
+        results["short_term_memories"] = list(self._iter_short_term())
         
         # 查询长期记忆
         if query:
@@ -268,17 +446,14 @@ class EnhancedQwenGraphDemo:
         results["graph_relations"]["disease_medicine"] = self.graph_manager.get_disease_medicine_relations(user_id=self.user_id)
         
         # 查询实体数据
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        cursor = self._conn.cursor()
         
-        for entity_type in ["diseases", "symptoms", "medicines"]:
+        for entity_type in ENTITY_TABLES:
             cursor.execute(f"SELECT * FROM {entity_type} ORDER BY created_time DESC LIMIT ?", (limit,))
             results["graph_relations"][entity_type] = [
-                dict(zip([col[0] for col in cursor.description], row)) for row in cursor.fetchall()
+                dict(row) for row in cursor.fetchall()
             ]
         
-        conn.close()
-        
         # 记忆统计
         results["memory_stats"] = self.memory_manager.get_memory_stats()
         
@@ -322,7 +497,7 @@ class EnhancedQwenGraphDemo:
         
         # 步骤2: 记忆检索
         analysis_result["analysis_flow"].append("步骤2: 检索相关记忆")
-        memory_results = self.query_all_memories(query, limit=5)
+        memory_results = self._summarize_memories(query, limit=5)
         analysis_result["memory_retrieval"] = memory_results
         
         print(f"\n📚 记忆检索结果:")
@@ -357,10 +532,10 @@ class EnhancedQwenGraphDemo:
         # 步骤3: Qwen AI分析
         analysis_result["analysis_flow"].append("步骤3: Qwen AI智能分析")
         if extracted_symptoms:
-            qwen_decision = self.qwen_engine.analyze_update_scenario(
-                current_symptoms=extracted_symptoms,
-                user_id=self.user_id,
-                context=f"{context}\n用户问题: {query}"
+            qwen_decision = self._analyze_update_scenario(
+                frozenset(extracted_symptoms),
+                f"{context}\n用户问题: {query}",
+                self.graph_manager.version
             )
             analysis_result["qwen_decision"] = {
                 "action": qwen_decision.action.value,
@@ -425,47 +600,28 @@ class EnhancedQwenGraphDemo:
         
         return analysis_result
     
+    def _analyze_update_scenario(self, symptoms: frozenset, context: str, graph_version: int):
+        """缓存Qwen更新场景分析：症状集合、背景与图谱版本都相同时直接复用上次决策；
+        图谱写入会递增版本号，此时清空旧版本的决策"""
+        key = (symptoms, context, graph_version)
+        decision = self._decision_cache.get(key)
+        if decision is None:
+            if any(cached_version != graph_version for _, _, cached_version in self._decision_cache):
+                self._decision_cache.clear()
+            decision = self._decision_cache[key] = self.qwen_engine.analyze_update_scenario(
+                current_symptoms=sorted(symptoms),
+                user_id=self.user_id,
+                context=context
+            )
+        return decision
+    
     def _extract_symptoms_from_query(self, query: str) -> List[str]:
         """从问题中提取症状"""
-        # 扩展症状关键词，特别加强糖尿病相关症状
-        symptom_keywords = {
-            # 神经系统症状
-            "头痛": ["头痛", "头疼"],
-            "头晕": ["头晕", "眩晕", "头昏"],
-            "乏力": ["乏力", "疲劳", "无力", "没力气"],
-            
-            # 糖尿病经典症状（三多一少）
-            "多尿": ["多尿", "尿多", "小便多", "尿频"],
-            "多饮": ["多饮", "口渴", "想喝水", "总是渴"],
-            "多食": ["多食", "饿得快", "总是饿", "食量大"],
-            "体重下降": ["体重下降", "消瘦", "瘦了", "体重减轻"],
-            
-            # 糖尿病早期症状
-            "视力模糊": ["视力模糊", "眼花", "看不清", "视力下降"],
-            "皮肤瘙痒": ["皮肤瘙痒", "皮肤痒", "身上痒"],
-            "伤口愈合慢": ["伤口愈合慢", "伤口不愈合", "切口感染"],
-            
-            # 其他常见症状
-            "发热": ["发热", "发烧", "体温高"],
-            "咳嗽": ["咳嗽", "咳"],
-            "胸痛": ["胸痛", "胸疼", "胸闷"],
-            "腹痛": ["腹痛", "肚子疼", "胃痛"],
-            "腹泻": ["腹泻", "拉肚子"],
-            "便秘": ["便秘", "大便困难"],
-            "失眠": ["失眠", "睡不着", "睡眠不好"],
-            "焦虑": ["焦虑", "紧张", "心慌"]
+        found_symptoms = {
+            self._SYMPTOM_KEYWORD_TO_NAME[keyword]
+            for keyword in self._SYMPTOM_PATTERN.findall(query.lower())
         }
-        
-        found_symptoms = []
-        query_lower = query.lower()
-        
-        for symptom_name, keywords in symptom_keywords.items():
-            for keyword in keywords:
-                if keyword in query_lower or keyword in query:
-                    found_symptoms.append(symptom_name)
-                    break  # 避免重复添加
-        
-        return list(set(found_symptoms))  # 去重
+        return list(found_symptoms)
     
     def _generate_update_recommendations(self, analysis_result: Dict) -> List[Dict]:
         """生成更新建议"""
@@ -552,17 +708,7 @@ class EnhancedQwenGraphDemo:
         }
         
         # 1. 提取短期记忆
-        short_term_data = list(self.memory_manager.short_term_memory)
-        extracted_memories["memory_snapshot"]["short_term_memories"] = [
-            {
-                "content": item.get("user_message", str(item)),
-                "response": item.get("ai_response", ""),
-                "timestamp": item.get("timestamp", datetime.now()).isoformat() if hasattr(item.get("timestamp", datetime.now()), 'isoformat') else str(item.get("timestamp", "")),
-                "entities": item.get("entities", {}),
-                "intent": item.get("intent", ""),
-                "importance": item.get("importance", 1)
-            } for item in short_term_data
-        ]
+        extracted_memories["memory_snapshot"]["short_term_memories"] = list(self._iter_short_term())
         
         # 2. 提取长期记忆
         try:
@@ -582,24 +728,9 @@ class EnhancedQwenGraphDemo:
         extracted_memories["memory_snapshot"]["working_memory"] = working_memory_dict
         
         # 4. 提取图谱实体和关系
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
         try:
-            # 提取疑病实体
-            cursor.execute("SELECT * FROM diseases ORDER BY created_time DESC")
-            diseases = [dict(zip([col[0] for col in cursor.description], row)) for row in cursor.fetchall()]
-            extracted_memories["memory_snapshot"]["graph_entities"]["diseases"] = diseases
-            
-            # 提取症状实体
-            cursor.execute("SELECT * FROM symptoms ORDER BY created_time DESC")
-            symptoms = [dict(zip([col[0] for col in cursor.description], row)) for row in cursor.fetchall()]
-            extracted_memories["memory_snapshot"]["graph_entities"]["symptoms"] = symptoms
-            
-            # 提取药物实体
-            cursor.execute("SELECT * FROM medicines ORDER BY created_time DESC")
-            medicines = [dict(zip([col[0] for col in cursor.description], row)) for row in cursor.fetchall()]
-            extracted_memories["memory_snapshot"]["graph_entities"]["medicines"] = medicines
+            # 提取疾病、症状、药物实体（一次查询）
+            extracted_memories["memory_snapshot"]["graph_entities"].update(self._fetch_all_entities())
             
             # 提取病症关系
             extracted_memories["memory_snapshot"]["graph_relations"]["disease_symptom"] = self.graph_manager.get_disease_symptom_relations(user_id=self.user_id)
@@ -609,8 +740,6 @@ class EnhancedQwenGraphDemo:
             
         except Exception as e:
             print(f"⚠️ 图谱数据提取失败: {e}")
-        finally:
-            conn.close()
         
         # 5. 分析记忆数据
         extracted_memories["memory_analysis"] = self._analyze_extracted_memories(extracted_memories["memory_snapshot"])
@@ -658,19 +787,7 @@ class EnhancedQwenGraphDemo:
                 })
         
         # 提取最近症状
-        for symptom in memory_snapshot["graph_entities"]["symptoms"]:
-            try:
-                created_time = datetime.fromisoformat(symptom["created_time"])
-                days_ago = (datetime.now() - created_time).days
-                if days_ago <= 30:  # 最近30天的症状
-                    analysis["recent_symptoms"].append({
-                        "name": symptom["name"],
-                        "body_part": symptom.get("body_part", ""),
-                        "intensity": symptom.get("intensity", ""),
-                        "days_ago": days_ago
-                    })
-            except:
-                pass
+        analysis["recent_symptoms"] = self._recent_symptoms(memory_snapshot["graph_entities"]["symptoms"])
         
         # 提取用药历史
         for medicine in memory_snapshot["graph_entities"]["medicines"]:
@@ -689,6 +806,42 @@ class EnhancedQwenGraphDemo:
         
         return analysis
     
+    @staticmethod
+    def _recent_symptoms(symptoms: List[Dict], days: int = 30) -> List[Dict]:
+        """筛选最近 days 天内创建的症状；时间无法解析的记录跳过"""
+        now = datetime.now()
+        if pd is not None and len(symptoms) >= VECTORIZE_MIN_ROWS:
+            # 批量解析创建时间并计算天数，无法解析的时间为 NaT，比较结果为 False
+            created = pd.to_datetime(
+                pd.Series([symptom.get("created_time") for symptom in symptoms], dtype=object),
+                format="ISO8601", errors="coerce"
+            )
+            days_ago = (pd.Timestamp(now) - created).dt.days
+            return [
+                {
+                    "name": symptoms[i]["name"],
+                    "body_part": symptoms[i].get("body_part", ""),
+                    "intensity": symptoms[i].get("intensity", ""),
+                    "days_ago": int(days_ago.iat[i])
+                }
+                for i in (days_ago <= days).to_numpy().nonzero()[0]
+            ]
+        
+        recent = []
+        for symptom in symptoms:
+            try:
+                days_ago = (now - datetime.fromisoformat(symptom["created_time"])).days
+                if days_ago <= days:
+                    recent.append({
+                        "name": symptom["name"],
+                        "body_part": symptom.get("body_part", ""),
+                        "intensity": symptom.get("intensity", ""),
+                        "days_ago": days_ago
+                    })
+            except (KeyError, TypeError, ValueError):
+                continue
+        return recent
+    
     def _generate_memory_summary(self, memory_snapshot: Dict, analysis: Dict) -> Dict:
         """生成记忆总结"""
         summary = {
@@ -833,8 +986,7 @@ class EnhancedQwenGraphDemo:
                         filepath = os.path.join(os.path.dirname(self.db_path), filename)
                         
                         try:
-                            with open(filepath, 'w', encoding='utf-8') as f:
-                                json.dump(extracted_memories, f, ensure_ascii=False, indent=2)
+                            write_json(filepath, extracted_memories)
                             print(f"✅ 记忆数据已保存到: {filepath}")
                         except Exception as e:
                             print(f"❌ 保存失败: {e}")
@@ -966,6 +1118,12 @@ class EnhancedQwenGraphDemo:
                 print(f"❌ 处理命令时出错: {e}")
 
 
+@functools.lru_cache(maxsize=1)
+def get_cached_demo(api_key: str, db_path: str = None) -> EnhancedQwenGraphDemo:
+    """返回进程内共享的演示实例，同一参数下只初始化一次图谱、Qwen引擎与记忆管理器"""
+    return EnhancedQwenGraphDemo(api_key, db_path)
+
+
 def main():
     """主函数"""
     parser = argparse.ArgumentParser(description="增强版Qwen图谱演示")
@@ -981,7 +1139,14 @@ def main():
     
     # 初始化演示系统
     demo = EnhancedQwenGraphDemo(args.api_key, args.db_path)
-    
+    try:
+        _run_demo(demo, args)
+    finally:
+        demo.close()
+
+
+def _run_demo(demo: EnhancedQwenGraphDemo, args):
+    """按命令行参数运行演示"""
     if args.extract:
         # 直接提取记忆数据
         print("📊 直接提取模式启动...")
@@ -991,8 +1156,7 @@ def main():
         # 如果指定了保存文件
         if args.save_extract:
             try:
-                with open(args.save_extract, 'w', encoding='utf-8') as f:
-                    json.dump(extracted_memories, f, ensure_ascii=False, indent=2)
+                write_json(args.save_extract, extracted_memories)
                 print(f"\n✅ 记忆数据已保存到: {args.save_extract}")
             except Exception as e:
                 print(f"\n❌ 保存失败: {e}")
@@ -7,14 +7,28 @@ DashScope集成的记忆管理器
 """
 
 import os
+import sys
 import json
 import requests
 import sqlite3
 from datetime import datetime
 from typing import Dict, List, Optional, Any
 from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import logging
 
+try:
+    import numpy as np
+except ImportError:  # numpy 未安装时逐条计算余弦相似度
+    np = None
+
+# 嵌入接口单次请求最多接受的文本条数
+EMBEDDING_BATCH_SIZE = 25
+
+# 对话上下文的 token 预算：超出后将最早的若干轮压缩为一段摘要
+CONTEXT_TOKEN_BUDGET = 3000
+SUMMARY_MAX_TOKENS = 256
+
 class DashScopeMemoryManager:
     """DashScope集成的记忆管理器"""
     
@@ -29,6 +43,14 @@ class DashScopeMemoryManager:
         self.short_term_memory = deque(maxlen=10)
         self.working_memory = {}
         
+        # 对话上下文：逐字保留的近期轮次 + 更早轮次的滚动摘要
+        self.context_turns: List[Dict] = []
+        self.history_summary = ""
+        self._context_tokens = 0
+        # 摘要在后台线程生成，不占用当前轮次的响应时间；下一轮构建上下文前合并结果
+        self._summary_executor: Optional[ThreadPoolExecutor] = None
+        self._pending_summary: Optional[tuple] = None  # (Future, 被摘要的轮数)
+        
         # DashScope配置
         self.api_key = os.getenv('DASHSCOPE_API_KEY')
         if not self.api_key:
@@ -66,8 +88,9 @@ class DashScopeMemoryManager:
         conn.commit()
         conn.close()
     
-    def _call_dashscope_api(self, messages: List[Dict], max_tokens: int = 1000) -> str:
-        """调用DashScope API"""
+    def _call_dashscope_api(self, messages: List[Dict], max_tokens: int = 1000,
+                            fallback: bool = True) -> Optional[str]:
+        """调用DashScope API；fallback=False 时失败返回 None 而非兜底文案"""
         headers = {
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json"
@@ -93,14 +116,30 @@ class DashScopeMemoryManager:
                 return result['choices'][0]['message']['content']
             else:
                 self.logger.error(f"DashScope API错误: {response.status_code} - {response.text}")
-                return "抱歉，我现在无法回答您的问题。"
+                return "抱歉，我现在无法回答您的问题。" if fallback else None
                 
         except Exception as e:
             self.logger.error(f"DashScope API调用异常: {e}")
-            return "抱歉，服务暂时不可用。"
+            return "抱歉，服务暂时不可用。" if fallback else None
     
     def _get_embedding(self, text: str) -> Optional[List[float]]:
         """获取文本嵌入向量"""
+        embeddings = self._get_embeddings([text])
+        return embeddings[0] if embeddings else None
+    
+    def _get_embeddings(self, texts: List[str]) -> Optional[List[List[float]]]:
+        """批量获取多段文本的嵌入向量，按输入顺序返回；超过单次上限时分批请求"""
+        texts = list(texts)
+        embeddings = []
+        for start in range(0, len(texts), EMBEDDING_BATCH_SIZE):
+            batch = self._request_embeddings(texts[start:start + EMBEDDING_BATCH_SIZE])
+            if batch is None:
+                return None
+            embeddings.extend(batch)
+        return embeddings
+    
+    def _request_embeddings(self, texts: List[str]) -> Optional[List[List[float]]]:
+        """一次请求获取一批文本的嵌入向量"""
         try:
             embedding_url = "https://dashscope.aliyuncs.com/api/v1/services/embeddings/text-embedding/text-embedding"
             headers = {
@@ -111,7 +150,7 @@ class DashScopeMemoryManager:
             embedding_data = {
                 "model": "text-embedding-v1",
                 "input": {
-                    "texts": [text]
+                    "texts": texts
                 }
             }
             
@@ -124,7 +163,9 @@ class DashScopeMemoryManager:
             
             if response.status_code == 200:
                 result = response.json()
-                return result['output']['embeddings'][0]['embedding']
+                # 接口按 text_index 标注每个向量对应的输入
+                items = sorted(result['output']['embeddings'], key=lambda item: item.get('text_index', 0))
+                return [item['embedding'] for item in items]
             else:
                 self.logger.error(f"嵌入API错误: {response.status_code}")
                 return None
@@ -192,10 +233,13 @@ class DashScopeMemoryManager:
                 {"role": "system", "content": "你是一个专业的医疗助手，请根据用户的医疗信息和历史记录提供专业的建议。注意用户可能有过敏史和慢性病。"}
             ]
             
-            # 添加历史记忆作为上下文
-            for memory in list(self.short_term_memory)[-3:]:  # 最近3轮对话
-                context_messages.append({"role": "user", "content": memory['user_message']})
-                context_messages.append({"role": "assistant", "content": memory['ai_response']})
+            # 添加历史记忆作为上下文：更早轮次的摘要 + 预算内的近期轮次
+            self._apply_pending_summary()
+            if self.history_summary:
+                context_messages.append({"role": "system", "content": f"此前对话摘要：{self.history_summary}"})
+            for turn in self.context_turns:
+                context_messages.append({"role": "user", "content": turn['user_message']})
+                context_messages.append({"role": "assistant", "content": turn['ai_response']})
             
             # 添加当前消息
             context_messages.append({"role": "user", "content": message})
@@ -208,6 +252,7 @@ class DashScopeMemoryManager:
             
             # 存储记忆
             self._store_memory(message, ai_response, entities, intent, importance, embedding)
+            self._append_context_turn(message, ai_response)
             
             return {
                 'success': True,
@@ -226,6 +271,68 @@ class DashScopeMemoryManager:
                 'error': str(e)
             }
     
+    @staticmethod
+    def _estimate_tokens(text: str) -> int:
+        """粗略估算 token 数：中文约一字一 token，按字符数计偏保守"""
+        return len(text)
+    
+    def _turn_tokens(self, turn: Dict) -> int:
+        return self._estimate_tokens(turn['user_message']) + self._estimate_tokens(turn['ai_response'])
+    
+    def _append_context_turn(self, user_message: str, ai_response: str):
+        """记录一轮对话到上下文，超出 token 预算时在后台压缩最早的轮次"""
+        turn = {'user_message': user_message, 'ai_response': ai_response}
+        self.context_turns.append(turn)
+        self._context_tokens += self._turn_tokens(turn)
+        if self._context_tokens > CONTEXT_TOKEN_BUDGET and self._pending_summary is None:
+            self._summarize_oldest_turns()
+    
+    def _summarize_oldest_turns(self):
+        """将较早的一半轮次（至少一轮，最新一轮始终保留原文）提交后台线程并入滚动摘要"""
+        count = max(1, len(self.context_turns) // 2)
+        if count >= len(self.context_turns):
+            self._trim_context_to_budget()
+            return
+        transcript = "\n".join(
+            f"用户：{turn['user_message']}\n助手：{turn['ai_response']}" for turn in self.context_turns[:count]
+        )
+        if self.history_summary:
+            transcript = f"已有摘要：{self.history_summary}\n{transcript}"
+        
+        messages = [
+            {"role": "system", "content": "请简要总结以下医疗对话，保留姓名、年龄、过敏史、疾病、用药等关键信息。"},
+            {"role": "user", "content": transcript}
+        ]
+        if self._summary_executor is None:
+            self._summary_executor = ThreadPoolExecutor(max_workers=1)
+        future = self._summary_executor.submit(
+            self._call_dashscope_api, messages, SUMMARY_MAX_TOKENS, False
+        )
+        self._pending_summary = (future, count)
+    
+    def _apply_pending_summary(self):
+        """合并后台摘要结果；摘要失败时丢弃最早的轮次，保证上下文不超出预算"""
+        if self._pending_summary is None:
+            return
+        future, count = self._pending_summary
+        self._pending_summary = None
+        try:
+            summary = future.result()
+        except Exception as e:
+            self.logger.error(f"对话摘要失败: {e}")
+            summary = None
+        
+        if summary:
+            self.history_summary = summary.strip()
+            del self.context_turns[:count]
+            self._context_tokens = sum(self._turn_tokens(turn) for turn in self.context_turns)
+        self._trim_context_to_budget()
+    
+    def _trim_context_to_budget(self):
+        """硬性上限：从最早的轮次开始丢弃，直到不超出预算（最新一轮始终保留）"""
+        while self._context_tokens > CONTEXT_TOKEN_BUDGET and len(self.context_turns) > 1:
+            self._context_tokens -= self._turn_tokens(self.context_turns.pop(0))
+    
     def _store_memory(self, user_message: str, ai_response: str, 
                      entities: Dict, intent: str, importance: int, 
                      embedding: Optional[List[float]]):
@@ -243,15 +350,13 @@ class DashScopeMemoryManager:
         
         self.short_term_memory.append(memory)
         
-        # 更新工作记忆
+        # 更新工作记忆（实体类型与实体文本驻留，跨轮次重复出现的实体共用同一字符串对象）
         if entities:
             for entity_type, entity_list in entities.items():
-                if entity_type not in self.working_memory:
-                    self.working_memory[entity_type] = set()
+                entity_set = self.working_memory.setdefault(sys.intern(str(entity_type)), set())
                 
                 if isinstance(entity_list, list):
-                    for entity in entity_list:
-                        self.working_memory[entity_type].add(str(entity))
+                    entity_set.update(sys.intern(str(entity)) for entity in entity_list)
         
         # 存储到数据库
         if importance >= 2:
@@ -284,56 +389,99 @@ class DashScopeMemoryManager:
     
     def search_memories(self, query: str, top_k: int = 5) -> List[Dict]:
         """搜索相关记忆"""
+        return self.search_memories_batch([query], top_k=top_k)[0]
+    
+    def search_memories_batch(self, queries: List[str], top_k: int = 5) -> List[List[Dict]]:
+        """批量搜索相关记忆：所有查询共用一次嵌入请求和一次候选记忆读取，按查询顺序返回结果"""
+        queries = list(queries)
+        if not queries:
+            return []
         try:
-            # 获取查询的嵌入向量
-            query_embedding = self._get_embedding(query)
-            if not query_embedding:
-                return []
+            # 一次请求获取全部查询的嵌入向量
+            query_embeddings = self._get_embeddings(queries)
+            if not query_embeddings or len(query_embeddings) != len(queries):
+                return [[] for _ in queries]
             
-            # 从数据库搜索
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
+            # 从数据库读取候选记忆（候选集与查询内容无关，只读一次）
+            candidates = self._load_search_candidates(top_k)
+            if not candidates:
+                return [[] for _ in queries]
             
-            cursor.execute('''
-                SELECT user_message, ai_response, entities, intent, importance, embedding
-                FROM dashscope_memories 
-                WHERE user_id = ? AND embedding IS NOT NULL
-                ORDER BY importance DESC, created_at DESC
-                LIMIT ?
-            ''', (self.user_id, top_k * 2))  # 获取更多结果用于相似度计算
-            
-            results = cursor.fetchall()
-            conn.close()
-            
-            # 计算相似度并排序
-            memory_scores = []
-            for result in results:
-                user_msg, ai_resp, entities, intent, importance, embedding_str = result
-                
-                if embedding_str:
-                    try:
-                        embedding = json.loads(embedding_str)
-                        # 简单的余弦相似度计算
-                        similarity = self._cosine_similarity(query_embedding, embedding)
-                        memory_scores.append({
-                            'user_message': user_msg,
-                            'ai_response': ai_resp,
-                            'entities': json.loads(entities) if entities else {},
-                            'intent': intent,
-                            'importance': importance,
-                            'similarity': similarity
-                        })
-                    except:
-                        continue
-            
-            # 按相似度排序
-            memory_scores.sort(key=lambda x: x['similarity'], reverse=True)
-            
-            return memory_scores[:top_k]
+            similarities = self._similarity_matrix(
+                query_embeddings, [candidate['embedding'] for candidate in candidates]
+            )
+            return [self._rank_candidates(row, candidates, top_k) for row in similarities]
             
         except Exception as e:
             self.logger.error(f"记忆搜索失败: {e}")
-            return []
+            return [[] for _ in queries]
+    
+    def _load_search_candidates(self, top_k: int) -> List[Dict]:
+        """读取带嵌入向量的候选记忆，并解析嵌入与实体"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        
+        cursor.execute('''
+            SELECT user_message, ai_response, entities, intent, importance, embedding
+            FROM dashscope_memories 
+            WHERE user_id = ? AND embedding IS NOT NULL
+            ORDER BY importance DESC, created_at DESC
+            LIMIT ?
+        ''', (self.user_id, top_k * 2))  # 获取更多结果用于相似度计算
+        
+        results = cursor.fetchall()
+        conn.close()
+        
+        candidates = []
+        for result in results:
+            user_msg, ai_resp, entities, intent, importance, embedding_str = result
+            
+            if embedding_str:
+                try:
+                    candidates.append({
+                        'user_message': user_msg,
+                        'ai_response': ai_resp,
+                        'entities': json.loads(entities) if entities else {},
+                        'intent': intent,
+                        'importance': importance,
+                        'embedding': json.loads(embedding_str)
+                    })
+                except:
+                    continue
+        return candidates
+    
+    def _similarity_matrix(self, query_embeddings: List[List[float]],
+                           memory_embeddings: List[List[float]]) -> List[List[float]]:
+        """查询 × 记忆的余弦相似度矩阵；维度一致且安装了 numpy 时一次矩阵乘法完成"""
+        dims = {len(vec) for vec in query_embeddings} | {len(vec) for vec in memory_embeddings}
+        if np is None or len(dims) != 1:
+            return [
+                [self._cosine_similarity(query, memory) for memory in memory_embeddings]
+                for query in query_embeddings
+            ]
+        # float32 足以表示余弦相似度，矩阵体积比 float64 减半，且仍走 BLAS 矩阵乘法
+        queries = self._normalize_rows(np.asarray(query_embeddings, dtype=np.float32))
+        memories = self._normalize_rows(np.asarray(memory_embeddings, dtype=np.float32))
+        return (queries @ memories.T).astype(np.float64).tolist()
+    
+    @staticmethod
+    def _normalize_rows(matrix):
+        """按行做 L2 归一化；零向量保持为零，与其他向量的相似度记为 0，与逐条计算一致"""
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return np.divide(matrix, norms, out=np.zeros_like(matrix), where=norms != 0)
+    
+    def _rank_candidates(self, similarities: List[float], candidates: List[Dict], top_k: int) -> List[Dict]:
+        """按与某条查询的相似度对候选记忆排序并取前 top_k 条"""
+        memory_scores = []
+        for candidate, similarity in zip(candidates, similarities):
+            memory = {key: value for key, value in candidate.items() if key != 'embedding'}
+            memory['similarity'] = similarity
+            memory_scores.append(memory)
+        
+        # 按相似度排序
+        memory_scores.sort(key=lambda x: x['similarity'], reverse=True)
+        
+        return memory_scores[:top_k]
     
     def _cosine_similarity(self, vec1: List[float], vec2: List[float]) -> float:
         """计算余弦相似度"""
@@ -387,3 +535,8 @@ class DashScopeMemoryManager:
         """清空会话"""
         self.short_term_memory.clear()
         self.working_memory.clear()
+        self.context_turns.clear()
+        self.history_summary = ""
+        self._context_tokens = 0
+        # 进行中的摘要属于旧会话，结果不再合并
+        self._pending_summary = None
@@ -11,12 +11,19 @@ import os
 import sqlite3
 import json
 import uuid
+import copy
+import functools
 from contextlib import contextmanager
 from datetime import datetime
 from typing import Dict, List, Optional, Any, Tuple
 from dataclasses import dataclass
 from enum import Enum
 
+try:
+    import numpy as np
+except ImportError:  # numpy 未安装时退回逐行过滤
+    np = None
+
 class SourceType(Enum):
     """数据源类型"""
     ONLINE_CONSULT = "online_consult"      # 在线咨询
@@ -109,6 +116,18 @@ class DiseaseMedicineRelation:
     created_time: Optional[datetime] = None
     updated_time: Optional[datetime] = None
 
+def _cached_by_version(method):
+    """按 (参数, 图谱版本号) 缓存只读查询结果；任何写入都会使版本号递增从而失效"""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        key = (method.__name__, args, tuple(sorted(kwargs.items())), self._version)
+        if key not in self._read_cache:
+            self._read_cache[key] = method(self, *args, **kwargs)
+        # 返回副本，避免调用方修改缓存内容
+        return copy.deepcopy(self._read_cache[key])
+    return wrapper
+
+
 class MedicalGraphManager:
     """医疗知识图谱管理器"""
     _ENTITY_TABLE_MAP = {
@@ -116,18 +135,56 @@ class MedicalGraphManager:
         'symptom': 'symptoms',
         'medicine': 'medicines'
     }
+    # get_graph_snapshot 中的结果类别（同时也是对应的表名），按此顺序输出
+    _SNAPSHOT_KINDS = (
+        'diseases', 'symptoms', 'medicines',
+        'disease_symptom_relations', 'disease_medicine_relations'
+    )
+    # 糖尿病相关实体的名称过滤条件（{alias} 为表别名）；由触发器在写入时求值并存入 is_diabetes_related 列
+    _DIABETES_NAME_FILTERS = {
+        'diseases': "({alias}.name LIKE '%糖尿病%' OR {alias}.name LIKE '%血糖%' OR {alias}.name LIKE '%diabetes%')",
+        'symptoms': "({alias}.name LIKE '%糖尿病%' OR {alias}.name LIKE '%血糖%')",
+        'medicines': "({alias}.name LIKE '%胰岛素%' OR {alias}.name LIKE '%二甲双胍%' OR {alias}.name LIKE '%insulin%')",
+    }
 
-    def __init__(self, db_path: str = "data/medical_graph.db"):
+    def __init__(self, db_path: str = "data/medical_graph.db", pragmas: Tuple[str, ...] = ()):
         self.db_path = db_path
+        # 每个连接额外执行的 PRAGMA（如 "synchronous=NORMAL"）
+        self.pragmas = tuple(pragmas)
+        # transaction() 期间所有读写共用的连接
+        self._tx_conn: Optional[sqlite3.Connection] = None
+        # 图谱版本号：每次写入递增，用于使只读查询缓存失效
+        self._version = 0
+        self._read_cache: Dict[tuple, Any] = {}
         self._init_database()
 
+    def _bump_version(self):
+        """记录一次图谱写入，丢弃旧版本的查询缓存"""
+        self._version += 1
+        self._read_cache.clear()
+
+    @property
+    def version(self) -> int:
+        """图谱版本号：每次写入递增，可作为外部缓存键的一部分"""
+        return self._version
+
+    def invalidate_cache(self):
+        """丢弃只读查询缓存；绕过本管理器直接写库（原始 SQL、其他进程）后调用"""
+        self._bump_version()
+
     @contextmanager
     def _connect(self):
         """Context manager wrapping sqlite connection with common pragmas and row factory."""
+        if self._tx_conn is not None:
+            # 处于 transaction() 中：复用事务连接，由外层统一提交或回滚
+            yield self._tx_conn
+            return
         conn = sqlite3.connect(self.db_path)
         conn.row_factory = sqlite3.Row
         conn.execute("PRAGMA foreign_keys = ON")
         conn.execute("PRAGMA busy_timeout = 3000")
+        for pragma in self.pragmas:
+            conn.execute(f"PRAGMA {pragma}")
         try:
             yield conn
             if conn.in_transaction:
@@ -139,6 +196,21 @@ class MedicalGraphManager:
         finally:
             conn.close()
 
+    @contextmanager
+    def transaction(self):
+        """在同一连接内执行多次写入，结束时一次性提交；嵌套调用并入外层事务"""
+        if self._tx_conn is not None:
+            yield self._tx_conn
+            return
+        with self._connect() as conn:
+            self._tx_conn = conn
+            try:
+                yield conn
+            finally:
+                self._tx_conn = None
+                # 事务内读到的可能是未提交（或已回滚）的数据
+                self._bump_version()
+
     @staticmethod
     def _ensure_timestamps(entity) -> Tuple[str, str]:
         """Ensure dataclass-like entity carries proper timestamps and return iso strings."""
@@ -181,6 +253,7 @@ class MedicalGraphManager:
         # 直接创建基本表结构，不使用复杂的schema文件
         self._create_basic_tables(cursor)
         self._create_indexes(cursor)
+        self._create_diabetes_flags(cursor)
         conn.commit()
         conn.close()
     
@@ -318,6 +391,32 @@ class MedicalGraphManager:
             ON medicines (name)
         ''')
 
+    def _create_diabetes_flags(self, cursor):
+        """为实体表维护写入时判定的糖尿病标记列，查询时按标记走部分索引而非全表 LIKE 扫描"""
+        for table, name_filter in self._DIABETES_NAME_FILTERS.items():
+            cursor.execute(f"PRAGMA table_info({table})")
+            cols = [row[1] for row in cursor.fetchall()]
+            if "is_diabetes_related" not in cols:
+                # 旧库补列并按名称回填一次
+                cursor.execute(f"ALTER TABLE {table} ADD COLUMN is_diabetes_related INTEGER NOT NULL DEFAULT 0")
+                cursor.execute(f"UPDATE {table} SET is_diabetes_related = {name_filter.format(alias=table)}")
+            flag_update = (f"UPDATE {table} SET is_diabetes_related = {name_filter.format(alias='new')} "
+                           f"WHERE rowid = new.rowid;")
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_{table}_diabetes_ai AFTER INSERT ON {table} BEGIN
+                    {flag_update}
+                END
+            ''')
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_{table}_diabetes_au AFTER UPDATE OF name ON {table} BEGIN
+                    {flag_update}
+                END
+            ''')
+            cursor.execute(f'''
+                CREATE INDEX IF NOT EXISTS idx_{table}_diabetes
+                ON {table} (id) WHERE is_diabetes_related = 1
+            ''')
+
     def add_disease(self, disease: DiseaseEntity) -> bool:
         """添加疾病实体"""
         try:
@@ -331,6 +430,7 @@ class MedicalGraphManager:
                     disease.id, disease.name, disease.code, disease.category,
                     disease.severity, disease.description, created_iso, updated_iso
                 ))
+            self._bump_version()
             return True
         except Exception as e:
             print(f"添加疾病实体失败: {e}")
@@ -349,6 +449,7 @@ class MedicalGraphManager:
                     symptom.id, symptom.name, symptom.description, symptom.body_part,
                     symptom.intensity, symptom.duration_type, created_iso, updated_iso
                 ))
+            self._bump_version()
             return True
         except Exception as e:
             print(f"添加症状实体失败: {e}")
@@ -370,6 +471,7 @@ class MedicalGraphManager:
                     medicine.drug_class, medicine.prescription_required,
                     created_iso, updated_iso
                 ))
+            self._bump_version()
             return True
         except Exception as e:
             print(f"添加药品实体失败: {e}")
@@ -392,6 +494,7 @@ class MedicalGraphManager:
                     relation.user_id, relation.session_id, relation.severity_correlation,
                     relation.time_correlation, created_iso, updated_iso
                 ))
+            self._bump_version()
             return True
         except Exception as e:
             print(f"添加疾病-症状关系失败: {e}")
@@ -420,6 +523,7 @@ class MedicalGraphManager:
                     relation.prescription_date, relation.treatment_outcome,
                     created_iso, updated_iso
                 ))
+            self._bump_version()
             return True
         except Exception as e:
             print(f"添加疾病-药品关系失败: {e}")
@@ -439,6 +543,7 @@ class MedicalGraphManager:
             ''', (f'%{name}%',))
             return [dict(row) for row in cursor.fetchall()]
 
+    @_cached_by_version
     def get_disease_symptom_relations(self, user_id: str = None, source: str = None) -> List[Dict]:
         """获取疾病-症状关系"""
         query = '''
@@ -464,6 +569,7 @@ class MedicalGraphManager:
             cursor = conn.execute(query, params)
             return [dict(row) for row in cursor.fetchall()]
 
+    @_cached_by_version
     def get_disease_medicine_relations(self, user_id: str = None, source: str = None) -> List[Dict]:
         """获取疾病-药品关系"""
         query = '''
@@ -537,8 +643,12 @@ class MedicalGraphManager:
 
         return summary
 
-    def remove_diabetes_related_graph_data(self, user_id: str = None) -> Dict[str, Any]:
-        """删除图谱中关于糖尿病的全部数据"""
+    def remove_diabetes_related_graph_data(self, user_id: str = None, batch_size: int = 10000) -> Dict[str, Any]:
+        """删除图谱中关于糖尿病的全部数据
+
+        每张表按 batch_size 分批删除并逐批提交，内存占用恒定，中途失败后重新调用即可从断点继续；
+        处于外层 transaction() 中时不逐批提交，由外层统一提交。
+        """
         removal_result = {
             "success": False,
             "removed_diseases": 0,
@@ -548,64 +658,74 @@ class MedicalGraphManager:
             "removed_disease_medicine_relations": 0,
             "errors": []
         }
+        user_filter, user_params = (" AND user_id = ?", (user_id,)) if user_id else ("", ())
+        # 先删关系再删实体：关系的过滤条件依赖实体名称
+        deletions = (
+            ("removed_disease_symptom_relations", "disease_symptom_relations", """(disease_id IN (
+                    SELECT id FROM diseases WHERE is_diabetes_related = 1
+                ) OR symptom_id IN (
+                    SELECT id FROM symptoms WHERE name LIKE '%糖尿病%' OR name LIKE '%血糖%' OR name LIKE '%胰岛素%'
+                ))""" + user_filter, user_params),
+            ("removed_disease_medicine_relations", "disease_medicine_relations", """(disease_id IN (
+                    SELECT id FROM diseases WHERE is_diabetes_related = 1
+                ) OR medicine_id IN (
+                    SELECT id FROM medicines WHERE is_diabetes_related = 1
+                ))""" + user_filter, user_params),
+            ("removed_diseases", "diseases", "is_diabetes_related = 1", ()),
+            # 谨慎删除，只删除明确的糖尿病症状
+            ("removed_symptoms", "symptoms", "name LIKE '%糖尿病%' OR name LIKE '%血糖异常%'", ()),
+            ("removed_medicines", "medicines", "is_diabetes_related = 1", ()),
+        )
         try:
             with self._connect() as conn:
-                cursor = conn.cursor()
-
-                # 1. 删除糖尿病相关的疾病-症状关系
-                ds_delete_query = """
-                    DELETE FROM disease_symptom_relations
-                    WHERE (disease_id IN (
-                        SELECT id FROM diseases WHERE name LIKE '%糖尿病%' OR name LIKE '%血糖%' OR name LIKE '%diabetes%'
-                    ) OR symptom_id IN (
-                        SELECT id FROM symptoms WHERE name LIKE '%糖尿病%' OR name LIKE '%血糖%' OR name LIKE '%胰岛素%'
-                    ))
-                """
-                if user_id:
-                    ds_delete_query += " AND user_id = ?"
-                    cursor.execute(ds_delete_query, (user_id,))
-                else:
-                    cursor.execute(ds_delete_query)
-                removal_result["removed_disease_symptom_relations"] = cursor.rowcount
-
-                # 2. 删除糖尿病相关的疾病-药品关系
-                dm_delete_query = """
-                    DELETE FROM disease_medicine_relations
-                    WHERE (disease_id IN (
-                        SELECT id FROM diseases WHERE name LIKE '%糖尿病%' OR name LIKE '%血糖%' OR name LIKE '%diabetes%'
-                    ) OR medicine_id IN (
-                        SELECT id FROM medicines WHERE name LIKE '%胰岛素%' OR name LIKE '%二甲双胍%' OR name LIKE '%insulin%'
-                    ))
-                """
-                if user_id:
-                    dm_delete_query += " AND user_id = ?"
-                    cursor.execute(dm_delete_query, (user_id,))
-                else:
-                    cursor.execute(dm_delete_query)
-                removal_result["removed_disease_medicine_relations"] = cursor.rowcount
-
-                # 3. 删除糖尿病相关的疾病实体
-                disease_delete_query = "DELETE FROM diseases WHERE name LIKE '%糖尿病%' OR name LIKE '%血糖%' OR name LIKE '%diabetes%'"
-                cursor.execute(disease_delete_query)
-                removal_result["removed_diseases"] = cursor.rowcount
-
-                # 4. 删除糖尿病相关的症状实体（谨慎删除，只删除明确的糖尿病症状）
-                symptom_delete_query = "DELETE FROM symptoms WHERE name LIKE '%糖尿病%' OR name LIKE '%血糖异常%'"
-                cursor.execute(symptom_delete_query)
-                removal_result["removed_symptoms"] = cursor.rowcount
-
-                # 5. 删除糖尿病相关的药物实体
-                medicine_delete_query = "DELETE FROM medicines WHERE name LIKE '%胰岛素%' OR name LIKE '%二甲双胍%' OR name LIKE '%insulin%'"
-                cursor.execute(medicine_delete_query)
-                removal_result["removed_medicines"] = cursor.rowcount
-
+                for result_key, table, condition, params in deletions:
+                    removal_result[result_key] = self._delete_in_batches(conn, table, condition, params, batch_size)
                 removal_result["success"] = True
 
         except Exception as e:
             removal_result["errors"].append(str(e))
             print(f"删除图谱糖尿病数据失败: {e}")
+        finally:
+            self._bump_version()
         return removal_result
-    
+
+    def _delete_in_batches(self, conn, table: str, condition: str, params: tuple, batch_size: int) -> int:
+        """按 rowid 分批删除满足条件的行，返回删除总数"""
+        own_transaction = self._tx_conn is None
+        query = f"DELETE FROM {table} WHERE rowid IN (SELECT rowid FROM {table} WHERE {condition} LIMIT ?)"
+        removed = 0
+        while True:
+            if own_transaction:
+                # 一开始就取得写锁，避免批内升级锁时遇到 SQLITE_BUSY
+                conn.execute("BEGIN IMMEDIATE")
+            deleted = conn.execute(query, (*params, batch_size)).rowcount
+            if own_transaction:
+                conn.commit()
+            removed += deleted
+            if deleted < batch_size:
+                return removed
+
+    def _disease_symptom_columns(self, user_id: str = None) -> Dict[str, Any]:
+        """疾病-症状关系的列式视图（疾病名、置信度），按图谱版本缓存"""
+        key = ('_disease_symptom_columns', user_id, self._version)
+        if key not in self._read_cache:
+            relations = self.get_disease_symptom_relations(user_id=user_id)
+            names = [rel['disease_name'] or '' for rel in relations]
+            confidences = [rel['confidence'] or 0.0 for rel in relations]
+            if np is not None:
+                names = np.array(names, dtype=str)
+                confidences = np.array(confidences, dtype=np.float32)
+            self._read_cache[key] = {'disease_name': names, 'confidence': confidences}
+        return self._read_cache[key]
+
+    def get_disease_symptom_relations_mask(self, substring: str, user_id: str = None):
+        """疾病名包含 substring 的关系掩码，顺序与 get_disease_symptom_relations 一致"""
+        names = self._disease_symptom_columns(user_id)['disease_name']
+        if np is None:
+            return [substring in name for name in names]
+        return np.char.find(names, substring) >= 0
+
+    @_cached_by_version
     def get_diabetes_related_data(self, user_id: str = None) -> Dict[str, Any]:
         """获取图谱中糖尿病相关的数据，用于删除前预览"""
         diabetes_data = {
@@ -619,18 +739,15 @@ class MedicalGraphManager:
         try:
             with self._connect() as conn:
                 diabetes_data["diseases"] = [dict(row) for row in conn.execute("""
-                    SELECT * FROM diseases
-                    WHERE name LIKE '%糖尿病%' OR name LIKE '%血糖%' OR name LIKE '%diabetes%'
+                    SELECT * FROM diseases WHERE is_diabetes_related = 1
                 """)]
 
                 diabetes_data["symptoms"] = [dict(row) for row in conn.execute("""
-                    SELECT * FROM symptoms
-                    WHERE name LIKE '%糖尿病%' OR name LIKE '%血糖%'
+                    SELECT * FROM symptoms WHERE is_diabetes_related = 1
                 """)]
 
                 diabetes_data["medicines"] = [dict(row) for row in conn.execute("""
-                    SELECT * FROM medicines
-                    WHERE name LIKE '%胰岛素%' OR name LIKE '%二甲双胍%' OR name LIKE '%insulin%'
+                    SELECT * FROM medicines WHERE is_diabetes_related = 1
                 """)]
 
                 ds_query = """
@@ -638,16 +755,14 @@ class MedicalGraphManager:
                     FROM disease_symptom_relations dsr
                     JOIN diseases d ON dsr.disease_id = d.id
                     JOIN symptoms s ON dsr.symptom_id = s.id
-                    WHERE (d.name LIKE '%糖尿病%' OR d.name LIKE '%血糖%' OR d.name LIKE '%diabetes%'
-                           OR s.name LIKE '%糖尿病%' OR s.name LIKE '%血糖%')
+                    WHERE (d.is_diabetes_related = 1 OR s.is_diabetes_related = 1)
                 """
                 dm_query = """
                     SELECT dmr.*, d.name as disease_name, m.name as medicine_name
                     FROM disease_medicine_relations dmr
                     JOIN diseases d ON dmr.disease_id = d.id
                     JOIN medicines m ON dmr.medicine_id = m.id
-                    WHERE (d.name LIKE '%糖尿病%' OR d.name LIKE '%血糖%' OR d.name LIKE '%diabetes%'
-                           OR m.name LIKE '%胰岛素%' OR m.name LIKE '%二甲双胍%' OR m.name LIKE '%insulin%')
+                    WHERE (d.is_diabetes_related = 1 OR m.is_diabetes_related = 1)
                 """
 
                 if user_id:
@@ -668,6 +783,76 @@ class MedicalGraphManager:
         
         return diabetes_data
 
+    @_cached_by_version
+    def get_graph_snapshot(self, user_id: str = None) -> Dict[str, Any]:
+        """一次 UNION ALL 查询取回图谱快照
+
+        返回用户的全部疾病-症状、疾病-药品关系，以及 "diabetes" 键下与
+        get_diabetes_related_data 结构相同的糖尿病相关实体和关系。
+        """
+        # 各分支按 kind 打标签，缺失的列以 NULL 补齐；关系分支附带糖尿病命中标记
+        with self._connect() as conn:
+            columns = {
+                table: tuple(row['name'] for row in conn.execute(f"PRAGMA table_info({table})"))
+                for table in self._SNAPSHOT_KINDS
+            }
+            kind_columns = {
+                'diseases': columns['diseases'],
+                'symptoms': columns['symptoms'],
+                'medicines': columns['medicines'],
+                'disease_symptom_relations': columns['disease_symptom_relations'] + ('disease_name', 'symptom_name'),
+                'disease_medicine_relations': columns['disease_medicine_relations'] + ('disease_name', 'medicine_name'),
+            }
+            union_columns = tuple(dict.fromkeys(col for cols in kind_columns.values() for col in cols))
+
+            def select(kind, alias, extra, diabetes_match, sort_confidence, sort_time):
+                exprs = [extra.get(col, f"{alias}.{col}") if col in kind_columns[kind] else f"NULL AS {col}"
+                         for col in union_columns]
+                return (f"SELECT '{kind}' AS kind, {self._SNAPSHOT_KINDS.index(kind)} AS kind_order, "
+                        f"{', '.join(exprs)}, {diabetes_match} AS diabetes_match, "
+                        f"{sort_confidence} AS sort_confidence, {sort_time} AS sort_time, {alias}.rowid AS sort_rowid")
+
+            user_filter, params = "", []
+            if user_id:
+                user_filter = " AND {alias}.user_id = ?"
+                params = [user_id, user_id]
+            query = " UNION ALL ".join([
+                *(f"{select(table, 'e', {}, 1, 'NULL', 'NULL')} FROM {table} e "
+                  f"WHERE e.is_diabetes_related = 1"
+                  for table in ('diseases', 'symptoms', 'medicines')),
+                f"""{select('disease_symptom_relations', 'dsr', {'disease_name': 'd.name AS disease_name', 'symptom_name': 's.name AS symptom_name'},
+                            "(d.is_diabetes_related = 1 OR s.is_diabetes_related = 1)",
+                            'dsr.confidence', 'dsr.created_time')}
+                    FROM disease_symptom_relations dsr
+                    JOIN diseases d ON dsr.disease_id = d.id
+                    JOIN symptoms s ON dsr.symptom_id = s.id
+                    WHERE 1=1{user_filter.format(alias='dsr')}""",
+                f"""{select('disease_medicine_relations', 'dmr', {'disease_name': 'd.name AS disease_name', 'medicine_name': 'm.name AS medicine_name'},
+                            "(d.is_diabetes_related = 1 OR m.is_diabetes_related = 1)",
+                            'NULL', 'dmr.created_time')}
+                    FROM disease_medicine_relations dmr
+                    JOIN diseases d ON dmr.disease_id = d.id
+                    JOIN medicines m ON dmr.medicine_id = m.id
+                    WHERE 1=1{user_filter.format(alias='dmr')}""",
+            ]) + " ORDER BY kind_order, sort_confidence DESC, sort_time DESC, sort_rowid"
+
+            snapshot = {
+                'disease_symptom_relations': [],
+                'disease_medicine_relations': [],
+                'diabetes': {kind: [] for kind in self._SNAPSHOT_KINDS},
+            }
+            for row in conn.execute(query, params):
+                kind = row['kind']
+                record = {col: row[col] for col in kind_columns[kind]}
+                if kind == 'disease_medicine_relations':
+                    record['side_effects'] = self._deserialize_optional_json(record.get('side_effects'))
+                    record['contraindications'] = self._deserialize_optional_json(record.get('contraindications'))
+                if kind in snapshot:
+                    snapshot[kind].append(record)
+                if row['diabetes_match']:
+                    snapshot['diabetes'][kind].append(dict(record) if kind in snapshot else record)
+        return snapshot
+
     @staticmethod
     def generate_entity_id(entity_type: str, name: str) -> str:
         """生成实体ID"""
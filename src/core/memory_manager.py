@@ -8,11 +8,13 @@ This allows using Cloud Spanner for scalable deployments while keeping the
 lightweight SQLite store for tests and local development.
 """
 
+from contextlib import contextmanager
 from datetime import datetime, date
 from typing import Dict, List, Optional
 from collections import deque
 
 import os
+import re
 
 from src.storage import (
     MemoryStore,
@@ -28,6 +30,95 @@ from src.modules.medical_validator import (
     Precision,
 )
 
+# 疾病标签：DISEASE 实体名包含关键词时为记忆打上对应标签，按标签筛选记忆时无需再扫描文本
+DISEASE_TAG_KEYWORDS = {
+    "diabetes": "糖尿病",
+}
+
+
+# 糖尿病相关关键词：合并为一个预编译正则，一次扫描即可匹配全部关键词
+DIABETES_KEYWORDS = ('糖尿病', '血糖', '胰岛素', '家族史', '糖尿病风险', 'diabetes')
+DIABETES_RE = re.compile('|'.join(map(re.escape, DIABETES_KEYWORDS)))
+
+
+def _keyword_re(keywords) -> "re.Pattern":
+    """将关键词列表合并为一个预编译的交替正则"""
+    return re.compile('|'.join(map(re.escape, keywords)))
+
+
+# 意图关键词：按优先级排列，每个意图的关键词在模块加载时编译为一个正则
+INTENT_PATTERNS = {
+    'REQUEST_MEDICINE': _keyword_re(('开药', '配药', '买药')),
+    'PRESCRIPTION_INQUIRY': _keyword_re(('怎么吃', '用法', '副作用')),
+    'EMERGENCY': _keyword_re(('救命', '紧急', '胸痛')),
+}
+
+# 实体词表：同一个词可能属于多个类别（如“糖尿病”既是症状也是疾病），按类别分别匹配
+ENTITY_KEYWORDS = {
+    'MEDICINE': ('布洛芬', '阿司匹林', '感冒药', '青霉素', '氨氯地平', '胰岛素'),
+    'SYMPTOM': ('头痛', '发热', '咳嗽', '高血压', '糖尿病', '过敏'),
+    'DISEASE': ('糖尿病', '高血压', '心脏病', '哮喘', '肝病', '肾病'),
+    'ALLERGY': ('过敏', '青霉素过敏', '花粉过敏', '食物过敏'),
+}
+# 全部实体词合并为一个正则，消息中没有任何实体词时可一次扫描后跳过逐词匹配
+ENTITY_ANY_RE = _keyword_re(
+    dict.fromkeys(word for words in ENTITY_KEYWORDS.values() for word in words)
+)
+AGE_RE = re.compile(r'(\d+)岁|今年(\d+)')
+NAME_PREFIXES = ('我叫', '我是', '我的名字是')
+NAME_RE = re.compile(r'[\u4e00-\u9fff]+')
+
+
+def _entity_texts(entities: Dict):
+    """依次产出实体字典中每个实体的文本"""
+    for entity_list in entities.values():
+        if isinstance(entity_list, (list, tuple)):
+            for entity_info in entity_list:
+                yield str(entity_info[0]) if isinstance(entity_info, (list, tuple)) else str(entity_info)
+
+
+def _memory_texts(memory_item: Dict):
+    """依次产出记忆条目中参与关键词匹配的文本：用户消息、回复、各实体文本"""
+    yield memory_item.get('user_message') or ''
+    yield memory_item.get('ai_response') or ''
+    yield from _entity_texts(memory_item.get('entities') or {})
+
+
+def is_diabetes_related(memory_item: Dict) -> bool:
+    """记忆条目的用户消息、回复或实体文本中是否出现糖尿病关键词
+
+    条目带有 add_conversation 写入时判定的 diabetes_related 标记时直接返回该标记。
+    """
+    flag = memory_item.get('diabetes_related')
+    if flag is not None:
+        return flag
+    # 以单元分隔符拼接，避免关键词跨字段误匹配
+    return DIABETES_RE.search('\x1f'.join(_memory_texts(memory_item))) is not None
+
+
+def any_diabetes_related(memory_items) -> bool:
+    """整体预判是否有任一条目与糖尿病相关
+
+    带标记的条目直接读标记；其余条目的文本拼接后只扫描一次，全部不相关时调用方可跳过逐条判定。
+    """
+    texts = []
+    for memory_item in memory_items:
+        flag = memory_item.get('diabetes_related')
+        if flag:
+            return True
+        if flag is None:
+            texts.extend(_memory_texts(memory_item))
+    return bool(texts) and DIABETES_RE.search('\x1f'.join(texts)) is not None
+
+
+def diabetes_flags(memory_items) -> List[bool]:
+    """逐条给出糖尿病相关判定，整体预判无命中时直接返回全 False"""
+    memory_items = list(memory_items)
+    if not any_diabetes_related(memory_items):
+        return [False] * len(memory_items)
+    return [is_diabetes_related(memory_item) for memory_item in memory_items]
+
+
 class SimpleMemoryManager:
     """简化版记忆管理器"""
 
@@ -36,6 +127,7 @@ class SimpleMemoryManager:
         user_id: str,
         db_path: str = "data/simple_memory.db",
         store: Optional[MemoryStore] = None,
+        short_term_capacity: int = 10,
     ):
         self.user_id = user_id
         # 仍然保留 ``db_path`` 参数以兼容现有代码；当未提供
@@ -51,8 +143,8 @@ class SimpleMemoryManager:
             else:
                 self.store = SQLiteMemoryStore(db_path)
 
-        # 短期记忆
-        self.short_term_memory = deque(maxlen=10)
+        # 短期记忆：定长 deque，超出容量时自动以 O(1) 淘汰最早的记忆
+        self.short_term_memory = deque(maxlen=short_term_capacity)
         self.working_memory = {}
         # 症状时间窗（仅在运行期维护，用于时间精度提升；键：症状名）
         self.symptom_windows: Dict[str, TimeWindow] = {}
@@ -64,8 +156,9 @@ class SimpleMemoryManager:
         entities: Dict = None,
         intent: str = None,
         importance: int = 2,
+        persist: bool = True,
     ) -> bool:
-        """添加对话"""
+        """添加对话；persist=False 时只写入短期与工作记忆（如回放已落库的对话）"""
         try:
             # 1) 基础有效性校验（拦截明显造假/矛盾信息）
             validation = assess_statement(user_message)
@@ -109,14 +202,18 @@ class SimpleMemoryManager:
                         'phrase': parsed.phrase,
                     })
 
+            # 写入时统一记录结构：文本字段保证为字符串，读取方可直接按键取值
             conversation = {
-                "user_message": user_message,
-                "ai_response": ai_response,
+                "user_message": user_message or '',
+                "ai_response": ai_response or '',
                 "timestamp": datetime.now(),
                 "entities": entities,
                 "intent": intent,
                 "importance": importance,
+                "tags": self._derive_tags(entities),
             }
+            # 写入时判定一次是否与糖尿病相关，删除时直接按标记筛选
+            conversation["diabetes_related"] = is_diabetes_related(conversation)
 
             # 将时间归一化结果写入实体（不破坏原结构）
             if time_payloads:
@@ -126,7 +223,7 @@ class SimpleMemoryManager:
             self.short_term_memory.append(conversation)
             self._update_working_memory(entities, intent)
 
-            if importance_for_persist >= 3:
+            if persist and importance_for_persist >= 3:
                 self.store.add_conversation(
                     self.user_id,
                     user_message,
@@ -140,6 +237,17 @@ class SimpleMemoryManager:
         except Exception:
             return False
     
+    @staticmethod
+    def _derive_tags(entities: Dict) -> set:
+        """根据疾病实体生成记忆标签"""
+        tags = set()
+        for entity in entities.get('DISEASE', ()):
+            name = entity[0] if isinstance(entity, (list, tuple)) and entity else str(entity)
+            for tag, keyword in DISEASE_TAG_KEYWORDS.items():
+                if keyword in name:
+                    tags.add(tag)
+        return tags
+
     def _update_working_memory(self, entities: Dict, intent: str):
         """更新工作记忆"""
         if entities:
@@ -151,7 +259,8 @@ class SimpleMemoryManager:
                     self.working_memory[entity_type] = set()
                 
                 for entity_info in entity_list:
-                    if isinstance(entity_info, tuple):
+                    # 实体可能是 (文本, 起, 止) 元组，也可能是 JSON 形式的列表
+                    if isinstance(entity_info, (list, tuple)):
                         self.working_memory[entity_type].add(entity_info[0])
                     else:
                         self.working_memory[entity_type].add(entity_info)
@@ -178,6 +287,23 @@ class SimpleMemoryManager:
         """Alias for :meth:`retrieve_memories` for backward compatibility."""
         return self.retrieve_memories(query, limit)
     
+    @contextmanager
+    def transaction(self):
+        """将代码块内的长期记忆写入合并为一次提交"""
+        with self.store.transaction():
+            yield self
+
+    def add_conversations_bulk(self, records: List) -> List[bool]:
+        """批量添加对话，全部写入在同一事务内提交
+
+        records 中每项为 add_conversation 的位置参数元组，或以参数名为键的字典。
+        """
+        with self.transaction():
+            return [
+                self.add_conversation(**record) if isinstance(record, dict) else self.add_conversation(*record)
+                for record in records
+            ]
+
     def clear_session(self):
         """清空会话"""
         self.short_term_memory.clear()
@@ -185,79 +311,28 @@ class SimpleMemoryManager:
     
     def remove_diabetes_related_memories(self):
         """删除短期记忆中关于糖尿病的全部内容"""
-        diabetes_keywords = ['糖尿病', '血糖', '胰岛素', '家族史', '糖尿病风险', 'diabetes']
-        
-        # 过滤短期记忆
-        filtered_memories = []
+        # 一次遍历筛出保留的短期记忆，整体替换；整体预判无命中时跳过
         removed_count = 0
+        if any_diabetes_related(self.short_term_memory):
+            kept_memories = [item for item in self.short_term_memory if not is_diabetes_related(item)]
+            removed_count = len(self.short_term_memory) - len(kept_memories)
+            self.short_term_memory.clear()
+            self.short_term_memory.extend(kept_memories)
         
-        for memory_item in self.short_term_memory:
-            is_diabetes_related = False
-            
-            # 检查用户消息
-            user_message = memory_item.get('user_message', '')
-            ai_response = memory_item.get('ai_response', '')
-            entities = memory_item.get('entities', {})
-            
-            # 检查消息内容是否包含糖尿病关键词
-            for keyword in diabetes_keywords:
-                if (keyword in user_message or 
-                    keyword in ai_response):
-                    is_diabetes_related = True
-                    break
-            
-            # 检查实体是否包含糖尿病相关内容
-            if not is_diabetes_related and entities:
-                for entity_type, entity_list in entities.items():
-                    if isinstance(entity_list, list):
-                        for entity_info in entity_list:
-                            entity_text = entity_info[0] if isinstance(entity_info, (list, tuple)) else str(entity_info)
-                            for keyword in diabetes_keywords:
-                                if keyword in entity_text:
-                                    is_diabetes_related = True
-                                    break
-                            if is_diabetes_related:
-                                break
-                    if is_diabetes_related:
-                        break
-            
-            if not is_diabetes_related:
-                filtered_memories.append(memory_item)
-            else:
-                removed_count += 1
-        
-        # 更新短期记忆
-        self.short_term_memory.clear()
-        for memory in filtered_memories:
-            self.short_term_memory.append(memory)
-        
-        # 清理工作记忆中的糖尿病相关内容
-        diabetes_working_keys = []
+        # 清理工作记忆：集合值过滤掉相关元素，字符串值命中则整键删除；遍历结束后再统一修改
+        filtered_sets = {}
+        diabetes_working_keys = set()
         for key, value in self.working_memory.items():
             if isinstance(value, set):
-                # 检查set中的元素
-                filtered_set = set()
-                for item in value:
-                    is_diabetes_item = False
-                    for keyword in diabetes_keywords:
-                        if keyword in str(item):
-                            is_diabetes_item = True
-                            break
-                    if not is_diabetes_item:
-                        filtered_set.add(item)
-                
+                filtered_set = {item for item in value if not DIABETES_RE.search(str(item))}
                 if len(filtered_set) != len(value):
-                    self.working_memory[key] = filtered_set
-            elif isinstance(value, str):
-                # 检查字符串值
-                for keyword in diabetes_keywords:
-                    if keyword in value:
-                        diabetes_working_keys.append(key)
-                        break
+                    filtered_sets[key] = filtered_set
+            elif isinstance(value, str) and DIABETES_RE.search(value):
+                diabetes_working_keys.add(key)
         
-        # 删除糖尿病相关的工作记忆键
+        self.working_memory.update(filtered_sets)
         for key in diabetes_working_keys:
-            del self.working_memory[key]
+            self.working_memory.pop(key, None)
         
         return {
             'removed_short_term': removed_count,
@@ -323,73 +398,51 @@ class SimpleMemoryIntegratedAI:
                 'response': '处理失败'
             }
     
+    def process_messages(self, user_messages: List[str], user_id: str = "default") -> List[Dict]:
+        """批量处理消息：按顺序逐条处理，全部长期记忆写入在同一事务内提交"""
+        with self.get_memory_manager(user_id).transaction():
+            return [self.process_message(message, user_id) for message in user_messages]
+    
     def _detect_intent(self, message: str) -> str:
         """简化意图检测"""
         message_lower = message.lower()
         
-        if any(word in message_lower for word in ['开药', '配药', '买药']):
-            return 'REQUEST_MEDICINE'
-        elif any(word in message_lower for word in ['怎么吃', '用法', '副作用']):
-            return 'PRESCRIPTION_INQUIRY'
-        elif any(word in message_lower for word in ['救命', '紧急', '胸痛']):
-            return 'EMERGENCY'
-        else:
-            return 'NORMAL_CONSULTATION'
+        for intent, pattern in INTENT_PATTERNS.items():
+            if pattern.search(message_lower):
+                return intent
+        return 'NORMAL_CONSULTATION'
     
     def _recognize_entities(self, message: str) -> Dict:
         """增强实体识别"""
         entities = {}
         
-        # 药物实体
-        medicines = ['布洛芬', '阿司匹林', '感冒药', '青霉素', '氨氯地平', '胰岛素']
-        
-        # 症状实体
-        symptoms = ['头痛', '发热', '咳嗽', '高血压', '糖尿病', '过敏']
-        
-        # 疾病实体
-        diseases = ['糖尿病', '高血压', '心脏病', '哮喘', '肝病', '肾病']
-        
-        # 过敏相关
-        allergies = ['过敏', '青霉素过敏', '花粉过敏', '食物过敏']
-        
         # 年龄相关（简单匹配）
-        import re
-        age_pattern = r'(\d+)岁|今年(\d+)'
-        age_match = re.search(age_pattern, message)
+        age_match = AGE_RE.search(message)
         if age_match:
             age = age_match.group(1) or age_match.group(2)
             entities['AGE'] = [(f"{age}岁", age_match.start(), age_match.end())]
         
         # 姓名相关（简单识别）
-        name_patterns = ['我叫', '我是', '我的名字是']
-        for pattern in name_patterns:
+        for pattern in NAME_PREFIXES:
             if pattern in message:
                 start_idx = message.find(pattern) + len(pattern)
                 # 查找后面的中文字符作为姓名
-                name_match = re.search(r'[\u4e00-\u9fff]+', message[start_idx:start_idx+10])
+                name_match = NAME_RE.search(message, start_idx, start_idx + 10)
                 if name_match:
                     name = name_match.group()
-                    entities['PERSON'] = [(name, start_idx + name_match.start(), start_idx + name_match.end())]
+                    entities['PERSON'] = [(name, name_match.start(), name_match.end())]
                     break
         
         # 遗传病史
         if '遗传病史' in message or '家族史' in message:
             entities['FAMILY_HISTORY'] = [('遗传病史', message.find('遗传病史'), message.find('遗传病史') + 4)]
         
-        # 检查各类实体
-        found_medicines = [m for m in medicines if m in message]
-        found_symptoms = [s for s in symptoms if s in message]
-        found_diseases = [d for d in diseases if d in message]
-        found_allergies = [a for a in allergies if a in message]
-        
-        if found_medicines:
-            entities['MEDICINE'] = [(m, message.find(m), message.find(m) + len(m)) for m in found_medicines]
-        if found_symptoms:
-            entities['SYMPTOM'] = [(s, message.find(s), message.find(s) + len(s)) for s in found_symptoms]
-        if found_diseases:
-            entities['DISEASE'] = [(d, message.find(d), message.find(d) + len(d)) for d in found_diseases]
-        if found_allergies:
-            entities['ALLERGY'] = [(a, message.find(a), message.find(a) + len(a)) for a in found_allergies]
+        # 检查各类实体：先用合并正则整体扫描一次，无命中时直接返回
+        if ENTITY_ANY_RE.search(message):
+            for label, words in ENTITY_KEYWORDS.items():
+                found = [(w, message.find(w), message.find(w) + len(w)) for w in words if w in message]
+                if found:
+                    entities[label] = found
         
         return entities
     
@@ -9,6 +9,10 @@ Medical Knowledge Graph Intelligent Update Engine with Qwen3
 import os
 import sys
 import json
+import shelve
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Tuple, Any
 from dataclasses import dataclass
@@ -23,6 +27,17 @@ from configs.dashscope_client import DashScopeClientFactory, MedicalDashScopeCli
 
 from .medical_graph_manager import MedicalGraphManager
 
+try:
+    from diskcache import Cache as DiskCache
+except ImportError:  # 未安装 diskcache 时退回标准库 shelve
+    DiskCache = None
+
+# Qwen响应缓存版本：提示词或解析逻辑变化时递增，旧缓存随之失效
+RESPONSE_CACHE_VERSION = 1
+
+# 批量分析时同时在途的Qwen请求上限（与百炼接口的并发限制保持一致）
+BATCH_MAX_CONCURRENCY = 10
+
 class UpdateAction(Enum):
     """更新动作类型"""
     CREATE_NEW = "create_new"                    # 创建新关系
@@ -47,8 +62,15 @@ class UpdateDecision:
 class QwenGraphUpdateEngine:
     """基于Qwen3的智能图谱更新引擎（使用统一客户端）"""
     
-    def __init__(self, graph_manager: MedicalGraphManager, api_key: str = None):
+    def __init__(self, graph_manager: MedicalGraphManager, api_key: str = None,
+                 cache_dir: Optional[str] = None):
         self.graph_manager = graph_manager
+        # 设置后，相同医疗上下文的Qwen响应持久化到磁盘，重放场景时跳过网络调用
+        self.cache_dir = cache_dir
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+        # 批量分析时多个线程共享同一缓存文件，读写需串行
+        self._cache_lock = threading.Lock()
         
         # 使用统一的医疗专用客户端
         try:
@@ -86,6 +108,29 @@ class QwenGraphUpdateEngine:
         
         return decision
     
+    def analyze_update_scenario_batch(self, cases: List[Tuple[List[str], str, str]],
+                                      max_concurrency: int = BATCH_MAX_CONCURRENCY) -> List[UpdateDecision]:
+        """批量分析多个(症状, 用户ID, 背景)场景，按输入顺序返回决策
+        
+        图谱读取在调用线程中完成，Qwen请求并发发出，整体耗时接近单次网络往返；
+        429等瞬时错误由客户端会话的指数退避重试处理。
+        """
+        contexts = []
+        for current_symptoms, user_id, context in cases:
+            contexts.append(self._build_medical_context(
+                self.graph_manager.get_disease_symptom_relations(user_id=user_id),
+                self.graph_manager.get_disease_medicine_relations(user_id=user_id),
+                current_symptoms, context
+            ))
+        
+        if not contexts:
+            return []
+        
+        with ThreadPoolExecutor(max_workers=min(max_concurrency, len(contexts))) as pool:
+            responses = list(pool.map(self._call_qwen_api, contexts))
+        
+        return [self._parse_qwen_response(response) for response in responses]
+    
     def _build_medical_context(self, historical_relations: List[Dict], 
                              dm_relations: List[Dict], current_symptoms: List[str],
                              context: str) -> str:
@@ -181,6 +226,16 @@ class QwenGraphUpdateEngine:
     def _call_qwen_api(self, medical_context: str) -> str:
         """调用百炼API Qwen3模型（使用统一客户端）"""
         
+        cache_key = None
+        if self.cache_dir:
+            cache_key = hashlib.blake2b(
+                f"{RESPONSE_CACHE_VERSION}|{medical_context}".encode("utf-8")
+            ).hexdigest()
+            with self._cache_lock, self._open_response_cache() as cache:
+                cached = cache.get(cache_key)
+            if cached is not None:
+                return cached
+        
         try:
             # 使用统一客户端生成响应
             response = self.qwen_client.generate_response(
@@ -188,11 +243,22 @@ class QwenGraphUpdateEngine:
                 max_tokens=2000,
                 temperature=0.1
             )
-            return response
             
         except Exception as e:
             print(f"调用Qwen API失败: {e}")
+            # 后备分析结果不写入缓存
             return self._fallback_analysis(medical_context)
+        
+        if cache_key:
+            with self._cache_lock, self._open_response_cache() as cache:
+                cache[cache_key] = response
+        return response
+    
+    def _open_response_cache(self):
+        """打开响应缓存：优先 diskcache，否则使用 shelve 文件"""
+        if DiskCache is not None:
+            return DiskCache(self.cache_dir)
+        return shelve.open(os.path.join(self.cache_dir, "qwen_responses"))
     
     def _fallback_analysis(self, medical_context: str) -> str:
         """API调用失败时的后备分析"""
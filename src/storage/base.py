@@ -2,7 +2,8 @@
 
 from __future__ import annotations
 
-from typing import Dict, List, Optional
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
 
 
 class MemoryStore:
@@ -15,8 +16,16 @@ class MemoryStore:
     * ``add_conversation`` – persist a single conversation turn
     * ``get_stats`` – return aggregated statistics for a user
     * ``search_memories`` – retrieve relevant memories for a query
+
+    Backends may also override ``transaction`` to group several writes into
+    a single commit; the default implementation is a no-op.
     """
 
+    @contextmanager
+    def transaction(self) -> Iterator[None]:
+        """Group the writes issued inside the block into one commit."""
+        yield
+
     def add_conversation(
         self,
         user_id: str,
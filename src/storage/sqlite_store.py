@@ -6,8 +6,9 @@ import json
 import math
 import os
 import sqlite3
+from contextlib import contextmanager
 from datetime import datetime
-from typing import Dict, List, Optional
+from typing import Dict, Iterator, List, Optional
 
 from .base import MemoryStore
 
@@ -17,11 +18,60 @@ class SQLiteMemoryStore(MemoryStore):
 
     def __init__(self, db_path: str = "data/simple_memory.db") -> None:
         self.db_path = db_path
+        # Connection shared by every operation while ``transaction`` is active.
+        self._tx_conn: Optional[sqlite3.Connection] = None
         os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
         self._init_database()
 
+    @contextmanager
+    def _connection(self) -> Iterator[sqlite3.Connection]:
+        """Yield the active transaction connection or a short-lived one."""
+        if self._tx_conn is not None:
+            yield self._tx_conn
+            return
+        conn = self._connect()
+        try:
+            yield conn
+            conn.commit()
+        finally:
+            conn.close()
+
+    @contextmanager
+    def transaction(self) -> Iterator[None]:
+        """Run all writes issued inside the block on one connection and
+        commit them once; nested calls join the outer transaction."""
+        if self._tx_conn is not None:
+            yield
+            return
+        conn = self._connect()
+        # Take the write lock up front so concurrent writers fail fast
+        # instead of deadlocking on a lock upgrade mid-transaction.
+        conn.execute("BEGIN IMMEDIATE")
+        self._tx_conn = conn
+        try:
+            yield
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self._tx_conn = None
+            conn.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        """Open a connection tuned for frequent small commits.
+
+        In WAL mode ``synchronous=NORMAL`` only syncs at checkpoints, so each
+        per-turn commit no longer pays a full fsync while staying crash-safe."""
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
     def _init_database(self) -> None:
         conn = sqlite3.connect(self.db_path)
+        # journal_mode is persistent, so setting it once here covers every
+        # later connection to this database file.
+        conn.execute("PRAGMA journal_mode=WAL")
         cursor = conn.cursor()
         cursor.execute(
             """
@@ -55,8 +105,6 @@ class SQLiteMemoryStore(MemoryStore):
         importance: int = 1,
     ) -> None:
         now = datetime.now().isoformat()
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
         records = []
         for content, mtype in ((user_message, "user"), (ai_response, "ai")):
             embedding = json.dumps(self._embed(content))
@@ -72,26 +120,22 @@ class SQLiteMemoryStore(MemoryStore):
                     embedding,
                 )
             )
-        cursor.executemany(
-            """
-            INSERT INTO memories
-            (user_id, content, message_type, importance, entities, intent, timestamp, embedding)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            """,
-            records,
-        )
-        conn.commit()
-        conn.close()
+        with self._connection() as conn:
+            conn.executemany(
+                """
+                INSERT INTO memories
+                (user_id, content, message_type, importance, entities, intent, timestamp, embedding)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                records,
+            )
 
     def get_stats(self, user_id: str) -> Dict:
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute(
-            "SELECT COUNT(*) FROM memories WHERE user_id = ?",
-            (user_id,),
-        )
-        total_long_term = cursor.fetchone()[0]
-        conn.close()
+        with self._connection() as conn:
+            total_long_term = conn.execute(
+                "SELECT COUNT(*) FROM memories WHERE user_id = ?",
+                (user_id,),
+            ).fetchone()[0]
         return {"total_long_term": total_long_term}
 
     # Retrieval -----------------------------------------------------------------
@@ -118,16 +162,14 @@ class SQLiteMemoryStore(MemoryStore):
         return dot / (na * nb)
 
     def search_memories(self, user_id: str, query: str, top_k: int = 5) -> List[Dict]:
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute(
-            """
-            SELECT content, embedding, message_type, importance, entities, intent, timestamp 
-            FROM memories WHERE user_id = ?
-            """,
-            (user_id,),
-        )
-        rows = cursor.fetchall()
+        with self._connection() as conn:
+            rows = conn.execute(
+                """
+                SELECT content, embedding, message_type, importance, entities, intent, timestamp 
+                FROM memories WHERE user_id = ?
+                """,
+                (user_id,),
+            ).fetchall()
         query_vec = self._embed(query)
         results: List[Dict] = []
         
@@ -169,7 +211,6 @@ class SQLiteMemoryStore(MemoryStore):
                     "score": pair['score']
                 })
         
-        conn.close()
         results.sort(key=lambda x: x["score"], reverse=True)
         return results[:top_k]
 
@@ -179,13 +220,10 @@ class SQLiteMemoryStore(MemoryStore):
 
         Returns the number of rows deleted.
         """
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute(
-            "DELETE FROM memories WHERE user_id = ? AND content LIKE ?",
-            (user_id, pattern),
-        )
-        deleted = cursor.rowcount or 0
-        conn.commit()
-        conn.close()
+        with self._connection() as conn:
+            cursor = conn.execute(
+                "DELETE FROM memories WHERE user_id = ? AND content LIKE ?",
+                (user_id, pattern),
+            )
+            deleted = cursor.rowcount or 0
         return deleted
@@ -0,0 +1,22 @@
+#!/usr/bin/env python3
+"""Tests for the global DashScope client cache."""
+
+import pytest
+
+pytest.importorskip("requests")
+
+from configs.dashscope_client import get_global_client, reset_global_client
+
+
+def test_global_client_cached_for_dict_kwargs():
+    reset_global_client()
+    context = {"patient_name": "张三", "allergies": ["青霉素"]}
+    try:
+        client = get_global_client(api_key="test-key", patient_context=context)
+        same = get_global_client(api_key="test-key", patient_context=dict(context))
+        other = get_global_client(api_key="test-key", patient_context={"patient_name": "李四"})
+    finally:
+        reset_global_client()
+
+    assert client is same
+    assert other is not client
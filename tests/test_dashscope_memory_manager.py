@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""Tests for DashScopeMemoryManager dialogue context budgeting."""
+
+import pytest
+
+pytest.importorskip("requests")
+
+from src.core import dashscope_memory_manager as dmm
+
+
+def _last_chat_prompt(calls):
+    # 摘要请求在后台线程发出，可能排在对话请求之后
+    return [c for c in calls if not c[0]["content"].startswith("请简要总结")][-1]
+
+
+def _context_tokens(prompt):
+    return sum(len(m["content"]) for m in prompt[1:-1] if m["role"] != "system")
+
+
+def _manager(tmp_path, monkeypatch, summary):
+    monkeypatch.setenv("DASHSCOPE_API_KEY", "test-key")
+    monkeypatch.setattr(dmm, "CONTEXT_TOKEN_BUDGET", 40)
+    mgr = dmm.DashScopeMemoryManager("ctx_user", db_path=str(tmp_path / "memory.db"))
+    calls = []
+
+    def fake_api(messages, max_tokens=1000, fallback=True):
+        calls.append(messages)
+        if max_tokens == dmm.SUMMARY_MAX_TOKENS:
+            return summary
+        return "回复" * 5
+
+    monkeypatch.setattr(mgr, "_call_dashscope_api", fake_api)
+    monkeypatch.setattr(mgr, "_get_embedding", lambda text: None)
+    return mgr, calls
+
+
+def test_oldest_turns_summarized_over_budget(tmp_path, monkeypatch):
+    mgr, calls = _manager(tmp_path, monkeypatch, summary="患者有糖尿病")
+    for i in range(3):
+        mgr.process_message(f"第{i}轮问题内容")
+    assert mgr._pending_summary is not None
+
+    mgr.process_message("第3轮问题内容")
+    prompt = _last_chat_prompt(calls)
+    assert prompt[1] == {"role": "system", "content": "此前对话摘要：患者有糖尿病"}
+    assert all("第0轮" not in m["content"] for m in prompt[2:])
+    assert _context_tokens(prompt) <= dmm.CONTEXT_TOKEN_BUDGET
+
+
+def test_failed_summary_drops_oldest_turns_to_budget(tmp_path, monkeypatch):
+    mgr, calls = _manager(tmp_path, monkeypatch, summary=None)
+    for i in range(8):
+        mgr.process_message(f"第{i}轮问题内容")
+        assert _context_tokens(_last_chat_prompt(calls)) <= dmm.CONTEXT_TOKEN_BUDGET
+
+    summary_calls = [c for c in calls if c[0]["content"].startswith("请简要总结")]
+    assert len(summary_calls) < 8
+    assert mgr.history_summary == ""
+    assert mgr.context_turns[-1]["user_message"] == "第7轮问题内容"
+
+
+def test_clear_session_resets_context(tmp_path, monkeypatch):
+    mgr, calls = _manager(tmp_path, monkeypatch, summary="摘要")
+    for i in range(4):
+        mgr.process_message(f"第{i}轮问题内容")
+    mgr.clear_session()
+
+    assert mgr.context_turns == []
+    assert mgr.history_summary == ""
+    assert mgr._context_tokens == 0
+    assert mgr._pending_summary is None
+
+    mgr.process_message("新会话问题")
+    assert [m["role"] for m in _last_chat_prompt(calls)] == ["system", "user"]
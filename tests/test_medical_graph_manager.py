@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""Tests for MedicalGraphManager read paths and caching."""
+
+from src.core.medical_graph_manager import (
+    DiseaseEntity,
+    DiseaseMedicineRelation,
+    DiseaseSymptomRelation,
+    MedicalGraphManager,
+    MedicineEntity,
+    SymptomEntity,
+)
+
+
+def test_cached_reads_invalidated_by_writes(tmp_path):
+    gm = MedicalGraphManager(str(tmp_path / "graph.db"))
+    disease = DiseaseEntity(id="d1", name="2型糖尿病")
+    symptom = SymptomEntity(id="s1", name="头晕")
+    gm.add_disease(disease)
+    gm.add_symptom(symptom)
+
+    assert gm.get_disease_symptom_relations(user_id="u1") == []
+    assert len(gm.get_diabetes_related_data(user_id="u1")["diseases"]) == 1
+
+    gm.add_disease_symptom_relation(DiseaseSymptomRelation(
+        id="r1", disease_id="d1", symptom_id="s1", relation_type="causes",
+        source="online_consultation", confidence=0.8, user_id="u1",
+    ))
+    relations = gm.get_disease_symptom_relations(user_id="u1")
+    assert [r["symptom_name"] for r in relations] == ["头晕"]
+
+    # 修改返回值不影响缓存
+    relations.clear()
+    assert len(gm.get_disease_symptom_relations(user_id="u1")) == 1
+
+
+def test_disease_symptom_relations_mask(tmp_path):
+    gm = MedicalGraphManager(str(tmp_path / "graph.db"))
+    gm.add_disease(DiseaseEntity(id="d1", name="2型糖尿病"))
+    gm.add_disease(DiseaseEntity(id="d2", name="感冒"))
+    gm.add_symptom(SymptomEntity(id="s1", name="头晕"))
+    for rel_id, disease_id, confidence in (("r1", "d1", 0.9), ("r2", "d2", 0.4)):
+        gm.add_disease_symptom_relation(DiseaseSymptomRelation(
+            id=rel_id, disease_id=disease_id, symptom_id="s1", confidence=confidence, user_id="u1",
+        ))
+
+    relations = gm.get_disease_symptom_relations(user_id="u1")
+    mask = gm.get_disease_symptom_relations_mask("糖尿病", user_id="u1")
+    assert [bool(hit) for hit in mask] == ["糖尿病" in r["disease_name"] for r in relations]
+    assert int(sum(mask)) == 1
+
+
+def test_invalidate_cache_sees_raw_writes(tmp_path):
+    gm = MedicalGraphManager(str(tmp_path / "graph.db"))
+    gm.add_disease(DiseaseEntity(id="d1", name="2型糖尿病"))
+    assert len(gm.get_diabetes_related_data(user_id="u1")["diseases"]) == 1
+
+    with gm._connect() as conn:
+        conn.execute("DELETE FROM diseases WHERE id = 'd1'")
+    assert len(gm.get_diabetes_related_data(user_id="u1")["diseases"]) == 1
+
+    gm.invalidate_cache()
+    assert gm.get_diabetes_related_data(user_id="u1")["diseases"] == []
+
+
+def test_graph_snapshot_matches_individual_queries(tmp_path):
+    gm = MedicalGraphManager(str(tmp_path / "graph.db"))
+    gm.add_disease(DiseaseEntity(id="d1", name="2型糖尿病"))
+    gm.add_disease(DiseaseEntity(id="d2", name="感冒"))
+    gm.add_symptom(SymptomEntity(id="s1", name="头晕"))
+    gm.add_medicine(MedicineEntity(id="m1", name="胰岛素"))
+    for rel_id, disease_id, confidence in (("r1", "d1", 0.9), ("r2", "d2", 0.4)):
+        gm.add_disease_symptom_relation(DiseaseSymptomRelation(
+            id=rel_id, disease_id=disease_id, symptom_id="s1", confidence=confidence, user_id="u1",
+        ))
+    gm.add_disease_medicine_relation(DiseaseMedicineRelation(
+        id="x1", disease_id="d1", medicine_id="m1", user_id="u1", side_effects=["低血糖"],
+    ))
+
+    snapshot = gm.get_graph_snapshot(user_id="u1")
+
+    assert snapshot["disease_symptom_relations"] == gm.get_disease_symptom_relations(user_id="u1")
+    assert snapshot["disease_medicine_relations"] == gm.get_disease_medicine_relations(user_id="u1")
+    assert snapshot["diabetes"] == gm.get_diabetes_related_data(user_id="u1")
+
+
+def test_remove_diabetes_graph_data_deletes_in_one_transaction(tmp_path):
+    gm = MedicalGraphManager(str(tmp_path / "graph.db"))
+    gm.add_disease(DiseaseEntity(id="d1", name="2型糖尿病"))
+    gm.add_disease(DiseaseEntity(id="d2", name="感冒"))
+    gm.add_symptom(SymptomEntity(id="s1", name="头晕"))
+    gm.add_medicine(MedicineEntity(id="m1", name="胰岛素"))
+    gm.add_disease_symptom_relation(DiseaseSymptomRelation(id="r1", disease_id="d1", symptom_id="s1", user_id="u1"))
+    gm.add_disease_medicine_relation(DiseaseMedicineRelation(id="x1", disease_id="d1", medicine_id="m1", user_id="u1"))
+
+    result = gm.remove_diabetes_related_graph_data(user_id="u1")
+
+    assert result["success"]
+    assert (result["removed_diseases"], result["removed_medicines"]) == (1, 1)
+    assert (result["removed_disease_symptom_relations"], result["removed_disease_medicine_relations"]) == (1, 1)
+    assert gm.get_graph_snapshot(user_id="u1")["diabetes"] == {
+        kind: [] for kind in ("diseases", "symptoms", "medicines",
+                              "disease_symptom_relations", "disease_medicine_relations")
+    }
+
+    # 在外层事务中调用时并入外层事务
+    with gm.transaction():
+        assert gm.remove_diabetes_related_graph_data()["success"]
+
+
+def test_remove_diabetes_graph_data_in_small_batches(tmp_path):
+    gm = MedicalGraphManager(str(tmp_path / "graph.db"))
+    for i in range(5):
+        gm.add_disease(DiseaseEntity(id=f"d{i}", name=f"糖尿病{i}"))
+    gm.add_disease(DiseaseEntity(id="other", name="感冒"))
+
+    result = gm.remove_diabetes_related_graph_data(batch_size=2)
+
+    assert result["success"]
+    assert result["removed_diseases"] == 5
+    assert gm.get_graph_snapshot()["diabetes"]["diseases"] == []
+
+
+def test_diabetes_flag_maintained_on_write_and_backfilled(tmp_path):
+    db_path = str(tmp_path / "graph.db")
+    gm = MedicalGraphManager(db_path)
+    gm.add_disease(DiseaseEntity(id="d1", name="2型糖尿病"))
+    gm.add_disease(DiseaseEntity(id="d2", name="感冒"))
+    gm.add_medicine(MedicineEntity(id="m1", name="Insulin"))
+    with gm._connect() as conn:
+        flags = dict(conn.execute("SELECT id, is_diabetes_related FROM diseases").fetchall())
+        assert flags == {"d1": 1, "d2": 0}
+        # 改名后重新判定
+        conn.execute("UPDATE diseases SET name = '糖尿病肾病' WHERE id = 'd2'")
+        # 模拟旧库：去掉标记列后重新打开，应补列并回填
+        conn.execute("DROP INDEX idx_medicines_diabetes")
+        conn.execute("DROP TRIGGER trg_medicines_diabetes_ai")
+        conn.execute("DROP TRIGGER trg_medicines_diabetes_au")
+        conn.execute("ALTER TABLE medicines DROP COLUMN is_diabetes_related")
+    gm.invalidate_cache()
+    assert [d["id"] for d in gm.get_diabetes_related_data()["diseases"]] == ["d1", "d2"]
+
+    reopened = MedicalGraphManager(db_path)
+    assert [m["id"] for m in reopened.get_diabetes_related_data()["medicines"]] == ["m1"]
+
+
+def test_disease_medicine_relations_cached_until_write(tmp_path):
+    gm = MedicalGraphManager(str(tmp_path / "graph.db"))
+    gm.add_disease(DiseaseEntity(id="d1", name="2型糖尿病"))
+    gm.add_medicine(MedicineEntity(id="m1", name="二甲双胍"))
+    assert gm.get_disease_medicine_relations(user_id="u1") == []
+
+    gm.add_disease_medicine_relation(DiseaseMedicineRelation(
+        id="r1", disease_id="d1", medicine_id="m1", user_id="u1",
+    ))
+    relations = gm.get_disease_medicine_relations(user_id="u1")
+    assert [r["medicine_name"] for r in relations] == ["二甲双胍"]
+
+    # 缓存命中时返回副本
+    relations.clear()
+    assert len(gm.get_disease_medicine_relations(user_id="u1")) == 1
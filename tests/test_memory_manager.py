@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""Tests for SimpleMemoryManager short-term memory bookkeeping."""
+
+from src.core.memory_manager import (
+    SimpleMemoryIntegratedAI,
+    SimpleMemoryManager,
+    any_diabetes_related,
+    diabetes_flags,
+    is_diabetes_related,
+)
+from src.storage import SQLiteMemoryStore
+
+
+def _manager(tmp_path):
+    store = SQLiteMemoryStore(str(tmp_path / "memory.db"))
+    return SimpleMemoryManager("tag_user", store=store)
+
+
+def test_diabetes_tag_assigned_from_disease_entities(tmp_path):
+    mgr = _manager(tmp_path)
+    mgr.add_conversation("我有糖尿病", "好的", {"DISEASE": [["2型糖尿病", 0, 5]]})
+    mgr.add_conversation("我感冒了", "多休息", {"DISEASE": [["感冒", 0, 2]]})
+    mgr.add_conversation("你好", "你好")
+
+    tags = [mem["tags"] for mem in mgr.short_term_memory]
+    assert tags == [{"diabetes"}, set(), set()]
+
+
+def test_transaction_commits_long_term_writes_once(tmp_path):
+    mgr = _manager(tmp_path)
+    other = SQLiteMemoryStore(mgr.store.db_path)
+
+    with mgr.transaction():
+        mgr.add_conversation("我对青霉素过敏", "已记录", importance=3)
+        mgr.add_conversation("我有高血压", "已记录", importance=3)
+        # 事务提交前，其他连接看不到未提交的写入
+        assert other.get_stats("tag_user")["total_long_term"] == 0
+        assert mgr.get_memory_stats()["total_long_term"] == 4
+
+    assert other.get_stats("tag_user")["total_long_term"] == 4
+
+
+def test_add_conversations_bulk_persists_all_records(tmp_path):
+    mgr = _manager(tmp_path)
+
+    results = mgr.add_conversations_bulk([
+        ("我对青霉素过敏", "已记录", None, "allergy_notification", 4),
+        ("我有糖尿病家族史", "已记录", None, "family_history_consult", 4),
+    ])
+
+    assert results == [True, True]
+    assert len(mgr.short_term_memory) == 2
+    assert mgr.get_memory_stats()["total_long_term"] == 4
+
+
+def test_is_diabetes_related_checks_messages_and_entities():
+    assert is_diabetes_related({"user_message": "最近血糖偏高", "ai_response": ""})
+    assert is_diabetes_related({"user_message": "你好", "ai_response": "好", "entities": {"MEDICINE": (("胰岛素", 0, 3),)}})
+    assert not is_diabetes_related({"user_message": "我感冒了", "ai_response": "多休息", "entities": {"DISEASE": [["感冒", 0, 2]]}})
+    # 关键词不应跨字段拼接匹配
+    assert not is_diabetes_related({"user_message": "糖", "ai_response": "尿病"})
+
+
+def test_remove_diabetes_related_memories_filters_in_one_pass(tmp_path):
+    mgr = _manager(tmp_path)
+    mgr.add_conversation("我有糖尿病家族史", "建议查血糖", {"FAMILY_HISTORY": [["糖尿病家族史", 0, 6]]})
+    mgr.add_conversation("我感冒了", "多休息", {"DISEASE": [["感冒", 0, 2]]})
+    mgr.add_conversation("需要注意什么", "注意饮食", {"MEDICINE": [["胰岛素", 0, 3]]})
+    mgr.working_memory["note"] = "血糖偏高"
+
+    result = mgr.remove_diabetes_related_memories()
+
+    assert result["removed_short_term"] == 2
+    assert [mem["user_message"] for mem in mgr.short_term_memory] == ["我感冒了"]
+    assert "note" not in mgr.working_memory
+    assert result["removed_working_keys"] == 1
+
+
+def test_diabetes_flag_recorded_on_insert(tmp_path):
+    mgr = _manager(tmp_path)
+    mgr.add_conversation("最近总是口渴", "建议查血糖")
+    mgr.add_conversation("我感冒了", "多休息")
+    assert [mem["diabetes_related"] for mem in mgr.short_term_memory] == [True, False]
+
+    # 未经 add_conversation 追加的条目仍按内容判定
+    mgr.short_term_memory.append({"user_message": "胰岛素怎么用", "ai_response": ""})
+    assert mgr.remove_diabetes_related_memories()["removed_short_term"] == 2
+
+
+def test_add_conversations_bulk_accepts_keyword_records(tmp_path):
+    mgr = _manager(tmp_path)
+    results = mgr.add_conversations_bulk([
+        {"user_message": "我的血糖偏高", "ai_response": "建议复查", "intent": "consult", "importance": 4},
+        ("我感冒了", "多休息"),
+    ])
+    assert results == [True, True]
+    assert [mem["intent"] for mem in mgr.short_term_memory] == ["consult", None]
+    # 只有重要性 >= 3 的第一条写入长期记忆（用户与回复各一行）
+    assert mgr.get_memory_stats()["total_long_term"] == 2
+
+
+def test_any_diabetes_related_prescans_unflagged_memories():
+    assert not any_diabetes_related([])
+    assert not any_diabetes_related([{"user_message": "我感冒了", "ai_response": "多休息"}, {"diabetes_related": False}])
+    assert any_diabetes_related([{"user_message": "我感冒了"}, {"user_message": "", "entities": {"DISEASE": [["糖尿病", 0, 3]]}}])
+    assert any_diabetes_related([{"diabetes_related": True, "user_message": "你好"}])
+
+
+def test_diabetes_flags_matches_per_item_classification():
+    memories = [{"user_message": "我感冒了"}, {"user_message": "血糖偏高"}, {"diabetes_related": False}]
+    assert diabetes_flags(memories) == [False, True, False]
+    assert diabetes_flags(iter(memories[:1])) == [False]
+
+
+def test_add_conversation_normalizes_text_fields(tmp_path):
+    mgr = _manager(tmp_path)
+    assert mgr.add_conversation("我最近睡眠不好", None)
+    memory = mgr.short_term_memory[-1]
+    assert memory["user_message"] == "我最近睡眠不好"
+    assert memory["ai_response"] == ""
+
+
+def test_sqlite_store_uses_wal_journal(tmp_path):
+    mgr = _manager(tmp_path)
+    mgr.add_conversation("我对青霉素过敏", "已记录", importance=3)
+    with mgr.store._connection() as conn:
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        assert conn.execute("PRAGMA synchronous").fetchone()[0] == 1  # NORMAL
+    assert mgr.get_memory_stats()["total_long_term"] == 2
+
+
+def test_short_term_memory_evicts_oldest_at_capacity(tmp_path):
+    store = SQLiteMemoryStore(str(tmp_path / "memory.db"))
+    mgr = SimpleMemoryManager("capacity_user", store=store, short_term_capacity=2)
+    for message in ("第一条", "第二条", "第三条"):
+        mgr.add_conversation(message, "好的")
+    assert [mem["user_message"] for mem in mgr.short_term_memory] == ["第二条", "第三条"]
+
+
+def test_precompiled_intent_and_entity_patterns():
+    ai = SimpleMemoryIntegratedAI()
+    assert ai._detect_intent("布洛芬怎么吃") == "PRESCRIPTION_INQUIRY"
+    assert ai._detect_intent("救命，胸痛") == "EMERGENCY"
+    assert ai._detect_intent("你好") == "NORMAL_CONSULTATION"
+
+    entities = ai._recognize_entities("我叫李明，今年45岁，对青霉素过敏")
+    assert entities["PERSON"] == [("李明", 2, 4)]
+    assert entities["AGE"][0][0] == "45岁"
+    assert [e[0] for e in entities["ALLERGY"]] == ["过敏", "青霉素过敏"]
+    assert "DISEASE" not in entities
+
+
+def test_process_messages_matches_sequential_processing(tmp_path):
+    ai = SimpleMemoryIntegratedAI()
+    store = SQLiteMemoryStore(str(tmp_path / "memory.db"))
+    ai.user_memories["batch_user"] = SimpleMemoryManager("batch_user", store=store)
+    results = ai.process_messages(["我叫李四", "我对阿司匹林过敏", "救命，胸痛"], "batch_user")
+    assert [r["success"] for r in results] == [True, True, True]
+    assert results[2]["intent"]["detected"] == "EMERGENCY"
+    # 后面的消息能检索到同一批次中先写入的记忆
+    assert results[1]["memory_info"]["retrieved"] >= 1
+    assert ai.get_stats("batch_user")["total_long_term"] >= 1
+
+
+def test_add_conversation_without_persist_skips_long_term(tmp_path):
+    mgr = _manager(tmp_path)
+    mgr.add_conversation("我对青霉素过敏", "已记录", importance=4, persist=False)
+    assert mgr.short_term_memory[-1]["user_message"] == "我对青霉素过敏"
+    assert mgr.get_memory_stats()["total_long_term"] == 0
+
+
+def test_add_conversation_accepts_list_shaped_entities(tmp_path):
+    mgr = _manager(tmp_path)
+    assert mgr.add_conversation("我头晕", "注意休息", {"SYMPTOM": [["头晕", 1, 3]]}, importance=4)
+    assert mgr.working_memory["SYMPTOM"] == {"头晕"}
+    assert mgr.get_memory_stats()["total_long_term"] == 2